@@ -0,0 +1,296 @@
+"""
+Scaling microbenchmarks for the helpers and the dispatch path
+
+    python -m benchmarks.micro run [--files 10,100,1000,10000] [--large-mb 256] [--output FILE]
+    python -m benchmarks.micro compare BASELINE CURRENT [--threshold 0.25]
+    python -m benchmarks.micro run --compare BASELINE
+
+Synthetic directories with a growing number of files (and optionally a few
+large files) are generated in a scratch directory; get_reference_files, a
+warm ReferenceCache, format_reference_files, Settings.get_extension_settings and
+NewFileHandler._is_empty_file_with_supported_extension are timed against them
+and their memory peaks recorded with tracemalloc. Results are written as JSON
+so a later run can be compared against a baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Any, List, Callable
+
+from config.settings import Settings
+from utils.helpers import get_reference_files, format_reference_files
+from core.prefetch import ReferenceCache
+
+# Extensions of the synthetic files (only .md files are reference files)
+EXTENSIONS = [".md", ".py", ".txt", ".bin"]
+
+def make_directory(root: str, files: int, large_mb: int = 0, seed: int = 0) -> str:
+    """
+    Create a synthetic directory
+
+    Args:
+        root: Scratch directory the synthetic directory is created in
+        files: Number of small files (0 to 2 KB, mixed extensions, some empty)
+        large_mb: Size of the largest file in MB; if set, large .md files of
+                  large_mb, large_mb / 4 and large_mb / 16 MB are added
+        seed: Random seed, so runs are comparable
+
+    Returns:
+        Path to the directory
+    """
+    directory = os.path.join(root, f"files-{files}-{large_mb}mb")
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    line = "lorem ipsum dolor sit amet, consectetur adipiscing elit\n"
+
+    for index in range(files):
+        extension = EXTENSIONS[index % len(EXTENSIONS)]
+        size = 0 if index % 10 == 0 else rng.randint(1, 2048)
+        with open(os.path.join(directory, f"file{index:06d}{extension}"), "w", encoding="utf-8") as f:
+            f.write((line * (size // len(line) + 1))[:size])
+
+    if large_mb:
+        chunk = line * (1024 * 1024 // len(line))
+        for divisor in (1, 4, 16):
+            with open(os.path.join(directory, f"large{divisor:02d}.md"), "w", encoding="utf-8") as f:
+                for _ in range(max(1, large_mb // divisor)):
+                    f.write(chunk)
+
+    return directory
+
+def measure(function: Callable[[], Any], repeat: int = 5, min_time: float = 0.05) -> Dict[str, Any]:
+    """
+    Time a function and record its memory peak
+
+    Args:
+        function: Function to benchmark
+        repeat: Number of timed samples
+        min_time: Minimum duration of a sample; fast functions are looped
+
+    Returns:
+        Dictionary with the median and best seconds per call, and the peak traced memory in bytes
+    """
+    # Calibrate the number of calls per sample
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            function()
+        samples.append((time.perf_counter() - started) / loops)
+
+    # Memory is measured separately so tracing does not skew the timings
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": statistics.median(samples),
+        "best_seconds": min(samples),
+        "loops": loops,
+        "peak_bytes": peak
+    }
+
+class _IdleProcessor:
+    """Processor stand-in for constructing a NewFileHandler without generating anything"""
+
+    def submit(self, file_path: str):
+        """Ignore submissions"""
+
+    def submit_many(self, file_paths: List[str]):
+        """Ignore bulk submissions"""
+
+    def file_changed(self, file_path: str):
+        """Ignore changes"""
+
+    def prefetch(self, file_path: str):
+        """Ignore prefetch hints"""
+
+def run(file_counts: List[int], large_mb: int = 0, config_path: str = "config/config.json",
+        repeat: int = 5, scratch: str = None) -> Dict[str, Any]:
+    """
+    Run the benchmark suite
+
+    Args:
+        file_counts: Directory sizes to benchmark
+        large_mb: Size of the largest file in MB (0 to skip large files)
+        config_path: Path to the configuration file
+        repeat: Number of timed samples per benchmark
+        scratch: Scratch directory (temporary and removed afterwards if not given)
+
+    Returns:
+        Dictionary with run metadata and results keyed by benchmark name
+    """
+    from core.monitor import NewFileHandler
+
+    settings = Settings(config_path)
+    root = scratch or tempfile.mkdtemp(prefix="newfiles-bench-")
+    os.makedirs(root, exist_ok=True)
+    results = {}
+
+    # Extension lookups do not depend on the directory
+    for extension in (".md", "txt", ".unknown"):
+        results[f"get_extension_settings[{extension}]"] = measure(
+            lambda: settings.get_extension_settings(extension), repeat
+        )
+
+    handler = NewFileHandler(settings, _IdleProcessor())
+    try:
+        cases = [(count, 0) for count in file_counts]
+        if large_mb:
+            cases.append((max(file_counts), large_mb))
+
+        for count, size in cases:
+            label = f"n={count}" + (f",large={size}mb" if size else "")
+            directory = make_directory(root, count, size)
+            print(f"Benchmarking {label}", file=sys.stderr)
+
+            results[f"get_reference_files[{label}]"] = measure(
+                lambda: get_reference_files(directory, ".md", "new.md"), repeat
+            )
+            cache = ReferenceCache()
+            results[f"reference_cache[{label}]"] = measure(
+                lambda: cache.get(directory, ".md", "new.md"), repeat
+            )
+            del cache
+            references = get_reference_files(directory, ".md", "new.md")
+            results[f"format_reference_files[{label}]"] = measure(
+                lambda: format_reference_files(references), repeat
+            )
+            del references
+
+            empty_file = os.path.join(directory, "file000000.md")
+            results[f"is_empty_file_with_supported_extension[{label}]"] = measure(
+                lambda: handler._is_empty_file_with_supported_extension(empty_file), repeat
+            )
+    finally:
+        handler.stop()
+        if scratch is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "file_counts": file_counts,
+            "large_mb": large_mb
+        },
+        "results": results
+    }
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    Compare two benchmark runs
+
+    Args:
+        baseline: Results of the reference run
+        current: Results of the new run
+        threshold: Relative slowdown or memory growth flagged as a regression (0.25 = 25%)
+
+    Returns:
+        One entry per benchmark present in both runs, with time and memory ratios and a regression flag
+    """
+    rows = []
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        time_ratio = new["seconds"] / old["seconds"] if old["seconds"] else None
+        memory_ratio = new["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else None
+        rows.append({
+            "name": name,
+            "time_ratio": time_ratio,
+            "memory_ratio": memory_ratio,
+            "regression": bool(
+                (time_ratio and time_ratio > 1 + threshold) or
+                (memory_ratio and memory_ratio > 1 + threshold)
+            )
+        })
+    return rows
+
+def format_comparison(rows: List[Dict[str, Any]]) -> str:
+    """Format a comparison as a text table"""
+    lines = [f"{'Benchmark':<60} {'time':>8} {'memory':>8}"]
+    for row in rows:
+        time_ratio = f"{row['time_ratio']:.2f}x" if row["time_ratio"] is not None else "n/a"
+        memory_ratio = f"{row['memory_ratio']:.2f}x" if row["memory_ratio"] is not None else "n/a"
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['name']:<60} {time_ratio:>8} {memory_ratio:>8}{flag}")
+    return "\n".join(lines)
+
+def format_results(report: Dict[str, Any]) -> str:
+    """Format benchmark results as a text table"""
+    lines = [f"{'Benchmark':<60} {'median':>12} {'peak memory':>14}"]
+    for name, result in report["results"].items():
+        lines.append(f"{name:<60} {result['seconds'] * 1000:>10.3f}ms {result['peak_bytes'] / 1024:>11.1f}KiB")
+    return "\n".join(lines)
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Newfiles scaling microbenchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--files", default="10,100,1000,10000",
+                            help="Comma-separated directory sizes (up to 100000)")
+    run_parser.add_argument("--large-mb", type=int, default=0,
+                            help="Add large files up to this size in MB to the largest directory")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Timed samples per benchmark")
+    run_parser.add_argument("--config", default="config/config.json", help="Path to configuration file")
+    run_parser.add_argument("--scratch", help="Scratch directory (temporary if not given)")
+    run_parser.add_argument("--output", help="Write the results as JSON to this file")
+    run_parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    run_parser.add_argument("--threshold", type=float, default=0.25, help="Regression threshold (0.25 = 25%%)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline", help="Baseline JSON file")
+    compare_parser.add_argument("current", help="Current JSON file")
+    compare_parser.add_argument("--threshold", type=float, default=0.25, help="Regression threshold (0.25 = 25%%)")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        file_counts = [int(count) for count in args.files.split(",") if count]
+        current = run(file_counts, args.large_mb, args.config, args.repeat, args.scratch)
+        print(format_results(current))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(current, f, indent=2)
+        baseline_file = args.compare
+    else:
+        with open(args.current, "r", encoding="utf-8") as f:
+            current = json.load(f)
+        baseline_file = args.baseline
+
+    if baseline_file:
+        with open(baseline_file, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        print(format_comparison(rows))
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
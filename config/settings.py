@@ -2,6 +2,13 @@ import json
 import os
 from typing import Dict, Any
 
+# Extensions generated as images; every other extension is generated as text
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Models used when an extension does not name one
+DEFAULT_TEXT_MODEL = "gpt-4.1-nano"
+DEFAULT_IMAGE_MODEL = "gpt-image-1"
+
 class Settings:
     """Configuration settings for the Newfiles application"""
     
@@ -18,6 +25,10 @@ class Settings:
         with open(self.config_path, 'r') as f:
             return json.load(f)
     
+    def reload(self):
+        """Re-read the configuration file in place, so everything holding this object sees the change"""
+        self._settings = self._load_config()
+    
     @property
     def monitored_directory(self) -> str:
         """Get the directory to monitor"""
@@ -48,6 +59,182 @@ class Settings:
         """Get extension-specific settings"""
         return self._settings.get("extension_settings", {})
     
+    @property
+    def max_workers(self) -> int:
+        """Get the number of worker threads used to process files"""
+        return self._settings.get("max_workers", 4)
+    
+    @property
+    def pools(self) -> Dict[str, Dict[str, Any]]:
+        """Get the worker pool settings per job class"""
+        pools = {
+            "text": {"workers": self.max_workers, "rate": None, "burst": 1},
+            "image": {"workers": 2, "rate": None, "burst": 1}
+        }
+        for name, options in self._settings.get("pools", {}).items():
+            pools.setdefault(name, {"workers": 2, "rate": None, "burst": 1}).update(options)
+        return pools
+    
+    @property
+    def api_server(self) -> Dict[str, Any]:
+        """Get the local API server settings"""
+        defaults = {
+            "enabled": False,
+            "host": "127.0.0.1",
+            "port": 8765,
+            "unix_socket": None,
+            "restrict_to_monitored_directory": True,
+            "token": None,
+            "models": []
+        }
+        defaults.update(self._settings.get("api_server", {}))
+        return defaults
+    
+    @property
+    def circuit_breaker(self) -> Dict[str, Any]:
+        """Get the circuit breaker and offline parking settings"""
+        defaults = {
+            "failure_threshold": 5,
+            "reset_timeout": 30.0,
+            "drain_rate": 2.0
+        }
+        defaults.update(self._settings.get("circuit_breaker", {}))
+        return defaults
+    
+    @property
+    def logging(self) -> Dict[str, Any]:
+        """Get the logging settings"""
+        defaults = {
+            "file": "logs/newfiles.log",
+            "level": "INFO",
+            "max_bytes": 5 * 1024 * 1024,
+            "backup_count": 5,
+            "rotate_when": None,
+            "json": False
+        }
+        defaults.update(self._settings.get("logging", {}))
+        return defaults
+    
+    @property
+    def fairness(self) -> Dict[str, Any]:
+        """Get the per-directory scheduling settings"""
+        defaults = {
+            "key": "directory",
+            "depth": 1,
+            "max_in_flight_per_key": None
+        }
+        defaults.update(self._settings.get("fairness", {}))
+        return defaults
+    
+    @property
+    def watch(self) -> Dict[str, Any]:
+        """Get the watch strategy settings"""
+        defaults = {
+            "strategy": "native",
+            "max_native_watches": 64,
+            "sweep_interval": 30.0,
+            "ignore_directories": [".git", "node_modules", "__pycache__"],
+            "placeholder_names": ["New * Document*", "New * File*", "New File*", "Untitled*"]
+        }
+        defaults.update(self._settings.get("watch", {}))
+        return defaults
+    
+    @property
+    def event_storm(self) -> Dict[str, Any]:
+        """Get the event-storm detection settings"""
+        defaults = {
+            "enabled": True,
+            "threshold": 100,
+            "window": 2.0,
+            "settle": 2.0
+        }
+        defaults.update(self._settings.get("event_storm", {}))
+        return defaults
+    
+    @property
+    def default_backend(self) -> str:
+        """Get the name of the backend used by extensions without a "backend" setting"""
+        return self._settings.get("default_backend", "openai")
+    
+    @property
+    def backends(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the generation backends by name, with their capability flags
+        
+        The hosted API ("openai") is always available. Backends with a base_url
+        (local OpenAI-compatible servers) and stub backends default to no batch
+        support, and local servers to no image support.
+        """
+        backends = {"openai": {}}
+        backends.update(self._settings.get("backends", {}))
+        
+        resolved = {}
+        for name, options in backends.items():
+            backend_type = options.get("type", "openai")
+            hosted = backend_type == "openai" and not options.get("base_url")
+            defaults = {
+                "type": backend_type,
+                "base_url": None,
+                "api_key_env": "OPENAI_API_KEY",
+                "streaming": True,
+                "images": hosted or backend_type == "stub",
+                "batch": hosted
+            }
+            defaults.update(options)
+            resolved[name] = defaults
+        return resolved
+    
+    @property
+    def prefetch(self) -> Dict[str, Any]:
+        """Get the settings for preparing a directory when a file is created in it"""
+        defaults = {
+            "enabled": True,
+            "min_interval": 5.0,
+            "reference_cache_directories": 64,
+            "warm_connection": True,
+            "connection_interval": 60.0
+        }
+        defaults.update(self._settings.get("prefetch", {}))
+        return defaults
+    
+    @property
+    def grouping(self) -> Dict[str, Any]:
+        """Get the settings for generating sibling files created together in one request"""
+        defaults = {
+            "enabled": False,
+            "window": 0.5,
+            "max_files": 4,
+            "max_tokens": 4000,
+            "prompt_file": "prompts/group_text.md"
+        }
+        defaults.update(self._settings.get("grouping", {}))
+        return defaults
+    
+    @property
+    def batch(self) -> Dict[str, Any]:
+        """Get the batch engine settings"""
+        defaults = {
+            "enabled": False,
+            "backend": "openai",
+            "min_jobs": 20,
+            "max_requests": 5000,
+            "poll_interval": 30.0,
+            "directory": "data/batches"
+        }
+        defaults.update(self._settings.get("batch", {}))
+        return defaults
+    
+    @property
+    def history(self) -> Dict[str, Any]:
+        """Get the generation history settings"""
+        defaults = {
+            "enabled": True,
+            "path": "data/history.sqlite3",
+            "max_per_name": 5
+        }
+        defaults.update(self._settings.get("history", {}))
+        return defaults
+    
     def get_extension_settings(self, extension: str) -> Dict[str, str]:
         """Get settings for a specific file extension"""
         # Remove the dot if present
@@ -55,6 +242,6 @@ class Settings:
             extension = extension[1:]
         
         return self.extension_settings.get(extension, {
-            "model": "gpt-4.1-nano",
+            "model": DEFAULT_TEXT_MODEL,
             "prompt_file": self.default_text_prompt_file
         })
@@ -0,0 +1,134 @@
+"""
+Generation backends
+
+A backend is a named entry of the "backends" settings: the hosted OpenAI API,
+a local OpenAI-compatible inference server reached through its base_url, or
+the stub backend, which answers instantly without any network access. Each
+backend declares which capabilities it has (streaming, images, batch) and
+extensions pick one with their "backend" setting.
+"""
+
+import base64
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Dict, Any, List
+
+from core.breaker import CircuitBreaker
+
+# Capabilities a backend can declare
+CAPABILITIES = ("streaming", "images", "batch")
+
+# A 1x1 transparent PNG returned by the stub backend's images API
+_STUB_PNG = base64.b64encode(
+    bytes.fromhex(
+        "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+        "0000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082"
+    )
+).decode("ascii")
+
+def create_generator(name: str, options: Dict[str, Any], breaker_settings: Dict[str, Any]):
+    """
+    Create the content generator of a backend
+
+    Args:
+        name: Backend name
+        options: Backend settings (type, base_url, api_key_env and capability flags)
+        breaker_settings: Circuit breaker settings; every backend gets its own breaker
+
+    Returns:
+        A ContentGenerator bound to the backend
+    """
+    from core.generator import ContentGenerator
+    return ContentGenerator(CircuitBreaker.from_settings(breaker_settings), backend=options, name=name)
+
+def create_client(options: Dict[str, Any], api_key: str):
+    """
+    Create the API client of a backend
+
+    Args:
+        options: Backend settings
+        api_key: API key sent to the backend
+
+    Returns:
+        An OpenAI client (pointed at base_url if set) or a StubClient
+    """
+    if options["type"] == "stub":
+        return StubClient(options)
+
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=options.get("base_url"))
+
+class _StubStream:
+    """Chunks of a stub completion, shaped like an OpenAI stream"""
+
+    def __init__(self, text: str, usage: SimpleNamespace, latency: float):
+        self._words = text.split(" ")
+        self._usage = usage
+        self._latency = latency
+        self._closed = False
+
+    def __iter__(self):
+        for index, word in enumerate(self._words):
+            if self._closed:
+                raise ConnectionError("Stream closed")
+            if self._latency:
+                time.sleep(self._latency / len(self._words))
+            delta = SimpleNamespace(content=word if index == 0 else " " + word)
+            last = index == len(self._words) - 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason="stop" if last else None)],
+                                  usage=None)
+        yield SimpleNamespace(choices=[], usage=self._usage)
+
+    def close(self):
+        """Abort the stream"""
+        self._closed = True
+
+class StubClient:
+    """
+    Client of the stub backend
+
+    Implements the parts of the OpenAI client the pipeline uses (chat
+    completions, streaming, images and model listing) and answers with fixed
+    content after an optional simulated latency.
+    """
+
+    def __init__(self, options: Dict[str, Any]):
+        """
+        Initialize the client
+
+        Args:
+            options: Backend settings; "text" is the generated content and "latency" the simulated delay in seconds
+        """
+        self.text = options.get("text") or "Generated by the stub backend."
+        self.latency = options.get("latency", 0.0)
+        # Recent requests, so tests can inspect what was sent
+        self.requests = deque(maxlen=100)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.images = SimpleNamespace(generate=self._generate_image)
+        self.models = SimpleNamespace(list=self._list_models)
+
+    def _create_completion(self, model: str, messages: List[Dict[str, Any]], stream: bool = False, **kwargs):
+        """Answer a chat completion request"""
+        self.requests.append({"model": model, "messages": messages, **kwargs})
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=max(1, len(self.text) // 4),
+                                prompt_tokens_details=None)
+        if stream:
+            return _StubStream(self.text, usage, self.latency)
+
+        if self.latency:
+            time.sleep(self.latency)
+        message = SimpleNamespace(content=self.text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+    def _generate_image(self, model: str, prompt: str, **kwargs):
+        """Answer an image request with a 1x1 PNG"""
+        self.requests.append({"model": model, "prompt": prompt, **kwargs})
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(data=[SimpleNamespace(b64_json=_STUB_PNG, url=None)])
+
+    def _list_models(self, **kwargs):
+        """List the stub model"""
+        return SimpleNamespace(data=[SimpleNamespace(id="stub")])
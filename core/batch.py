@@ -0,0 +1,437 @@
+"""
+Batch engine for large backfills
+
+Text jobs nobody is waiting on are written to a JSONL file of chat completion
+requests, submitted through the provider's batch interface and polled until
+the results are ready; each result is mapped back to its file by custom id and
+written in bulk. An in-process stand-in backend answers batch files with
+placeholder text for testing.
+
+    python -m core.batch backfill <directory> [--inprocess] [--config CONFIG]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, Any, List, Callable, Optional
+
+from utils.logger import default_logger, job_log_context
+from config.settings import DEFAULT_TEXT_MODEL
+from core.jobs import Job
+
+class OpenAIBatchBackend:
+    """Submits batch files through the OpenAI files and batches API"""
+
+    name = "openai"
+    # Batches live at the provider, so they can be resumed after a restart
+    resumable = True
+    # Results are real generations and go into the history
+    placeholder = False
+    # Polled at the configured interval
+    poll_interval = None
+
+    def __init__(self, client_factory: Callable[[], Any], completion_window: str = "24h"):
+        """
+        Initialize the backend
+
+        Args:
+            client_factory: Function returning the OpenAI client
+            completion_window: Completion window requested for each batch
+        """
+        self.client_factory = client_factory
+        self.completion_window = completion_window
+
+    def submit(self, input_path: str) -> str:
+        """Upload a JSONL request file and create a batch, returning its id"""
+        client = self.client_factory()
+        with open(input_path, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        """Get the status and output file ids of a batch"""
+        batch = self.client_factory().batches.retrieve(batch_id)
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id
+        }
+
+    def download(self, file_id: str) -> str:
+        """Get the content of a batch output file"""
+        return self.client_factory().files.content(file_id).text
+
+class InProcessBatchBackend:
+    """
+    Stand-in for the provider's batch interface
+
+    Batches are processed in a background thread after a simulated delay; each
+    request is answered by a responder function (placeholder text by default).
+    """
+
+    name = "inprocess"
+    # Batches only exist in memory and are lost when the process exits
+    resumable = False
+    # Results are placeholder text, which must never be replayed into real files
+    placeholder = True
+
+    def __init__(self, responder: Callable[[Dict[str, Any]], str] = None, delay: float = 1.0):
+        """
+        Initialize the stand-in
+
+        Args:
+            responder: Function returning the content for a request body
+            delay: Simulated time before a batch completes, in seconds
+        """
+        self.responder = responder or (lambda body: f"Batch content for {body['model']}")
+        self.delay = delay
+        # Batches finish after the simulated delay, so there is no point in polling slower
+        self.poll_interval = delay
+        self._batches = {}
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def submit(self, input_path: str) -> str:
+        """Read a JSONL request file and start processing it"""
+        with open(input_path, "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+
+        batch_id = f"batch_inprocess_{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._batches[batch_id] = {"status": "in_progress", "output_file_id": None, "error_file_id": None}
+        threading.Thread(target=self._process, args=(batch_id, requests), daemon=True).start()
+        return batch_id
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        """Get the status and output file ids of a batch"""
+        with self._lock:
+            return dict(self._batches[batch_id])
+
+    def download(self, file_id: str) -> str:
+        """Get the content of an output file"""
+        with self._lock:
+            return self._files[file_id]
+
+    def _process(self, batch_id: str, requests: List[Dict[str, Any]]):
+        """Answer every request of a batch"""
+        time.sleep(self.delay)
+        lines = []
+        for request in requests:
+            try:
+                content = self.responder(request["body"])
+                response = {
+                    "status_code": 200,
+                    "body": {
+                        "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                    }
+                }
+                error = None
+            except Exception as e:
+                response = None
+                error = {"message": str(e)}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "response": response, "error": error}))
+
+        file_id = f"file_inprocess_{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._files[file_id] = "\n".join(lines) + "\n"
+            self._batches[batch_id] = {"status": "completed", "output_file_id": file_id, "error_file_id": None}
+
+class BatchEngine:
+    """Turns queued text jobs into provider batches and writes their results"""
+
+    FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, processor, backend=None):
+        """
+        Initialize the engine and resume batches left by a previous run
+
+        Args:
+            processor: FileProcessor the jobs belong to
+            backend: Batch backend (chosen from the "batch" settings if not given)
+        """
+        self.processor = processor
+        self.settings = processor.settings
+        self.options = self.settings.batch
+        if backend is None:
+            if self.options["backend"] == "inprocess":
+                backend = InProcessBatchBackend()
+            else:
+                backend = OpenAIBatchBackend(lambda: processor.generator.client)
+        self.backend = backend
+        self.poll_interval = self.options["poll_interval"]
+        if getattr(backend, "poll_interval", None):
+            self.poll_interval = min(self.poll_interval, backend.poll_interval)
+        self.directory = self.options["directory"]
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._pending = []
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+        self._resume()
+        self._thread = threading.Thread(target=self._run, name="newfiles-batch", daemon=True)
+        self._thread.start()
+
+    def submit(self, jobs: List[Job]):
+        """
+        Queue jobs for the next batch
+
+        Args:
+            jobs: Text jobs to generate in bulk
+        """
+        with self._lock:
+            self._pending.extend(jobs)
+        self._wake.set()
+
+    @property
+    def pending_count(self) -> int:
+        """Get the number of jobs waiting for or inside a batch"""
+        with self._lock:
+            return len(self._pending) + sum(len(batch["jobs"]) for batch in self._batches.values())
+
+    def stop(self):
+        """Stop submitting and polling (running batches are resumed on the next start)"""
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+
+    def _run(self):
+        """Submit pending jobs and poll running batches"""
+        while not self._stopping.is_set():
+            with self._lock:
+                jobs = self._pending[:self.options["max_requests"]]
+                del self._pending[:len(jobs)]
+            if jobs:
+                try:
+                    self._submit_batch(jobs)
+                except Exception as e:
+                    default_logger.error(f"Error submitting batch of {len(jobs)} jobs: {str(e)}")
+                    for job in jobs:
+                        self.processor.finish_batch_job(job, None, error=f"Batch submission failed: {str(e)}")
+
+            for batch_id in list(self._batches):
+                try:
+                    self._poll(batch_id)
+                except Exception as e:
+                    default_logger.error(f"Error polling batch {batch_id}: {str(e)}")
+
+            with self._lock:
+                more = bool(self._pending)
+            if not more:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _submit_batch(self, jobs: List[Job]):
+        """
+        Write a JSONL request file for jobs and submit it
+
+        Args:
+            jobs: Jobs to include
+        """
+        input_path = os.path.join(self.directory, f"requests-{uuid.uuid4().hex[:12]}.jsonl")
+        entries = {}
+        with open(input_path, "w", encoding="utf-8") as f:
+            for job in jobs:
+                body = self._request_body(job)
+                f.write(json.dumps({
+                    "custom_id": job.id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body
+                }) + "\n")
+                entries[job.id] = {"path": job.file_path, "model": body["model"], "identity": job.identity}
+
+        batch_id = self.backend.submit(input_path)
+        for job in jobs:
+            self.processor.jobs.update(job, Job.RUNNING)
+            job.current_stage = "batch"
+
+        with open(self._manifest_path(batch_id), "w", encoding="utf-8") as f:
+            json.dump({"batch_id": batch_id, "backend": self.backend.name, "created_at": time.time(),
+                       "input": input_path, "jobs": entries}, f)
+        with self._lock:
+            self._batches[batch_id] = {"jobs": {job.id: job for job in jobs}, "entries": entries, "input": input_path}
+        default_logger.info(f"Submitted batch {batch_id} with {len(jobs)} requests")
+
+    def _request_body(self, job: Job) -> Dict[str, Any]:
+        """Build the chat completion request of a text job"""
+        filename = os.path.basename(job.file_path)
+        extension = os.path.splitext(filename)[1].lower()
+        ext_settings = self.settings.get_extension_settings(extension)
+        prompt_file = job.prompt_file or ext_settings.get("prompt_file", self.settings.default_text_prompt_file)
+
+        reference_files = None
+        if "dynamic" in prompt_file.lower() or "dynamic" in filename.lower():
+            reference_files = self.processor.references.get(os.path.dirname(job.file_path), extension, filename)
+
+        model = job.model or (ext_settings.get("models") or [ext_settings.get("model", DEFAULT_TEXT_MODEL)])[0]
+        max_tokens = ext_settings.get("max_tokens") or self.processor.token_budget.choose(extension, reference_files)
+        return self.processor.generator.build_text_request(filename, prompt_file, reference_files, model, max_tokens)
+
+    def _poll(self, batch_id: str):
+        """
+        Check a batch and write its results once it finished
+
+        Args:
+            batch_id: Id of the batch
+        """
+        status = self.backend.status(batch_id)
+        if status["status"] not in self.FINAL_STATUSES:
+            return
+
+        # A download or parse error leaves the batch in place, so the next poll tries again
+        results = {}
+        for file_id in (status.get("output_file_id"), status.get("error_file_id")):
+            if file_id:
+                for line in self.backend.download(file_id).splitlines():
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result["custom_id"]] = result
+
+        with self._lock:
+            batch = self._batches.pop(batch_id)
+
+        for custom_id, job in batch["jobs"].items():
+            model = batch["entries"][custom_id]["model"]
+            result = results.get(custom_id)
+            with job_log_context(job.id):
+                if result is None:
+                    self.processor.finish_batch_job(job, model, error=f"Batch {status['status']} without a result")
+                elif result.get("error") or (result.get("response") or {}).get("status_code") != 200:
+                    error = result.get("error") or (result.get("response") or {}).get("body")
+                    self.processor.finish_batch_job(job, model, error=f"Batch request failed: {error}")
+                else:
+                    body = result["response"]["body"]
+                    job.record_usage(_usage(body.get("usage")))
+                    job.requests += 1
+                    choice = body["choices"][0]
+                    job.truncated = choice.get("finish_reason") == "length"
+                    content = (choice["message"].get("content") or "").strip()
+                    self.processor.finish_batch_job(job, model, content=content,
+                                                    record=not self.backend.placeholder)
+
+        os.remove(self._manifest_path(batch_id))
+        if os.path.exists(batch["input"]):
+            os.remove(batch["input"])
+        default_logger.info(f"Batch {batch_id} {status['status']}: wrote results for {len(results)} of "
+                            f"{len(batch['jobs'])} requests")
+
+    def _manifest_path(self, batch_id: str) -> str:
+        """Get the path of the manifest describing a running batch"""
+        return os.path.join(self.directory, f"{batch_id}.json")
+
+    def _resume(self):
+        """
+        Recreate the jobs of batches that were still running when the last run stopped
+
+        Manifests of another backend are left for a run that uses it, and those
+        of a backend whose batches do not survive a restart are removed; the
+        files of their jobs stay empty for a later backfill.
+        """
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                default_logger.error(f"Error reading batch manifest {name}: {str(e)}")
+                continue
+
+            batch_id = manifest["batch_id"]
+            backend = manifest.get("backend") or ("inprocess" if batch_id.startswith("batch_inprocess_") else "openai")
+            if backend != self.backend.name:
+                default_logger.info(f"Not resuming batch {batch_id}, it belongs to the {backend} batch backend")
+                continue
+            if not self.backend.resumable:
+                default_logger.warning(f"Dropping batch {batch_id}, {backend} batches do not survive a restart")
+                os.remove(os.path.join(self.directory, name))
+                if os.path.exists(manifest["input"]):
+                    os.remove(manifest["input"])
+                continue
+
+            jobs = {}
+            for custom_id, entry in manifest["jobs"].items():
+                job = self.processor.track_batch_job(entry["path"], entry.get("identity"))
+                jobs[custom_id] = job
+            self._batches[batch_id] = {"jobs": jobs, "entries": manifest["jobs"], "input": manifest["input"]}
+            default_logger.info(f"Resumed batch {batch_id} with {len(jobs)} requests")
+
+def _usage(usage: Optional[Dict[str, Any]]) -> Optional[SimpleNamespace]:
+    """Convert a usage dictionary from a batch result to the attribute form used by Job.record_usage"""
+    if not usage:
+        return None
+    details = usage.get("prompt_tokens_details") or {}
+    return SimpleNamespace(
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        prompt_tokens_details=SimpleNamespace(cached_tokens=details.get("cached_tokens", 0))
+    )
+
+def backfill(directory: str, config_path: str = "config/config.json", inprocess: bool = False) -> int:
+    """
+    Generate content for every empty supported text file under a directory in batches
+
+    Args:
+        directory: Directory to scan recursively
+        config_path: Path to the configuration file
+        inprocess: Use the in-process stand-in backend instead of the provider
+
+    Returns:
+        Number of files queued
+    """
+    from config.settings import Settings
+    from core.backends import create_generator
+    from core.processor import FileProcessor
+
+    settings = Settings(config_path)
+    # The engine resumes the batches of its backend when it is built, so the backend is chosen first
+    batch = dict(settings.batch, enabled=True)
+    generator = None
+    if inprocess:
+        batch["backend"] = "inprocess"
+        # Requests are only rendered, never sent, so no API key or client is needed
+        generator = create_generator("stub", {"type": "stub", "batch": True}, settings.circuit_breaker)
+    settings._settings["batch"] = batch
+    processor = FileProcessor(settings, generator=generator)
+
+    supported = {f".{extension}" for extension in settings.extension_settings}
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() in supported and os.path.getsize(path) == 0:
+                paths.append(os.path.abspath(path))
+
+    jobs = processor.submit_many(paths, source="backfill", force_batch=True)
+    default_logger.info(f"Backfill queued {len(jobs)} files from {directory}")
+    try:
+        for job in jobs:
+            while processor.jobs.wait(job.id, 60.0) is not None and not job.finished:
+                pass
+    finally:
+        processor.shutdown()
+    return len(jobs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Newfiles batch backfill")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Generate content for empty files in batches")
+    backfill_parser.add_argument("directory", help="Directory to scan")
+    backfill_parser.add_argument("--config", default="config/config.json", help="Path to configuration file")
+    backfill_parser.add_argument("--inprocess", action="store_true", help="Use the in-process stand-in backend")
+    args = parser.parse_args()
+
+    backfill(args.directory, args.config, args.inprocess)
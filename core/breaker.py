@@ -0,0 +1,86 @@
+import threading
+import time
+from typing import Dict, Any
+
+class ServiceUnavailableError(Exception):
+    """Raised when the generation service cannot be reached"""
+
+class CircuitOpenError(ServiceUnavailableError):
+    """Raised instead of calling the service while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to the generation service
+
+    After a number of consecutive failures the breaker opens and requests fail
+    fast. Once the reset timeout expires a single probe request is let through
+    (half-open); its outcome closes the breaker again or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the breaker
+
+        Args:
+            failure_threshold: Consecutive failures needed to open the breaker
+            reset_timeout: Seconds to wait before probing an open breaker
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, config: Dict[str, Any]) -> "CircuitBreaker":
+        """Create a breaker from the circuit_breaker settings"""
+        return cls(config["failure_threshold"], config["reset_timeout"])
+
+    @property
+    def state(self) -> str:
+        """Get the current state"""
+        with self._lock:
+            return self._state
+
+    def ready(self) -> bool:
+        """Check if a request would be let through, without claiming the probe"""
+        with self._lock:
+            if self._state == CircuitBreaker.CLOSED:
+                return True
+            if self._state == CircuitBreaker.OPEN:
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            return False
+
+    def allow_request(self) -> bool:
+        """
+        Check if a request may be sent, claiming the probe slot when half-opening
+
+        Returns:
+            True if the request may be sent
+        """
+        with self._lock:
+            if self._state == CircuitBreaker.CLOSED:
+                return True
+            if self._state == CircuitBreaker.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = CircuitBreaker.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        """Record a request that reached the service"""
+        with self._lock:
+            self._state = CircuitBreaker.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        """Record a request that failed because the service was unavailable"""
+        with self._lock:
+            self._failures += 1
+            if self._state == CircuitBreaker.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = CircuitBreaker.OPEN
+                self._opened_at = time.monotonic()
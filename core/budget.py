@@ -0,0 +1,79 @@
+import math
+import threading
+from collections import deque, defaultdict
+from typing import List, Dict, Any
+
+from core.metrics import percentile
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text without a tokenizer
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate token count (about four characters per token)
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / 4)
+
+class TokenBudget:
+    """Chooses max_tokens per request from the output sizes seen for each extension"""
+
+    def __init__(self, default_tokens: int = 1000, min_tokens: int = 256, max_tokens: int = 4096,
+                 headroom: float = 1.3, history: int = 50):
+        """
+        Initialize the budget
+
+        Args:
+            default_tokens: Budget used before anything is known about an extension
+            min_tokens: Lower bound for the budget
+            max_tokens: Upper bound for the budget
+            headroom: Multiplier applied to the expected output size
+            history: Number of recent outputs remembered per extension
+        """
+        self.default_tokens = default_tokens
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.headroom = headroom
+        self._sizes = defaultdict(lambda: deque(maxlen=history))
+        self._lock = threading.Lock()
+
+    def choose(self, extension: str, reference_files: List[Dict[str, Any]] = None) -> int:
+        """
+        Pick max_tokens for a request
+
+        Args:
+            extension: File extension
+            reference_files: Reference files of the same extension, used as a size hint
+
+        Returns:
+            Output token budget
+        """
+        with self._lock:
+            sizes = list(self._sizes.get(extension, ()))
+
+        expected = percentile(sizes, 0.9) if sizes else None
+
+        # Files of the same kind in the same folder are a good size hint
+        if reference_files:
+            reference_sizes = [estimate_tokens(f["content"]) for f in reference_files]
+            reference_expected = sum(reference_sizes) / len(reference_sizes)
+            expected = max(expected or 0, reference_expected)
+
+        if not expected:
+            return self.default_tokens
+        return int(min(self.max_tokens, max(self.min_tokens, expected * self.headroom)))
+
+    def record(self, extension: str, output_tokens: int):
+        """
+        Remember the size of a generated output
+
+        Args:
+            extension: File extension
+            output_tokens: Size of the complete output in tokens
+        """
+        with self._lock:
+            self._sizes[extension].append(output_tokens)
@@ -0,0 +1,209 @@
+import os
+import threading
+from typing import Dict, Any, List
+
+from utils.logger import default_logger
+from config.settings import Settings
+from core.processor import FileProcessor
+from core.monitor import FileMonitor
+
+class Engine:
+    """
+    Long-lived Newfiles engine shared by the CLI, the service and the GUI
+
+    Owns the observer, the worker pools, the OpenAI client and the caches.
+    Pausing only removes the directory watch and reconfiguring reloads the
+    settings in place, so warm connections, the generation history and the
+    metrics survive every Stop/Start of a front end.
+    """
+
+    STOPPED = "stopped"
+    RUNNING = "running"
+    PAUSED = "paused"
+
+    def __init__(self, settings: Settings, profiler=None, api: bool = None, overrides: Dict[str, Any] = None):
+        """
+        Build the engine (nothing is watched or started yet)
+
+        Args:
+            settings: Settings shared by every component
+            profiler: Optional JobProfiler attached to the processor
+            api: Whether to run the local job API server (None to follow the config)
+            overrides: Settings that take precedence over the config file, kept across reloads
+        """
+        self.settings = settings
+        self.profiler = profiler
+        self.overrides = dict(overrides or {})
+        self._apply_overrides()
+        self.processor = FileProcessor(settings)
+        self.processor.profiler = profiler
+        self.monitor = FileMonitor(settings, self.processor)
+        self.api_server = None
+        self._api = api
+        self.state = self.STOPPED
+        self._started = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._reports = []
+
+    def start(self):
+        """
+        Start watching the monitored directory (resumes a paused engine)
+
+        Raises:
+            FileNotFoundError: If the monitored directory does not exist
+        """
+        with self._lock:
+            if self.state == self.RUNNING:
+                return
+            if self.state == self.PAUSED:
+                self._check_directory()
+                self.monitor.resume()
+                self.state = self.RUNNING
+                return
+            if self._started:
+                raise RuntimeError("A stopped engine cannot be restarted")
+
+            self._check_directory()
+            if self.profiler:
+                self.profiler.start()
+            if self._api or (self._api is None and self.settings.api_server["enabled"]):
+                from core.server import ApiServer
+                self.api_server = ApiServer(self.settings, self.processor)
+                self.api_server.start()
+
+            # Start watching, then create the API client in the background
+            self.monitor.start(blocking=False)
+            self.processor.generator.warm_up()
+            self._started = True
+            self.state = self.RUNNING
+            default_logger.info("Newfiles engine started")
+
+    def pause(self):
+        """Stop watching for new files; queued and running jobs still finish"""
+        with self._lock:
+            if self.state == self.RUNNING:
+                self.monitor.pause()
+                self.state = self.PAUSED
+
+    def resume(self):
+        """Watch for new files again after a pause"""
+        self.start()
+
+    def reconfigure(self, overrides: Dict[str, Any] = None):
+        """
+        Reload the configuration file without rebuilding the engine
+
+        The new settings are validated first; if anything is raised, the engine
+        keeps running on the previous configuration.
+
+        Args:
+            overrides: Additional settings that take precedence over the config file
+
+        Raises:
+            FileNotFoundError: If the configuration file or the new monitored directory does not exist
+            ValueError: If the configuration file is invalid or names an unknown backend
+        """
+        with self._lock:
+            previous = (self.settings.monitored_directory, self.settings.monitor_subdirectories)
+            previous_settings, previous_overrides = self.settings._settings, dict(self.overrides)
+            self.settings.reload()
+            self.overrides.update(overrides or {})
+            self._apply_overrides()
+            try:
+                self._validate()
+                self.processor.reconfigure()
+                # The handler caches the delay and storm settings, so it is replaced even if the watch is unchanged
+                self.monitor.reschedule()
+            except Exception:
+                self.settings._settings = previous_settings
+                self.overrides = previous_overrides
+                raise
+
+            if previous != (self.settings.monitored_directory, self.settings.monitor_subdirectories):
+                default_logger.info(f"Reconfigured, monitoring: {self.settings.monitored_directory}")
+            else:
+                default_logger.info("Reconfigured")
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until the engine is stopped
+
+        Args:
+            timeout: Maximum number of seconds to wait (None to wait indefinitely)
+
+        Returns:
+            True if the engine was stopped
+
+        Raises:
+            KeyboardInterrupt: On Ctrl+C; the caller stops the engine and reports its results
+        """
+        if timeout is not None:
+            return self._stopped.wait(timeout)
+        # Waiting in slices keeps Ctrl+C responsive on Windows
+        while not self._stopped.wait(1):
+            pass
+        return True
+
+    def stop(self, wait: bool = True) -> List[str]:
+        """
+        Stop watching and release every resource
+
+        Args:
+            wait: Whether to finish the queued jobs before returning
+
+        Returns:
+            Paths of the profile reports written, if a profiler is attached (the same on every call)
+        """
+        with self._lock:
+            if self._stopped.is_set():
+                return self._reports
+            self.monitor.stop()
+            if self.api_server:
+                self.api_server.stop()
+            self.processor.shutdown(wait=wait)
+            self._reports = (self.profiler.stop() if self.profiler and self._started else None) or []
+            self.state = self.STOPPED
+            self._stopped.set()
+            default_logger.info("Newfiles engine stopped")
+            return self._reports
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get live statistics
+
+        Returns:
+            Processor statistics with the engine state and monitored directory
+        """
+        stats = self.processor.stats()
+        stats["state"] = self.state
+        stats["monitored_directory"] = self.settings.monitored_directory
+        if self.monitor.hybrid is not None:
+            stats["native_watches"] = self.monitor.hybrid.native_watches
+        return stats
+
+    def _apply_overrides(self):
+        """Put the overrides on top of the loaded configuration"""
+        self.settings._settings.update(self.overrides)
+
+    def _validate(self):
+        """
+        Check reloaded settings before the components are switched to them
+
+        Raises:
+            FileNotFoundError: If the engine is running and the monitored directory does not exist
+            ValueError: If the default backend or an extension's backend is not configured
+        """
+        if self.state == self.RUNNING:
+            self._check_directory()
+        names = {self.settings.default_backend}
+        names.update(options["backend"] for options in self.settings.extension_settings.values()
+                     if options.get("backend"))
+        unknown = sorted(names - set(self.settings.backends))
+        if unknown:
+            raise ValueError(f"Unknown backend: {', '.join(unknown)}")
+
+    def _check_directory(self):
+        """Raise if the monitored directory does not exist"""
+        if not os.path.isdir(self.settings.monitored_directory):
+            raise FileNotFoundError(f"Monitored directory does not exist: {self.settings.monitored_directory}")
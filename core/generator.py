@@ -1,28 +1,284 @@
 import os
+import re
+import json
 import base64
-from typing import Dict, Any
-from openai import OpenAI
-from dotenv import load_dotenv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Callable, List, Tuple
 
 from utils.logger import default_logger
+from config.settings import DEFAULT_TEXT_MODEL, DEFAULT_IMAGE_MODEL
 from utils.helpers import format_reference_files
+from core.jobs import job_stage, CancellationToken, JobCancelledError
+from core.breaker import CircuitBreaker, CircuitOpenError, ServiceUnavailableError
+from core.prefetch import TemplateCache
 
-# Load environment variables
-load_dotenv()
+_environment_loaded = False
+
+# Sizes accepted by the images API for each model
+IMAGE_SIZES = {
+    "gpt-image-1": ["1024x1024", "1536x1024", "1024x1536"],
+    "dall-e-3": ["1024x1024", "1792x1024", "1024x1792"],
+    "dall-e-2": ["256x256", "512x512", "1024x1024"]
+}
+
+def _load_environment():
+    """Load environment variables from .env once (python-dotenv is imported on first use)"""
+    global _environment_loaded
+    if not _environment_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _environment_loaded = True
+
+# Settings of the hosted OpenAI backend, used when no backend is given
+DEFAULT_BACKEND = {
+    "type": "openai",
+    "base_url": None,
+    "api_key_env": "OPENAI_API_KEY",
+    "streaming": True,
+    "images": True,
+    "batch": True
+}
 
 class ContentGenerator:
     """Generates content using OpenAI API based on file extension and prompts"""
     
-    def __init__(self):
-        """Initialize the OpenAI client"""
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables")
+    def __init__(self, breaker: CircuitBreaker = None, backend: Dict[str, Any] = None, name: str = "openai"):
+        """
+        Initialize the generator (the API client is created on first use)
+        
+        Args:
+            breaker: Circuit breaker guarding the API calls
+            backend: Backend settings (type, base_url, api_key_env and capability flags), the hosted API if omitted
+            name: Backend name, used in log messages
+            
+        Raises:
+            ValueError: If the hosted API's key is not set
+        """
+        _load_environment()
+        self.name = name
+        self.backend = dict(DEFAULT_BACKEND, **(backend or {}))
+        api_key_env = self.backend["api_key_env"]
+        self._api_key = os.getenv(api_key_env) if api_key_env else None
+        if not self._api_key:
+            if self.backend["type"] == "openai" and not self.backend["base_url"]:
+                raise ValueError(f"{api_key_env} not found in environment variables")
+            # Local servers and the stub accept any key
+            self._api_key = "local"
+        
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._connected_at = None
+        self.breaker = breaker or CircuitBreaker()
+        self.templates = TemplateCache()
+    
+    @property
+    def client(self):
+        """Get the backend's client, importing openai and creating the client on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from core.backends import create_client
+                    self._client = create_client(self.backend, self._api_key)
+        return self._client
+    
+    def supports(self, capability: str) -> bool:
+        """
+        Check a capability of the backend
+        
+        Args:
+            capability: "streaming", "images" or "batch"
+            
+        Returns:
+            Whether the backend declares the capability
+        """
+        return bool(self.backend.get(capability))
+    
+    @client.setter
+    def client(self, client):
+        """Replace the client (e.g. with a stand-in)"""
+        self._client = client
+    
+    def warm_up(self):
+        """Create the client in a background thread so the first job does not pay for it"""
+        threading.Thread(target=lambda: self.client, name="newfiles-client-warmup", daemon=True).start()
+    
+    def warm_connection(self, interval: float = 60.0):
+        """
+        Open a connection to the API so the next request skips the TCP and TLS handshakes
+        
+        Sends a cheap model list request (no tokens) on the calling thread,
+        at most once per interval; failures are ignored.
+        
+        Args:
+            interval: Minimum number of seconds between two warm-up requests
+        """
+        now = time.monotonic()
+        with self._client_lock:
+            if self._connected_at is not None and now - self._connected_at < interval:
+                return
+            self._connected_at = now
+        try:
+            self.client.models.list(timeout=5)
+        except Exception as e:
+            default_logger.debug(f"Connection warm-up failed: {str(e)}")
+    
+    def _call_api(self, request: Callable, **kwargs) -> Any:
+        """
+        Call the API through the circuit breaker
+        
+        Args:
+            request: Client method to call
+            **kwargs: Arguments for the client method
+            
+        Returns:
+            The API response
+            
+        Raises:
+            CircuitOpenError: If the breaker is open
+            ServiceUnavailableError: If the service could not be reached
+        """
+        from openai import APIConnectionError, InternalServerError
+        
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("API circuit breaker is open")
+        
+        try:
+            response = request(**kwargs)
+        except (APIConnectionError, InternalServerError) as e:
+            self.breaker.record_failure()
+            raise ServiceUnavailableError(str(e)) from e
+        except Exception:
+            # The service answered, so it is reachable
+            self.breaker.record_success()
+            raise
+        
+        self.breaker.record_success()
+        return response
+    
+    def _complete(self, job=None, cancel: CancellationToken = None, **request) -> Tuple[str, str]:
+        """
+        Request a chat completion, streaming it when a job can cancel it and the backend can stream
+        
+        Args:
+            job: Optional job that receives the token usage and whose cancellation aborts the stream
+            cancel: Optional token that also aborts the stream, without cancelling the job (hedged requests)
+            **request: Arguments for chat.completions.create
+            
+        Returns:
+            Tuple of the generated text and the finish reason
+            
+        Raises:
+            JobCancelledError: If the job is cancelled before or during the request
+            ServiceUnavailableError: If the service could not be reached or the stream was interrupted
+        """
+        tokens = [token for token in (job.token if job is not None else None, cancel) if token is not None]
+        
+        def check():
+            """Raise JobCancelledError if the job or the request was cancelled"""
+            for token in tokens:
+                token.check()
+        
+        if job is None or not self.supports("streaming"):
+            check()
+            response = self._call_api(self.client.chat.completions.create, **request)
+            choice = response.choices[0]
+            if job is not None:
+                job.record_usage(getattr(response, "usage", None))
+            # Without a stream the request cannot be aborted, so a cancelled request drops the result
+            check()
+            return choice.message.content or "", choice.finish_reason
+        
+        check()
+        stream = self._call_api(
+            self.client.chat.completions.create,
+            stream=True,
+            stream_options={"include_usage": True},
+            **request
+        )
+        
+        # Closing the stream aborts the HTTP response as soon as the file changes (or the hedge is lost)
+        remove_callbacks = [token.on_cancel(stream.close) for token in tokens]
+        parts = []
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta is not None and choice.delta.content:
+                        parts.append(choice.delta.content)
+                    if choice.finish_reason:
+                        finish_reason = choice.finish_reason
+                if getattr(chunk, "usage", None) is not None:
+                    job.record_usage(chunk.usage)
+        except Exception as e:
+            for token in tokens:
+                if token.cancelled:
+                    raise JobCancelledError(token.reason) from e
+            # A connection lost mid-stream is an outage like a failed request, so the job is parked
+            if isinstance(e, _stream_errors()):
+                self.breaker.record_failure()
+                raise ServiceUnavailableError(f"Stream interrupted: {str(e)}") from e
+            raise
+        finally:
+            for remove_callback in remove_callbacks:
+                remove_callback()
+        
+        check()
+        return "".join(parts), finish_reason
+    
+    def _format_text_prompt(self, filename: str, prompt_file: str, reference_files: list = None) -> str:
+        """
+        Render the text prompt template for a file
         
-        self.client = OpenAI(api_key=api_key)
+        Args:
+            filename: Name of the file being created
+            prompt_file: Path to the prompt file
+            reference_files: List of reference files for dynamic prompts
+            
+        Returns:
+            The rendered prompt
+        """
+        # Read the prompt template (cached until the file changes)
+        prompt_template = self.templates.get(prompt_file)
+        
+        # Format the prompt with filename and reference files
+        reference_content = format_reference_files(reference_files) if reference_files else "No reference files found."
+        
+        return prompt_template.format(
+            filename=filename,
+            reference_files=reference_content
+        )
+    
+    def build_text_request(self, filename: str, prompt_file: str, reference_files: list = None,
+                           model: str = DEFAULT_TEXT_MODEL, max_tokens: int = 1000) -> Dict[str, Any]:
+        """
+        Build the chat completion request body for a text file without sending it
+        
+        Args:
+            filename: Name of the file being created
+            prompt_file: Path to the prompt file
+            reference_files: List of reference files for dynamic prompts
+            model: The model to use for generation
+            max_tokens: Output token limit
+            
+        Returns:
+            Request body for chat.completions.create (used by the batch engine)
+        """
+        return {
+            "model": model,
+            "messages": [
+                {"role": "user", "content": self._format_text_prompt(filename, prompt_file, reference_files)}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7
+        }
     
     def generate_text_content(self, filename: str, extension: str, prompt_file: str, 
-                            reference_files: list = None, model: str = "gpt-4.1-nano") -> str:
+                            reference_files: list = None, model: str = DEFAULT_TEXT_MODEL,
+                            job=None, max_tokens: int = 1000, max_continuations: int = 0,
+                            cancel: CancellationToken = None) -> str:
         """
         Generate text content for a file using OpenAI
         
@@ -32,70 +288,393 @@ class ContentGenerator:
             prompt_file: Path to the prompt file
             reference_files: List of reference files for dynamic prompts
             model: The model to use for generation
+            job: Optional job that receives the token usage
+            max_tokens: Output token limit per request
+            max_continuations: Continuation requests allowed when the output is truncated
+            cancel: Optional token aborting the request without cancelling the job (hedged requests)
             
         Returns:
             Generated text content
+            
+        Raises:
+            ServiceUnavailableError: If the API is unreachable or the circuit breaker is open
         """
         try:
-            # Read the prompt template
-            with open(prompt_file, 'r', encoding='utf-8') as f:
-                prompt_template = f.read()
+            with job_stage(job, "prompt"):
+                prompt = self._format_text_prompt(filename, prompt_file, reference_files)
             
-            # Format the prompt with filename and reference files
-            reference_content = format_reference_files(reference_files) if reference_files else "No reference files found."
+            messages = [
+                {"role": "user", "content": prompt}
+            ]
+            parts = []
+            
+            # Generate content using OpenAI, continuing while the output is cut off
+            with job_stage(job, "api"):
+                for attempt in range(max_continuations + 1):
+                    text, finish_reason = self._complete(
+                        job,
+                        cancel,
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=0.7
+                    )
+                    parts.append(text)
+                    
+                    if job is not None:
+                        job.requests += 1
+                        job.truncated = finish_reason == "length"
+                    
+                    if finish_reason != "length":
+                        break
+                    
+                    if attempt < max_continuations:
+                        default_logger.info(f"Output for {filename} truncated, requesting continuation")
+                        if job is not None:
+                            job.continuations += 1
+                        messages = messages + [
+                            {"role": "assistant", "content": text},
+                            {"role": "user", "content": "Continue exactly where you stopped. "
+                                                        "Output only the continuation, without repeating anything."}
+                        ]
+                    else:
+                        default_logger.warning(f"Output for {filename} is truncated after {attempt + 1} requests")
+            
+            return "".join(parts).strip()
+            
+        except JobCancelledError:
+            # Expected when the file changes, the processor logs the cancellation
+            raise
+        except Exception as e:
+            default_logger.error(f"Error generating text content for {filename}: {str(e)}")
+            raise
+    
+    def generate_group_content(self, filenames: List[str], prompt_file: str, reference_files: list = None,
+                               model: str = DEFAULT_TEXT_MODEL, job=None, max_tokens: int = 4000) -> Dict[str, str]:
+        """
+        Generate the contents of several sibling files with one request
+        
+        Args:
+            filenames: Names of the files being created
+            prompt_file: Path to the group prompt file
+            reference_files: List of reference files from the same folder
+            model: The model to use for generation
+            job: Optional job that receives the token usage and whose cancellation aborts the request
+            max_tokens: Output token limit for all files together
+            
+        Returns:
+            Content per filename; files missing from the response are left out
             
-            prompt = prompt_template.format(
-                filename=filename,
+        Raises:
+            ServiceUnavailableError: If the API is unreachable or the circuit breaker is open
+            ValueError: If the response is truncated or is not a JSON object
+        """
+        with job_stage(job, "prompt"):
+            reference_content = format_reference_files(reference_files) if reference_files else "No reference files found."
+            prompt = self.templates.get(prompt_file).format(
+                filenames="\n".join(f"- {filename}" for filename in filenames),
                 reference_files=reference_content
             )
+        
+        request = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": 0.7
+        }
+        # JSON mode is only guaranteed by the hosted API; other backends rely on the prompt
+        if self.backend["type"] == "openai" and not self.backend["base_url"]:
+            request["response_format"] = {"type": "json_object"}
+        
+        with job_stage(job, "api"):
+            text, finish_reason = self._complete(job, **request)
+        if job is not None:
+            job.requests += 1
+        if finish_reason == "length":
+            raise ValueError(f"Joint output for {len(filenames)} files is truncated")
+        return parse_group_response(text, filenames)
+    
+    def generate_sectioned_content(self, filename: str, extension: str, prompt_file: str,
+                                   reference_files: list = None, model: str = DEFAULT_TEXT_MODEL,
+                                   job=None, options: Dict[str, Any] = None,
+                                   on_prefix: Callable[[str], None] = None) -> str:
+        """
+        Generate a large text file by requesting an outline and then its sections in parallel
+        
+        Args:
+            filename: Name of the file being created
+            extension: File extension
+            prompt_file: Path to the prompt file
+            reference_files: List of reference files for dynamic prompts
+            model: The model to use for generation
+            job: Optional job that receives the token usage
+            options: Section settings (max_sections, outline_max_tokens, section_max_tokens, workers)
+            on_prefix: Called with the stitched content each time the completed prefix grows
             
-            # Generate content using OpenAI
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
+        Returns:
+            Generated text content
+            
+        Raises:
+            ServiceUnavailableError: If the API is unreachable or the circuit breaker is open
+        """
+        options = options or {}
+        max_sections = options.get("max_sections", 6)
+        
+        try:
+            with job_stage(job, "prompt"):
+                prompt = self._format_text_prompt(filename, prompt_file, reference_files)
+            
+            # Ask for a short outline first
+            with job_stage(job, "outline"):
+                outline_text, _ = self._complete(
+                    job,
+                    model=model,
+                    messages=[
+                        {"role": "user", "content": prompt},
+                        {"role": "user", "content": (
+                            f"Before writing, list the top-level sections of this file as a numbered list "
+                            f"with at most {max_sections} items, one short title per line. "
+                            f"Output only the list."
+                        )}
+                    ],
+                    max_tokens=options.get("outline_max_tokens", 300),
+                    temperature=0.3
+                )
+            
+            sections = _parse_outline(outline_text, max_sections)
+            if len(sections) < 2:
+                # Not worth splitting, generate in a single request
+                return self.generate_text_content(filename, extension, prompt_file, reference_files, model, job)
+            
+            outline = "\n".join(f"{index + 1}. {title}" for index, title in enumerate(sections))
+            results = [None] * len(sections)
+            emitted = 0
             
-            return response.choices[0].message.content.strip()
+            # Generate the sections concurrently, stitching completed prefixes in order
+            with job_stage(job, "api"):
+                with ThreadPoolExecutor(max_workers=options.get("workers", 4)) as executor:
+                    futures = {
+                        executor.submit(self._generate_section, prompt, outline, index, title, model,
+                                        options.get("section_max_tokens", 800), job): index
+                        for index, title in enumerate(sections)
+                    }
+                    for future in as_completed(futures):
+                        results[futures[future]] = future.result()
+                        
+                        ready = emitted
+                        while ready < len(results) and results[ready] is not None:
+                            ready += 1
+                        if ready > emitted:
+                            emitted = ready
+                            if on_prefix and emitted < len(results):
+                                on_prefix("\n\n".join(results[:emitted]))
             
+            return "\n\n".join(results)
+            
+        except JobCancelledError:
+            # Expected when the file changes, the processor logs the cancellation
+            raise
         except Exception as e:
-            default_logger.error(f"Error generating text content for {filename}: {str(e)}")
-            return f"Error generating content: {str(e)}"
+            default_logger.error(f"Error generating sectioned content for {filename}: {str(e)}")
+            raise
     
-    def generate_image_content(self, filename: str, prompt_file: str) -> bytes:
+    def _generate_section(self, prompt: str, outline: str, index: int, title: str, model: str,
+                          max_tokens: int, job=None) -> str:
         """
-        Generate image content using OpenAI GPT-Image-1
+        Generate a single section of a sectioned file
+        
+        Args:
+            prompt: The rendered file prompt
+            outline: Numbered outline of the whole file
+            index: Index of the section in the outline
+            title: Title of the section
+            model: The model to use for generation
+            max_tokens: Output token limit for the section
+            job: Optional job that receives the token usage
+            
+        Returns:
+            Generated section content
+        """
+        text, _ = self._complete(
+            job,
+            model=model,
+            messages=[
+                {"role": "user", "content": prompt},
+                {"role": "user", "content": (
+                    f"The file has this outline:\n{outline}\n\n"
+                    f"Write ONLY section {index + 1} ({title}), starting with its heading if the file "
+                    f"format uses headings. Do not write any other section and do not add explanations."
+                )}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.7
+        )
+        
+        return text.strip()
+    
+    def generate_image_content(self, filename: str, prompt_file: str, job=None,
+                               model: str = DEFAULT_IMAGE_MODEL, size: str = "1024x1024",
+                               quality: str = None) -> bytes:
+        """
+        Generate image content using the backend's images API
         
         Args:
             filename: Name of the file being created
             prompt_file: Path to the prompt file
+            job: Optional job used to time the generation stages
+            model: Image model to use
+            size: Image size, e.g. "1024x1024"
+            quality: Optional quality level understood by the model ("low", "high", "hd", ...)
             
         Returns:
             Generated image bytes
+            
+        Raises:
+            ValueError: If the backend has no image support
         """
+        if not self.supports("images"):
+            raise ValueError(f"Backend {self.name} does not support images")
+        
         try:
-            # Read the prompt template
-            with open(prompt_file, 'r', encoding='utf-8') as f:
-                prompt_template = f.read()
-            
-            # Format the prompt with filename
-            prompt = prompt_template.format(filename=filename)
-            
-            # Generate image using GPT-Image-1
-            img = self.client.images.generate(
-                model="gpt-image-1",
-                prompt=prompt,
-                n=1,
-                size="1024x1024"
-            )
+            with job_stage(job, "prompt"):
+                # Read the prompt template (cached until the file changes)
+                prompt_template = self.templates.get(prompt_file)
+                
+                # Format the prompt with filename
+                prompt = prompt_template.format(filename=filename)
+            
+            options = {}
+            if quality:
+                options["quality"] = quality
+            # DALL-E models return URLs unless base64 is requested
+            if model.startswith("dall-e"):
+                options["response_format"] = "b64_json"
+            
+            if job is not None:
+                job.token.check()
+            
+            with job_stage(job, "api"):
+                img = self._call_api(
+                    self.client.images.generate,
+                    model=model,
+                    prompt=prompt,
+                    n=1,
+                    size=size,
+                    **options
+                )
+            
+            # Images cannot be streamed, so a cancelled job drops the result
+            if job is not None:
+                job.token.check()
             
             # Decode the base64 image
             image_bytes = base64.b64decode(img.data[0].b64_json)
             return image_bytes
             
+        except JobCancelledError:
+            # Expected when the file changes, the processor logs the cancellation
+            raise
         except Exception as e:
             default_logger.error(f"Error generating image content for {filename}: {str(e)}")
             raise
+
+def _stream_errors() -> tuple:
+    """Get the errors that end a stream because the connection to the service was lost"""
+    from openai import APIConnectionError, InternalServerError
+    errors = (APIConnectionError, InternalServerError, ConnectionError, TimeoutError)
+    try:
+        # Read errors and timeouts of the HTTP client surface unwrapped while iterating a stream
+        from httpx import TransportError
+    except ImportError:
+        return errors
+    return errors + (TransportError,)
+
+def image_size(model: str, filename: str, default: str = "1024x1024") -> str:
+    """
+    Pick a supported image size, honouring size hints in the filename
+    
+    A name like "icon_256.png" or "banner-1536x1024.png" asks for that size; the
+    smallest size the model supports that covers it is used. Hints are ignored
+    for models whose sizes are unknown (such as a local backend's model), since
+    an arbitrary size would be rejected.
+    
+    Args:
+        model: Image model
+        filename: Name of the file being created
+        default: Size used when the filename has no hint or the model's sizes are unknown
+        
+    Returns:
+        Size string such as "1024x1024"
+    """
+    stem = os.path.splitext(filename)[0]
+    match = re.search(r"(?:^|[_\-. ])(\d{2,4})(?:x(\d{2,4}))?$", stem)
+    if not match:
+        return default
+    
+    width = int(match.group(1))
+    height = int(match.group(2) or width)
+    sizes = IMAGE_SIZES.get(model)
+    if not sizes and model.startswith("gpt-image"):
+        # Newer GPT image models accept the same sizes
+        sizes = IMAGE_SIZES["gpt-image-1"]
+    if not sizes:
+        return default
+    
+    def orientation(w: int, h: int) -> int:
+        return (w > h) - (w < h)
+    
+    # Prefer the same orientation, then sizes covering the hint, then the smallest
+    def preference(size: str):
+        w, h = (int(part) for part in size.split("x"))
+        return (orientation(w, h) != orientation(width, height), w < width or h < height, w * h)
+    
+    return min(sizes, key=preference)
+
+def parse_group_response(text: str, filenames: List[str]) -> Dict[str, str]:
+    """
+    Split a joint response into the contents of its files
+    
+    Args:
+        text: JSON object returned by the model, optionally in a code fence
+        filenames: Names of the requested files
+        
+    Returns:
+        Content per requested filename that the response contains
+        
+    Raises:
+        ValueError: If the response is not a JSON object
+    """
+    text = (text or "").strip()
+    fence = re.match(r"^```[\w-]*\n(.*)\n```$", text, re.DOTALL)
+    if fence:
+        text = fence.group(1)
+    try:
+        contents = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Joint response is not valid JSON: {str(e)}") from e
+    if not isinstance(contents, dict):
+        raise ValueError("Joint response is not a JSON object")
+    
+    return {
+        filename: contents[filename].strip()
+        for filename in filenames
+        if isinstance(contents.get(filename), str)
+    }
+
+def _parse_outline(text: str, max_sections: int) -> list:
+    """
+    Parse a numbered or bulleted outline into section titles
+    
+    Args:
+        text: Outline returned by the model
+        max_sections: Maximum number of sections to keep
+        
+    Returns:
+        List of section titles
+    """
+    sections = []
+    for line in (text or "").splitlines():
+        title = re.sub(r"^\s*(?:\d+[.)]|[-*#]+)\s*", "", line).strip()
+        if title:
+            sections.append(title)
+    return sections[:max_sections]
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional
+
+class GenerationHistory:
+    """
+    SQLite store of previous generations
+
+    Every generated text file is recorded with its name, model, prompt hash,
+    compressed content and timings, so recurring filenames (LICENSE.md,
+    requirements.txt, setup.py, ...) can be replayed without calling the API.
+    """
+
+    def __init__(self, path: str, max_per_name: int = 5):
+        """
+        Open (and create if needed) the history database
+
+        Args:
+            path: Path to the SQLite database file
+            max_per_name: Number of generations kept for each filename
+        """
+        self.path = path
+        self.max_per_name = max_per_name
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                name TEXT NOT NULL,
+                extension TEXT NOT NULL,
+                model TEXT,
+                prompt_hash TEXT,
+                content BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                duration REAL,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                replays INTEGER DEFAULT 0
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS generations_name ON generations (name)")
+        self._connection.commit()
+
+    @staticmethod
+    def prompt_hash(prompt_file: str, model: str = None) -> Optional[str]:
+        """
+        Hash a prompt template and model so replays can prefer matching generations
+
+        Args:
+            prompt_file: Path to the prompt template
+            model: Model the prompt is sent to
+
+        Returns:
+            Hex digest, or None if the prompt file cannot be read
+        """
+        try:
+            with open(prompt_file, "rb") as f:
+                template = f.read()
+        except OSError:
+            return None
+        digest = hashlib.sha256(template)
+        digest.update((model or "").encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def record(self, file_path: str, content: str, model: str = None, prompt_hash: str = None,
+               duration: float = None, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """
+        Store a generation
+
+        Args:
+            file_path: Path of the generated file
+            content: Generated content
+            model: Model that produced the content
+            prompt_hash: Hash of the prompt template and model
+            duration: Generation time in seconds
+            prompt_tokens: Prompt tokens consumed
+            completion_tokens: Completion tokens consumed
+        """
+        name = os.path.basename(file_path)
+        extension = os.path.splitext(name)[1].lower()
+        data = content.encode("utf-8")
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO generations (path, name, extension, model, prompt_hash, content, size, "
+                "created_at, duration, prompt_tokens, completion_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_path, name, extension, model, prompt_hash, zlib.compress(data), len(data),
+                 time.time(), duration, prompt_tokens, completion_tokens)
+            )
+            # Keep only the most recent generations for this name
+            self._connection.execute(
+                "DELETE FROM generations WHERE name = ? AND id NOT IN "
+                "(SELECT id FROM generations WHERE name = ? ORDER BY id DESC LIMIT ?)",
+                (name, name, self.max_per_name)
+            )
+            self._connection.commit()
+
+    def best(self, name: str, prompt_hash: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the best previous generation for an exact filename
+
+        Generations made with the same prompt and model are preferred, then the
+        most recent one wins.
+
+        Args:
+            name: Filename to match exactly
+            prompt_hash: Hash of the current prompt template and model
+
+        Returns:
+            Dictionary with the generation's id, model and content, or None
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, model, content FROM generations WHERE name = ? AND size > 0 "
+                "ORDER BY (prompt_hash IS ?) DESC, id DESC LIMIT 1",
+                (name, prompt_hash)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE generations SET replays = replays + 1 WHERE id = ?", (row[0],))
+            self._connection.commit()
+
+        return {"id": row[0], "model": row[1], "content": zlib.decompress(row[2]).decode("utf-8")}
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,386 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from utils.events import default_bus
+
+class JobCancelledError(Exception):
+    """Raised when a job is cancelled because its file changed or disappeared"""
+
+class CancellationToken:
+    """Thread-safe flag telling a job to stop, with callbacks to abort in-flight requests"""
+
+    def __init__(self):
+        """Initialize an active token"""
+        self.reason = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        """Check if the token was cancelled"""
+        return self._event.is_set()
+
+    def cancel(self, reason: str):
+        """
+        Cancel the token and run the abort callbacks
+
+        Args:
+            reason: Why the job is cancelled
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Register a callback run on cancellation (immediately if already cancelled)
+
+        Args:
+            callback: Function aborting an in-flight operation
+
+        Returns:
+            Function removing the callback again
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def check(self):
+        """Raise JobCancelledError if the token was cancelled"""
+        if self._event.is_set():
+            raise JobCancelledError(self.reason)
+
+    def wait(self, timeout: float) -> bool:
+        """Wait until cancelled or the timeout expires, returning whether it was cancelled"""
+        return self._event.wait(timeout)
+
+    def _remove(self, callback: Callable[[], None]):
+        """Unregister a callback"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+def file_identity(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Get the identity of a file
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        Tuple of inode, size and modification time in nanoseconds, or None if the file is missing
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+class Job:
+    """A single content generation request for a file"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    PARKED = "parked"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+    # Worker pool priorities (lower runs first)
+    INTERACTIVE_PRIORITY = 0
+    BACKGROUND_PRIORITY = 10
+
+    def __init__(self, file_path: str, prompt_file: str = None, model: str = None,
+                 source: str = "watcher", interactive: bool = True, priority: int = None):
+        """
+        Initialize a job
+
+        Args:
+            file_path: Path to the file that should receive the generated content
+            prompt_file: Optional prompt file overriding the extension settings
+            model: Optional model overriding the extension settings
+            source: Where the job came from (watcher, api, ...)
+            interactive: Whether someone is waiting on the result (enables hedged requests)
+            priority: Worker pool priority (defaults to interactive or background by interactive)
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.file_path = file_path
+        self.prompt_file = prompt_file
+        self.model = model
+        self.source = source
+        self.interactive = interactive
+        if priority is None:
+            priority = Job.INTERACTIVE_PRIORITY if interactive else Job.BACKGROUND_PRIORITY
+        self.priority = priority
+        self.job_class = None
+        self.backend = None
+        self.model_used = None
+        self.status = Job.QUEUED
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.requests = 0
+        self.continuations = 0
+        self.truncated = False
+        self.replayed = False
+        # Jobs generated together with this one in a joint request, and the id of that group's leader
+        self.siblings = []
+        self.group = None
+        self.stages = {}
+        self.current_stage = None
+        self._usage_lock = threading.Lock()
+
+        # The file the job writes to, identified when the job is bound to it
+        self.token = CancellationToken()
+        self.identity = None
+        self.identity_lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        """Check if the job reached a final state"""
+        return self.status in Job.FINISHED_STATES
+
+    @property
+    def total_tokens(self) -> int:
+        """Get the total number of tokens used by the job"""
+        return self.prompt_tokens + self.completion_tokens
+
+    def record_usage(self, usage: Any):
+        """
+        Add token usage reported by the API to the job
+
+        Args:
+            usage: Usage object from an OpenAI response (may be None)
+        """
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self._usage_lock:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+            self.cached_tokens += getattr(details, "cached_tokens", 0) or 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a processing stage of the job
+
+        Args:
+            name: Stage name (references, prompt, api, write, ...)
+        """
+        previous = self.current_stage
+        self.current_stage = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+            self.current_stage = previous
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get a JSON serializable representation of the job"""
+        queue_time = None
+        run_time = None
+        if self.started_at is not None:
+            queue_time = round(self.started_at - self.created_at, 4)
+            if self.finished_at is not None:
+                run_time = round(self.finished_at - self.started_at, 4)
+
+        return {
+            "id": self.id,
+            "path": self.file_path,
+            "source": self.source,
+            "priority": self.priority,
+            "class": self.job_class,
+            "backend": self.backend,
+            "status": self.status,
+            "model": self.model_used,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_time": queue_time,
+            "run_time": run_time,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "total_tokens": self.total_tokens,
+            "requests": self.requests,
+            "continuations": self.continuations,
+            "truncated": self.truncated,
+            "replayed": self.replayed,
+            "group": self.group,
+            "stages": {name: round(duration, 4) for name, duration in self.stages.items()}
+        }
+
+def job_stage(job: Optional[Job], name: str):
+    """
+    Time a processing stage if a job is being tracked
+
+    Args:
+        job: The job, or None
+        name: Stage name
+
+    Returns:
+        Context manager timing the stage
+    """
+    if job is None:
+        return nullcontext()
+    return job.stage(name)
+
+class JobRegistry:
+    """Keeps track of submitted jobs and lets callers wait for status changes"""
+
+    def __init__(self, max_jobs: int = 10000, max_events: int = 10000):
+        """
+        Initialize the registry
+
+        Args:
+            max_jobs: Maximum number of jobs kept in memory (oldest finished jobs are dropped)
+            max_events: Maximum number of status events kept for event subscribers
+        """
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._events = deque(maxlen=max_events)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def add(self, job: Job):
+        """Register a new job"""
+        with self._condition:
+            self._jobs[job.id] = job
+            self._prune()
+            self._publish(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Get a job by its id"""
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def list(self, status: str = None, limit: int = 100) -> List[Job]:
+        """
+        Get the most recent jobs
+
+        Args:
+            status: Only return jobs with this status
+            limit: Maximum number of jobs to return
+
+        Returns:
+            List of jobs, newest first
+        """
+        with self._condition:
+            jobs = [job for job in reversed(self._jobs.values())
+                    if status is None or job.status == status]
+        return jobs[:limit]
+
+    def update(self, job: Job, status: str, error: str = None):
+        """
+        Change the status of a job and wake up waiters
+
+        Args:
+            job: The job to update
+            status: New status
+            error: Error message for failed jobs
+        """
+        with self._condition:
+            now = time.time()
+            job.status = status
+            if status == Job.RUNNING:
+                job.started_at = now
+            elif status in Job.FINISHED_STATES:
+                if job.started_at is None:
+                    job.started_at = now
+                job.finished_at = now
+                job.error = error
+            self._publish(job)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """
+        Wait until a job is finished or the timeout expires
+
+        Args:
+            job_id: Id of the job to wait for
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            The job (finished or not), or None if the id is unknown
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.finished:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return job
+
+    def events_since(self, sequence: int, timeout: float) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Get status events newer than a sequence number, waiting for new ones if needed
+
+        Args:
+            sequence: Last sequence number seen by the caller
+            timeout: Maximum time to wait for new events in seconds
+
+        Returns:
+            Tuple of the latest sequence number and the list of new events
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._sequence <= sequence:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return self._sequence, []
+                self._condition.wait(remaining)
+            events = [event for seq, event in self._events if seq > sequence]
+            return self._sequence, events
+
+    @property
+    def sequence(self) -> int:
+        """Get the sequence number of the latest event"""
+        with self._condition:
+            return self._sequence
+
+    def _publish(self, job: Job):
+        """Record a status event for a job (must hold the lock)"""
+        self._sequence += 1
+        event = job.to_dict()
+        event["sequence"] = self._sequence
+        self._events.append((self._sequence, event))
+        self._condition.notify_all()
+        default_bus.publish("job", event)
+
+    def _prune(self):
+        """Drop the oldest finished jobs when the registry is full (must hold the lock)"""
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in list(self._jobs.keys()):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].finished:
+                del self._jobs[job_id]
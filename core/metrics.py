@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque, defaultdict
+from typing import Dict, Any, List, Optional
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """
+    Get a percentile of a list of values
+
+    Args:
+        values: Values to summarize
+        fraction: Percentile as a fraction (0.95 for p95)
+
+    Returns:
+        The percentile, or None for an empty list
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+class ProcessorMetrics:
+    """Thread-safe counters describing the processor's throughput and latency"""
+
+    def __init__(self, latency_samples: int = 500, throughput_window: float = 60.0):
+        """
+        Initialize the metrics
+
+        Args:
+            latency_samples: Number of recent latencies kept per (model, extension)
+            throughput_window: Window in seconds used for the jobs/min rate
+        """
+        self.latency_samples = latency_samples
+        self.throughput_window = throughput_window
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=self.latency_samples))
+        self._completions = deque()
+        self.completed = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cancelled = 0
+        self.cancelled_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def record_job(self, model: str, extension: str, latency: float, succeeded: bool,
+                   prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0):
+        """
+        Record a finished generation
+
+        Args:
+            model: Model used for the job
+            extension: File extension
+            latency: Generation time in seconds
+            succeeded: Whether the job completed
+            prompt_tokens: Prompt tokens consumed
+            completion_tokens: Completion tokens consumed
+            cached_tokens: Prompt tokens served from the provider's prompt cache
+        """
+        now = time.monotonic()
+        with self._lock:
+            if succeeded:
+                self.completed += 1
+                self._latencies[(model, extension)].append(latency)
+            else:
+                self.failed += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached_tokens
+            self._completions.append(now)
+            self._trim(now)
+
+    def record_cancelled(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """
+        Record a job cancelled because its file changed
+
+        Args:
+            prompt_tokens: Prompt tokens consumed before the cancellation
+            completion_tokens: Completion tokens consumed before the cancellation
+        """
+        with self._lock:
+            self.cancelled += 1
+            self.cancelled_tokens += prompt_tokens + completion_tokens
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def record_cache(self, hit: bool):
+        """Record a cache lookup"""
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get a consistent copy of the counters
+
+        Returns:
+            Dictionary with totals, jobs per minute, cache hit rate and latency percentiles
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            latencies = {key: list(values) for key, values in self._latencies.items()}
+            recent = len(self._completions)
+            lookups = self.cache_hits + self.cache_misses
+            snapshot = {
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "cancelled_tokens": self.cancelled_tokens,
+                "jobs_per_minute": recent * 60.0 / self.throughput_window,
+                "cache_hit_rate": self.cache_hits / lookups if lookups else None,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "prompt_cache_rate": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else None,
+                "total_tokens": self.prompt_tokens + self.completion_tokens
+            }
+
+        snapshot["latency"] = {
+            f"{model} {extension}": {
+                "count": len(values),
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95)
+            }
+            for (model, extension), values in sorted(latencies.items())
+        }
+        return snapshot
+
+    def _trim(self, now: float):
+        """Drop completions outside the throughput window (must hold the lock)"""
+        while self._completions and now - self._completions[0] > self.throughput_window:
+            self._completions.popleft()
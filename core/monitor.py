@@ -1,5 +1,11 @@
+import errno
+import fnmatch
 import os
+import sys
+import threading
 import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, Any, List, Optional, Set, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
@@ -8,28 +14,171 @@ from config.settings import Settings
 from core.processor import FileProcessor
 
 class NewFileHandler(FileSystemEventHandler):
-    """Handles file creation and rename events"""
+    """
+    Handles file creation and rename events
+    
+    Renamed files are checked after the configured delay by a background thread,
+    so the observer thread never sleeps. When a subtree produces events faster
+    than the storm threshold (archive extraction, branch checkout), per-event
+    handling stops for that subtree; once it has been quiet for the settle time,
+    one os.scandir sweep submits the empty renamed files as a single bulk set.
+    """
     
     def __init__(self, settings: Settings, processor: FileProcessor):
         """Initialize with settings and processor"""
         self.settings = settings
         self.processor = processor
+        self.storm_settings = settings.event_storm
+        self.root = os.path.abspath(settings.monitored_directory)
+        
+        # Renamed files waiting for the delay: path -> due time
+        self._pending = {}
+        # Recent event times per subtree
+        self._rates = defaultdict(deque)
+        # Subtrees in storm mode: subtree -> {"last_event": ..., "paths": set()}
+        self._storms = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="newfiles-settle", daemon=True)
+        self._thread.start()
     
     def on_created(self, event):
-        """Handle file creation events - now ignored as per new requirements"""
-        # Do nothing on file creation - we only process on rename
-        pass
+        """Handle file creation events - counted for storm detection and used as a prefetch signal"""
+        # Content is only generated on rename, but a new file usually means one is coming
+        if not event.is_directory:
+            self.processor.file_changed(event.src_path)
+            with self._lock:
+                storm = self._count_event(event.src_path)
+            if storm is None:
+                self.processor.prefetch(event.src_path)
+    
+    def on_modified(self, event):
+        """Handle file modification events - cancel jobs whose file is being edited"""
+        if not event.is_directory:
+            self.processor.file_changed(event.src_path)
+    
+    def on_deleted(self, event):
+        """Handle file deletion events - cancel jobs whose file is gone"""
+        if not event.is_directory:
+            self.processor.file_changed(event.src_path)
     
     def on_moved(self, event):
         """Handle file rename/move events - generate content for empty files"""
-        if not event.is_directory:
-            # Apply delay before processing
-            time.sleep(self.settings.delay)
+        if event.is_directory:
+            return
+        
+        # Jobs for the old path (and for a replaced destination) are stale now
+        self.processor.file_changed(event.src_path)
+        self.processor.file_changed(event.dest_path)
+        
+        path = event.dest_path
+        with self._lock:
+            storm = self._count_event(path)
+            if storm is not None:
+                storm["paths"].add(path)
+            else:
+                # Check the file once the delay has passed
+                self._pending[path] = time.monotonic() + self.settings.delay
+    
+    def stop(self):
+        """Stop the background thread"""
+        self._stopping.set()
+        self._thread.join()
+    
+    def _subtree(self, path: str) -> str:
+        """Get the top-level folder of the monitored directory containing a path"""
+        relative = os.path.relpath(os.path.dirname(os.path.abspath(path)), self.root)
+        if relative == "." or relative.startswith(".."):
+            return self.root
+        return os.path.join(self.root, relative.split(os.sep)[0])
+    
+    def _count_event(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Record an event for storm detection (must hold the lock)
+        
+        Args:
+            path: Path the event refers to
             
-            # Check if the file is empty and has a supported extension
-            if self._is_empty_file_with_supported_extension(event.dest_path):
-                # Process the renamed file
-                self.processor.process_new_file(event.dest_path)
+        Returns:
+            The storm state if the path's subtree is in storm mode, else None
+        """
+        if not self.storm_settings["enabled"]:
+            return None
+        
+        subtree = self._subtree(path)
+        now = time.monotonic()
+        storm = self._storms.get(subtree)
+        if storm is not None:
+            storm["last_event"] = now
+            return storm
+        
+        events = self._rates[subtree]
+        events.append(now)
+        while events and now - events[0] > self.storm_settings["window"]:
+            events.popleft()
+        if len(events) < self.storm_settings["threshold"]:
+            return None
+        
+        # Switch the subtree to batch handling, taking over its pending renames
+        storm = {"last_event": now, "started": now, "paths": set()}
+        for pending in [p for p in self._pending if self._subtree(p) == subtree]:
+            storm["paths"].add(pending)
+            del self._pending[pending]
+        self._storms[subtree] = storm
+        del self._rates[subtree]
+        default_logger.warning(f"Event storm in {subtree}, deferring to a sweep once it settles")
+        return storm
+    
+    def _run(self):
+        """Check renamed files after their delay and sweep settled storms"""
+        while not self._stopping.wait(0.1):
+            now = time.monotonic()
+            with self._lock:
+                due = [path for path, when in self._pending.items() if when <= now]
+                for path in due:
+                    del self._pending[path]
+                settled = [(subtree, storm) for subtree, storm in self._storms.items()
+                           if now - storm["last_event"] >= self.storm_settings["settle"]]
+                for subtree, _ in settled:
+                    del self._storms[subtree]
+            
+            for path in due:
+                # Check if the file is empty and has a supported extension
+                if self._is_empty_file_with_supported_extension(path):
+                    # Queue the renamed file for the worker pool
+                    self.processor.submit(path)
+            
+            for subtree, storm in settled:
+                self._sweep(subtree, storm)
+    
+    def _sweep(self, subtree: str, storm: Dict[str, Any]):
+        """
+        Submit the empty renamed files of a settled storm as one bulk set
+        
+        Args:
+            subtree: Folder the storm happened in
+            storm: Storm state with the renamed paths
+        """
+        supported = {f".{extension}" for extension in self.settings.extension_settings}
+        matches = []
+        for directory in {os.path.dirname(path) for path in storm["paths"]}:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if (entry.path in storm["paths"]
+                                and os.path.splitext(entry.name)[1].lower() in supported
+                                and entry.is_file()
+                                and entry.stat().st_size == 0):
+                            matches.append(entry.path)
+            except OSError as e:
+                default_logger.error(f"Error sweeping {directory}: {str(e)}")
+        
+        default_logger.info(
+            f"Event storm in {subtree} settled after {storm['last_event'] - storm['started']:.1f}s: "
+            f"{len(storm['paths'])} renamed files, {len(matches)} queued"
+        )
+        if matches:
+            self.processor.submit_many(matches)
     
     def _is_empty_file_with_supported_extension(self, file_path: str) -> bool:
         """
@@ -66,31 +215,417 @@ class NewFileHandler(FileSystemEventHandler):
             default_logger.error(f"Error checking if file is empty with supported extension: {str(e)}")
             return False
 
+class _ActivityHandler(FileSystemEventHandler):
+    """Reports activity on a hybrid watcher's native watches"""
+    
+    def __init__(self, watcher: "HybridWatcher"):
+        """Initialize with the watcher to notify"""
+        self.watcher = watcher
+    
+    def on_any_event(self, event):
+        """Keep the folder's watch fresh; a new subfolder is promoted right away"""
+        path = getattr(event, "dest_path", None) or event.src_path
+        if event.is_directory:
+            self.watcher.touch(path, promote=event.event_type in ("created", "moved"))
+        else:
+            self.watcher.touch(os.path.dirname(path))
+
+class HybridWatcher:
+    """
+    Watches a large tree with a bounded number of native watches
+    
+    The monitored directory and the most recently active folders get
+    non-recursive native watches, the least recently used one being evicted
+    beyond max_native_watches or the platform's limit, whichever is lower. A
+    background thread sweeps the other folders with os.scandir every
+    sweep_interval seconds; a folder where an empty file with a supported
+    extension newly appeared, or where a subfolder was created, is promoted
+    to a native watch. Startup only installs one watch, and memory grows with
+    the watch limit instead of the tree size.
+    
+    The sweeper cannot tell a renamed file from one created empty under its
+    final name, so in swept folders both are generated. Files with a default
+    new-file name ("New Text Document.txt", "Untitled.md", ...) are left
+    alone, and their folder is promoted so that their rename is seen natively.
+    """
+    
+    def __init__(self, observer: Observer, handler: FileSystemEventHandler, processor: FileProcessor,
+                 settings: Settings):
+        """
+        Initialize the watcher (nothing is watched until start is called)
+        
+        Args:
+            observer: Observer the native watches are scheduled on
+            handler: Handler of the native watches' events
+            processor: Processor the files found by the sweeper are submitted to
+            settings: Settings with the "watch" options
+        """
+        self.observer = observer
+        self.handler = handler
+        self.processor = processor
+        self.settings = settings
+        self.options = settings.watch
+        self.root = os.path.abspath(settings.monitored_directory)
+        self.supported = {f".{extension}" for extension in settings.extension_settings}
+        self._root_watch = None
+        # Watches available to folders besides the monitored directory, lowered if the platform runs out
+        self._limit = self._watch_limit()
+        # Folder -> native watch, least recently active first
+        self._watches = OrderedDict()
+        # Empty files with supported extensions per swept folder, from the last sweep
+        self._empty = {}
+        # Folders waiting to be promoted by the sweeper thread
+        self._requested = OrderedDict()
+        self._activity = _ActivityHandler(self)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="newfiles-sweeper", daemon=True)
+    
+    @property
+    def native_watches(self) -> int:
+        """Get the number of native watches, including the monitored directory's"""
+        with self._lock:
+            return len(self._watches) + (self._root_watch is not None)
+    
+    def _watch_limit(self) -> int:
+        """
+        Get the number of native watches available to folders besides the monitored directory
+        
+        On Linux every non-recursive watch is an inotify instance, and the
+        instances are limited per user (128 by default), so at most half of
+        them are used and the rest left to the user's other programs.
+        
+        Returns:
+            The configured max_native_watches minus the monitored directory's, capped by the platform
+        """
+        limit = self.options["max_native_watches"] - 1
+        if sys.platform.startswith("linux"):
+            try:
+                with open("/proc/sys/fs/inotify/max_user_instances", "r", encoding="utf-8") as f:
+                    limit = min(limit, int(f.read()) // 2 - 1)
+            except (OSError, ValueError):
+                pass
+        return max(1, limit)
+    
+    def start(self):
+        """
+        Watch the monitored directory and start the sweeper
+        
+        Returns:
+            The monitored directory's watch
+        """
+        self._root_watch = self.observer.schedule(self.handler, self.root, recursive=False)
+        self.observer.add_handler_for_watch(self._activity, self._root_watch)
+        self._thread.start()
+        return self._root_watch
+    
+    def stop(self):
+        """Stop the sweeper and remove every native watch"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        with self._lock:
+            watches = list(self._watches.values()) + [self._root_watch]
+            self._watches.clear()
+            self._requested.clear()
+            self._root_watch = None
+        for watch in watches:
+            if watch is not None:
+                self.observer.unschedule(watch)
+    
+    def touch(self, directory: str, promote: bool = True):
+        """
+        Record activity in a folder, requesting its promotion to a native watch
+        
+        Called on the observer's dispatch thread, which holds the observer's
+        lock, so the watch itself is added by the sweeper thread.
+        
+        Args:
+            directory: Folder inside the monitored directory
+            promote: Whether an unwatched folder should be promoted (otherwise only a watch is refreshed)
+        """
+        directory = os.path.abspath(directory)
+        if directory == self.root or not directory.startswith(self.root + os.sep):
+            return
+        with self._lock:
+            if directory in self._watches:
+                self._watches.move_to_end(directory)
+                return
+            if not promote:
+                return
+            self._requested[directory] = None
+        self._wake.set()
+    
+    def _promote_requested(self):
+        """Add native watches for the requested folders, evicting the least recently active ones"""
+        while not self._stopping.is_set():
+            with self._lock:
+                if not self._requested:
+                    return
+                directory, _ = self._requested.popitem(last=False)
+                if directory in self._watches:
+                    continue
+            
+            try:
+                watch = self._schedule(directory)
+            except OSError as e:
+                if e.errno not in (errno.EMFILE, errno.ENOSPC) or not self._evict_oldest(shrink=True):
+                    # The folder is gone or nothing can be evicted; the sweeper keeps covering it
+                    default_logger.warning(f"Could not watch {directory}: {str(e)}")
+                    continue
+                # The platform ran out of watches before the limit: reuse the least recently active one
+                try:
+                    watch = self._schedule(directory)
+                except OSError as e:
+                    default_logger.warning(f"Could not watch {directory}: {str(e)}")
+                    continue
+            
+            with self._lock:
+                self._watches[directory] = watch
+                known = self._empty.pop(directory, set())
+            while self.native_watches - 1 > self._limit and self._evict_oldest():
+                pass
+            
+            # Files renamed before the watch was active are not reported by it
+            missed = {name for name in self._scan(directory)[1] - known if not self._placeholder(name)}
+            if missed:
+                self.processor.submit_many([os.path.join(directory, name) for name in sorted(missed)])
+    
+    def _schedule(self, directory: str):
+        """
+        Add a native watch for a folder
+        
+        Args:
+            directory: Folder to watch
+            
+        Returns:
+            The watch
+            
+        Raises:
+            OSError: If the folder cannot be watched (EMFILE or ENOSPC when the platform is out of watches)
+        """
+        watch = self.observer.schedule(self.handler, directory, recursive=False)
+        self.observer.add_handler_for_watch(self._activity, watch)
+        return watch
+    
+    def _evict_oldest(self, shrink: bool = False) -> bool:
+        """
+        Remove the least recently active native watch
+        
+        Args:
+            shrink: Whether to lower the watch limit to the current number of watches first
+            
+        Returns:
+            True if a watch was removed
+        """
+        with self._lock:
+            if not self._watches:
+                return False
+            if shrink and len(self._watches) < self._limit:
+                self._limit = len(self._watches)
+                default_logger.warning(f"Out of native watches, limiting hybrid watches to {self._limit}")
+            folder, watch = self._watches.popitem(last=False)
+        self.observer.unschedule(watch)
+        
+        # Remember what is there now so the sweeper only reports later arrivals
+        empty = self._scan(folder)[1]
+        if empty:
+            with self._lock:
+                self._empty[folder] = empty
+        return True
+    
+    def _placeholder(self, name: str) -> bool:
+        """
+        Check if a filename is a default new-file name that is about to be renamed
+        
+        Args:
+            name: Filename
+            
+        Returns:
+            True if it matches one of the "placeholder_names" patterns
+        """
+        name = name.lower()
+        return any(fnmatch.fnmatchcase(name, pattern.lower()) for pattern in self.options["placeholder_names"])
+    
+    def _scan(self, directory: str, collect_empty: bool = True) -> Tuple[List[str], Set[str]]:
+        """
+        List the subfolders and empty supported files of a folder
+        
+        Args:
+            directory: Folder to scan
+            collect_empty: Whether to look for empty files (skipped for natively watched folders)
+        
+        Returns:
+            Tuple of the subfolder paths and the names of the empty files with supported extensions
+        """
+        subdirectories = []
+        empty = set()
+        ignored = self.options["ignore_directories"]
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in ignored:
+                                subdirectories.append(entry.path)
+                        elif (collect_empty
+                                and os.path.splitext(entry.name)[1].lower() in self.supported
+                                and entry.stat().st_size == 0):
+                            empty.add(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return subdirectories, empty
+    
+    def _run(self):
+        """Sweeper thread loop"""
+        # The first sweep only records what exists, so files that were already empty are left alone
+        self._sweep(report=False)
+        next_sweep = time.monotonic() + self.options["sweep_interval"]
+        while not self._stopping.is_set():
+            self._wake.wait(max(0.0, next_sweep - time.monotonic()))
+            self._wake.clear()
+            self._promote_requested()
+            if time.monotonic() >= next_sweep:
+                self._sweep()
+                self._promote_requested()
+                next_sweep = time.monotonic() + self.options["sweep_interval"]
+    
+    def _sweep(self, report: bool = True):
+        """
+        Walk the tree and submit empty supported files that appeared in folders without a native watch
+        
+        Files with a default new-file name are not submitted, but their folder is promoted.
+        
+        Args:
+            report: Whether to submit new files (False to record a baseline)
+        """
+        started = time.perf_counter()
+        found = []
+        folders = 0
+        stack = [self.root]
+        while stack and not self._stopping.is_set():
+            directory = stack.pop()
+            with self._lock:
+                watched = directory == self.root or directory in self._watches
+            subdirectories, empty = self._scan(directory, collect_empty=not watched)
+            stack.extend(subdirectories)
+            folders += 1
+            if watched:
+                continue
+            
+            with self._lock:
+                previous = self._empty.pop(directory, set())
+                if empty:
+                    self._empty[directory] = empty
+            new = empty - previous
+            if new and report:
+                # Placeholders are only watched for their rename
+                found.extend(os.path.join(directory, name) for name in sorted(new) if not self._placeholder(name))
+                self.touch(directory)
+        
+        # Forget folders that no longer exist
+        with self._lock:
+            for directory in [d for d in self._empty if not os.path.isdir(d)]:
+                del self._empty[directory]
+        
+        default_logger.debug(
+            f"Swept {folders} folders in {(time.perf_counter() - started) * 1000:.0f} ms: "
+            f"{len(found)} new files, {self.native_watches} native watches"
+        )
+        if found and not self._stopping.is_set():
+            self.processor.submit_many(found)
+
 class FileMonitor:
-    """Monitors a directory for new file creations"""
+    """
+    Monitors a directory for new file creations
+    
+    The observer thread lives as long as the monitor; pausing and rescheduling
+    only remove and add its watch, so they are cheap and can be repeated.
+    """
     
     def __init__(self, settings: Settings, processor: FileProcessor):
         """Initialize the file monitor"""
         self.settings = settings
         self.processor = processor
         self.observer = Observer()
+        self.event_handler = None
+        self.hybrid = None
+        self._watch = None
     
-    def start(self):
-        """Start monitoring the directory"""
-        # Create event handler
-        event_handler = NewFileHandler(self.settings, self.processor)
+    @property
+    def watching(self) -> bool:
+        """Whether the monitored directory is currently watched"""
+        return self._watch is not None
+    
+    def start(self, blocking: bool = True):
+        """
+        Start monitoring the directory
         
-        # Schedule the observer
-        self.observer.schedule(
-            event_handler, 
-            self.settings.monitored_directory, 
-            recursive=self.settings.monitor_subdirectories
-        )
+        Args:
+            blocking: Whether to block until interrupted
+        """
+        self._schedule()
         
         # Start the observer
         self.observer.start()
         default_logger.info(f"Started monitoring directory: {self.settings.monitored_directory}")
         
+        if blocking:
+            self.wait()
+    
+    def pause(self):
+        """Stop watching the directory without stopping the observer (queued jobs still run)"""
+        if self.watching:
+            self._unschedule()
+            default_logger.info("Paused monitoring")
+    
+    def resume(self):
+        """Watch the directory again after a pause"""
+        if not self.watching:
+            self._schedule()
+            default_logger.info(f"Resumed monitoring directory: {self.settings.monitored_directory}")
+    
+    def reschedule(self):
+        """Replace the watch and handler so changed settings (directory, recursion, delay) take effect"""
+        watching = self.watching
+        self._unschedule()
+        if watching:
+            self._schedule()
+            default_logger.info(f"Now monitoring directory: {self.settings.monitored_directory}")
+    
+    def _schedule(self):
+        """Create the event handler and add the watch"""
+        self.event_handler = NewFileHandler(self.settings, self.processor)
+        if self.settings.monitor_subdirectories and self.settings.watch["strategy"] == "hybrid":
+            # Bounded native watches plus a sweeper instead of one native watch per folder
+            self.hybrid = HybridWatcher(self.observer, self.event_handler, self.processor, self.settings)
+            self._watch = self.hybrid.start()
+            return
+        
+        self._watch = self.observer.schedule(
+            self.event_handler, 
+            self.settings.monitored_directory, 
+            recursive=self.settings.monitor_subdirectories
+        )
+    
+    def _unschedule(self):
+        """Remove the watch and stop the event handler"""
+        if self.hybrid is not None:
+            self.hybrid.stop()
+            self.hybrid = None
+        elif self._watch is not None:
+            self.observer.unschedule(self._watch)
+        self._watch = None
+        if self.event_handler is not None:
+            self.event_handler.stop()
+            self.event_handler = None
+    
+    def wait(self):
+        """Block until interrupted, then stop monitoring"""
         try:
             while True:
                 time.sleep(1)
@@ -99,6 +634,8 @@ class FileMonitor:
     
     def stop(self):
         """Stop monitoring the directory"""
-        self.observer.stop()
-        self.observer.join()
+        self._unschedule()
+        if self.observer.is_alive():
+            self.observer.stop()
+            self.observer.join()
         default_logger.info("Stopped monitoring directory")
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from utils.logger import default_logger
+
+class WorkerPool:
+    """
+    Fixed-size pool of worker threads with fair scheduling
+
+    Items are queued by priority and by key (for example the directory of a file).
+    Lower priorities always run first; within a priority, keys are served
+    round-robin so one busy key cannot starve the others, and an optional cap
+    limits how many items of the same key run at once.
+    """
+
+    def __init__(self, name: str, workers: int, handler: Callable[[Any], None],
+                 max_in_flight_per_key: int = None):
+        """
+        Initialize and start the pool
+
+        Args:
+            name: Name used for the worker threads
+            workers: Number of worker threads
+            handler: Function called with each submitted item
+            max_in_flight_per_key: Maximum number of items of one key processed at once (None for no cap)
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_in_flight_per_key = max_in_flight_per_key
+        # priority -> key -> queued items, keys in round-robin order
+        self._queues = {}
+        self._queued = 0
+        self._in_flight = 0
+        self._key_in_flight = defaultdict(int)
+        self._closing = False
+        self._condition = threading.Condition()
+        self._threads = []
+
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, item: Any, priority: int = 0, key: Hashable = None):
+        """
+        Queue an item for processing
+
+        Args:
+            item: Item passed to the handler
+            priority: Lower values are processed first
+            key: Fairness key the item is scheduled under
+        """
+        with self._condition:
+            keys = self._queues.setdefault(priority, OrderedDict())
+            keys.setdefault(key, deque()).append(item)
+            self._queued += 1
+            self._condition.notify()
+
+    @property
+    def queue_depth(self) -> int:
+        """Get the number of items waiting for a worker"""
+        with self._condition:
+            return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        """Get the number of items currently being processed"""
+        with self._condition:
+            return self._in_flight
+
+    def key_stats(self) -> Dict[Hashable, Dict[str, int]]:
+        """
+        Get the queued and in-flight counts of every active key
+
+        Returns:
+            Dictionary of key -> {"queued": ..., "in_flight": ...}
+        """
+        with self._condition:
+            stats = defaultdict(lambda: {"queued": 0, "in_flight": 0})
+            for keys in self._queues.values():
+                for key, items in keys.items():
+                    stats[key]["queued"] += len(items)
+            for key, count in self._key_in_flight.items():
+                stats[key]["in_flight"] = count
+            return dict(stats)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers after the queued items are processed
+
+        Args:
+            wait: Whether to wait for the workers to exit
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next(self) -> Optional[Tuple[Hashable, Any]]:
+        """Take the next eligible item (must hold the condition)"""
+        for priority in sorted(self._queues):
+            keys = self._queues[priority]
+            for key, items in keys.items():
+                if self.max_in_flight_per_key and self._key_in_flight.get(key, 0) >= self.max_in_flight_per_key:
+                    continue
+                item = items.popleft()
+                # Served keys go to the back of the rotation
+                if items:
+                    keys.move_to_end(key)
+                else:
+                    del keys[key]
+                if not keys:
+                    del self._queues[priority]
+                self._queued -= 1
+                return key, item
+        return None
+
+    def _work(self):
+        """Worker thread loop"""
+        while True:
+            with self._condition:
+                entry = self._next()
+                while entry is None:
+                    if self._closing and self._queued == 0:
+                        return
+                    self._condition.wait()
+                    entry = self._next()
+                key, item = entry
+                self._in_flight += 1
+                self._key_in_flight[key] += 1
+            try:
+                self.handler(item)
+            except Exception as e:
+                default_logger.error(f"Unhandled error in {self.name}: {str(e)}")
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._key_in_flight[key] -= 1
+                    if not self._key_in_flight[key]:
+                        del self._key_in_flight[key]
+                    # A capped key may have become eligible again
+                    self._condition.notify_all()
+
+class RateLimiter:
+    """Token bucket limiting how often work may start"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initialize the bucket (full)
+
+        Args:
+            rate: Tokens added per second
+            burst: Maximum number of tokens that can accumulate
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token
+
+        Returns:
+            Seconds to wait before the token may be used (0 if it is available now)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Negative balances are reservations handed out to earlier callers
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
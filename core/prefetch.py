@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+
+from utils.logger import default_logger
+
+def _signature(stat: os.stat_result) -> Tuple[int, int]:
+    """Get the part of a stat result that tells whether a file changed"""
+    return stat.st_mtime_ns, stat.st_size
+
+class TemplateCache:
+    """Prompt templates kept in memory and re-read only when the file changes"""
+
+    def __init__(self):
+        """Initialize an empty cache"""
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> str:
+        """
+        Get a prompt template
+
+        Args:
+            path: Path to the prompt file
+
+        Returns:
+            The template text
+
+        Raises:
+            OSError: If the prompt file cannot be read
+        """
+        signature = _signature(os.stat(path))
+        with self._lock:
+            cached = self._templates.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            template = f.read()
+        with self._lock:
+            self._templates[path] = (signature, template)
+        return template
+
+class ReferenceCache:
+    """
+    Reference files per directory and extension, re-read only when they change
+
+    Every lookup still lists the directory, so added, removed and edited files
+    are always seen; only the contents of unchanged files come from memory.
+    The least recently used directories are evicted beyond max_directories.
+    """
+
+    def __init__(self, max_directories: int = 64):
+        """
+        Initialize an empty cache
+
+        Args:
+            max_directories: Number of (directory, extension) entries kept
+        """
+        self.max_directories = max_directories
+        # (directory, extension) -> {filename: (signature, content)}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, directory: str, extension: str, exclude_file: str = None) -> List[Dict[str, Any]]:
+        """
+        Get reference files of the same extension from the directory
+
+        Args:
+            directory: Directory to search in
+            extension: File extension to look for
+            exclude_file: Filename to exclude from results
+
+        Returns:
+            The same list as utils.helpers.get_reference_files, sorted by filename
+        """
+        # Ensure the extension starts with a dot
+        if not extension.startswith('.'):
+            extension = '.' + extension
+
+        key = (os.path.abspath(directory), extension)
+        with self._lock:
+            cached = self._entries.get(key, {})
+
+        files = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(extension):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    signature = _signature(entry.stat())
+                    previous = cached.get(entry.name)
+                    if previous is not None and previous[0] == signature:
+                        files[entry.name] = previous
+                        continue
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        files[entry.name] = (signature, f.read())
+                except Exception:
+                    # Skip files that can't be read as text
+                    continue
+
+        with self._lock:
+            self._entries[key] = files
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_directories:
+                self._entries.popitem(last=False)
+
+        return [
+            {'filename': filename, 'content': files[filename][1]}
+            for filename in sorted(files)
+            if filename != exclude_file
+        ]
+
+class Prefetcher:
+    """
+    Prepares a directory's context when a file is created in it
+
+    An empty file appearing is usually followed by a rename to its real name,
+    so a background thread warms the reference cache for the directory, loads
+    the configured prompt templates and opens an API connection. When the
+    rename arrives, only the prompt render and the request remain.
+    """
+
+    def __init__(self, processor, options: Dict[str, Any]):
+        """
+        Initialize and start the prefetch thread
+
+        Args:
+            processor: FileProcessor whose caches and generator are warmed
+            options: The "prefetch" settings
+        """
+        self.processor = processor
+        self.options = options
+        # Directories waiting to be prefetched, in arrival order
+        self._pending = OrderedDict()
+        # Directory -> time of its last prefetch
+        self._recent = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="newfiles-prefetch", daemon=True)
+        self._thread.start()
+
+    def hint(self, file_path: str):
+        """
+        Signal that a file was created
+
+        Args:
+            file_path: Path of the created file
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        with self._condition:
+            last = self._recent.get(directory)
+            if last is not None and time.monotonic() - last < self.options["min_interval"]:
+                return
+            self._pending[directory] = None
+            self._condition.notify()
+
+    def stop(self):
+        """Stop the prefetch thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        """Prefetch thread loop"""
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                directory, _ = self._pending.popitem(last=False)
+                now = time.monotonic()
+                self._recent[directory] = now
+                # Forget directories that are no longer rate limited
+                for stale in [d for d, t in self._recent.items() if now - t > self.options["min_interval"]]:
+                    del self._recent[stale]
+            try:
+                self._prefetch(directory)
+            except Exception as e:
+                default_logger.debug(f"Prefetch of {directory} failed: {str(e)}")
+
+    def _prefetch(self, directory: str):
+        """
+        Warm the caches and the connection for a directory
+
+        Args:
+            directory: Directory a file was created in
+        """
+        settings = self.processor.settings
+        started = time.perf_counter()
+
+        # Prompt templates of every configured extension, in the cache of the generator it is sent with
+        default = self.processor.generator
+        prompt_files = {default: {settings.default_text_prompt_file, settings.default_image_prompt_file}}
+        dynamic = set()
+        for extension, options in settings.extension_settings.items():
+            try:
+                generator = self.processor.generator_for(extension)
+            except ValueError:
+                continue
+            prompt_file = options.get("prompt_file")
+            if prompt_file:
+                prompt_files.setdefault(generator, set()).add(prompt_file)
+                if "dynamic" in prompt_file.lower():
+                    dynamic.add(f".{extension}")
+            else:
+                prompt_files.setdefault(generator, set()).add(settings.default_text_prompt_file)
+        for generator, files in prompt_files.items():
+            for prompt_file in files:
+                try:
+                    generator.templates.get(prompt_file)
+                except OSError:
+                    continue
+
+        # Reference files of the extensions with dynamic prompts (the rename decides the final extension)
+        for extension in sorted(dynamic):
+            self.processor.references.get(directory, extension)
+
+        # Connections of every backend a rename may be sent to
+        if self.options["warm_connection"]:
+            for generator in prompt_files:
+                generator.warm_connection(self.options["connection_interval"])
+
+        default_logger.debug(f"Prefetched {directory} in {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -1,74 +1,1047 @@
 import os
-from typing import List, Dict
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple, Union
 
-from utils.logger import default_logger
-from utils.helpers import get_reference_files
-from core.generator import ContentGenerator
-from config.settings import Settings
+from utils.logger import default_logger, job_log_context
+from core.generator import ContentGenerator, image_size
+from core.breaker import CircuitBreaker, ServiceUnavailableError
+from core.backends import create_generator
+from core.jobs import Job, JobRegistry, CancellationToken, JobCancelledError, job_stage, file_identity
+from core.pool import WorkerPool, RateLimiter
+from core.metrics import ProcessorMetrics
+from core.router import ModelRouter
+from core.budget import TokenBudget, estimate_tokens
+from core.history import GenerationHistory
+from core.batch import BatchEngine
+from core.prefetch import ReferenceCache, Prefetcher
+from config.settings import Settings, IMAGE_EXTENSIONS, DEFAULT_TEXT_MODEL, DEFAULT_IMAGE_MODEL
 
 class FileProcessor:
     """Processes new files based on their extension and settings"""
     
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, generator: ContentGenerator = None):
         """Initialize with settings"""
         self.settings = settings
-        self.generator = ContentGenerator()
+        
+        # One generator per backend, created on first use; an injected generator serves every backend
+        self.generators = {}
+        self._generator_configs = {}
+        self._generators_lock = threading.Lock()
+        self._injected = generator is not None
+        self.generator = generator or self._generator(settings.default_backend)
+        self.breaker = getattr(self.generator, "breaker", None)
+        self.jobs = JobRegistry()
+        self.metrics = ProcessorMetrics()
+        self.router = ModelRouter()
+        self.token_budget = TokenBudget()
+        self.profiler = None
+        self.history = None
+        if settings.history["enabled"]:
+            self.history = GenerationHistory(settings.history["path"], settings.history["max_per_name"])
+        
+        # One worker pool and rate budget per job class, created on first use
+        self.pools = {}
+        self._pool_configs = {}
+        self._retired_pools = []
+        self._limiters = {}
+        self._pools_lock = threading.Lock()
+        
+        # Watcher jobs held for the grouping window, by (directory, backend, model)
+        self._groups = {}
+        self._groups_lock = threading.Lock()
+        
+        # Unfinished jobs by file path, cancelled when their file changes
+        self._active = {}
+        self._active_lock = threading.Lock()
+        
+        # Jobs parked while the API is unavailable
+        self._parked = deque()
+        self._parked_lock = threading.Lock()
+        # Probe job in flight per recovering breaker
+        self._probes = {}
+        self._stopping = threading.Event()
+        self._drain_thread = threading.Thread(target=self._drain_parked, name="newfiles-drain", daemon=True)
+        self._drain_thread.start()
+        
+        # Reference files cached per directory, warmed when a file is created
+        self.references = ReferenceCache(settings.prefetch["reference_cache_directories"])
+        self.prefetcher = None
+        if settings.prefetch["enabled"]:
+            self.prefetcher = Prefetcher(self, settings.prefetch)
+        
+        # Bulk text generation through the provider's batch interface
+        self.batch = None
+        if settings.batch["enabled"]:
+            self.batch = BatchEngine(self)
+    
+    def submit(self, file_path: str, prompt_file: str = None, model: str = None,
+               source: str = "watcher", priority: int = None) -> Job:
+        """
+        Queue a file for processing on the worker pool
+        
+        Args:
+            file_path: Path to the file to generate content for
+            prompt_file: Optional prompt file overriding the extension settings
+            model: Optional model overriding the extension settings
+            source: Where the request came from
+            priority: Worker pool priority (lower runs first, interactive by default)
+            
+        Returns:
+            The queued job
+        """
+        job = Job(file_path, prompt_file=prompt_file, model=model, source=source, priority=priority)
+        self._track(job)
+        
+        # Recurring filenames can be answered from the history without queueing
+        if not self._replay(job):
+            key = self._group_key(job)
+            if key is not None:
+                self._hold(job, key)
+            else:
+                self._enqueue(job)
+        return job
+    
+    def submit_many(self, file_paths: List[str], source: str = "sweep", force_batch: bool = False) -> List[Job]:
+        """
+        Queue a set of files as background jobs
+        
+        Files are queued grouped by directory so requests for the same folder run
+        close together and share their prompt prefix. With the batch engine
+        enabled, large sets of text files go through the provider's batch
+        interface instead of the worker pools.
+        
+        Args:
+            file_paths: Paths to the files to generate content for
+            source: Where the request came from
+            force_batch: Send the text files to the batch engine regardless of the set size
+            
+        Returns:
+            The queued jobs
+        """
+        jobs = []
+        batchable = []
+        for file_path in sorted(file_paths, key=lambda path: (os.path.dirname(path), path)):
+            job = Job(file_path, source=source, interactive=False)
+            self._track(job)
+            if self._replay(job):
+                pass
+            elif self._batchable(file_path):
+                batchable.append(job)
+            else:
+                self._enqueue(job)
+            jobs.append(job)
+        
+        if self.batch is not None and batchable and (force_batch or len(batchable) >= self.settings.batch["min_jobs"]):
+            default_logger.info(f"Sending {len(batchable)} text files to the batch engine")
+            self.batch.submit(batchable)
+        else:
+            for job in batchable:
+                self._enqueue(job)
+        return jobs
     
-    def process_new_file(self, file_path: str):
+    def _batchable(self, file_path: str) -> bool:
+        """
+        Check if a file can go through the batch engine
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            True for text files of the default backend, if that backend supports batches
+        """
+        if os.path.splitext(file_path)[1].lower() in IMAGE_EXTENSIONS:
+            return False
+        backend = self._backend_name(file_path)
+        if backend != self.settings.default_backend:
+            return False
+        return self._injected or self._generator(backend).supports("batch")
+    
+    def track_batch_job(self, file_path: str, identity: Optional[List[int]]) -> Job:
+        """
+        Recreate the job of a file inside a batch resumed from a previous run
+        
+        Args:
+            file_path: Path to the file
+            identity: Identity of the file when the batch was submitted
+            
+        Returns:
+            The running job
+        """
+        job = Job(file_path, source="batch", interactive=False)
+        self._track(job)
+        job.identity = tuple(identity) if identity else None
+        self.jobs.update(job, Job.RUNNING)
+        job.current_stage = "batch"
+        return job
+    
+    def finish_batch_job(self, job: Job, model: Optional[str], content: str = None, error: str = None,
+                         record: bool = True):
+        """
+        Write the result of a batch request and finish its job
+        
+        Args:
+            job: The job
+            model: Model the request was sent to
+            content: Generated content
+            error: Error message if the request failed
+            record: Whether the content is added to the generation history
+        """
+        extension = os.path.splitext(job.file_path)[1].lower()
+        try:
+            if error:
+                raise RuntimeError(error)
+            with job_stage(job, "write"):
+                self._write_owned(job, job.file_path, content)
+            job.model_used = model
+            if self.history and record:
+                self.history.record(job.file_path, content, model=model,
+                                    prompt_tokens=job.prompt_tokens, completion_tokens=job.completion_tokens)
+            self.token_budget.record(extension, estimate_tokens(content))
+            self.jobs.update(job, Job.COMPLETED)
+            self._record_metrics(job, model, extension)
+        except JobCancelledError as e:
+            self._cancel(job, str(e))
+        except Exception as e:
+            default_logger.error(f"Error processing file {job.file_path}: {str(e)}")
+            self.jobs.update(job, Job.FAILED, error=str(e))
+            self._record_metrics(job, model or "unknown", extension)
+        finally:
+            if job.finished:
+                self._untrack(job)
+    
+    def _replay(self, job: Job) -> bool:
+        """
+        Write the best previous generation for the job's exact filename, if allowed
+        
+        The extension's "replay" policy enables this: "exact" replays only, and
+        "refresh" also queues a background generation that replaces the replayed
+        content unless the file changes before it finishes.
+        
+        Args:
+            job: The job to answer
+            
+        Returns:
+            True if the job was completed from the history
+        """
+        if self.history is None or job.model:
+            return False
+        
+        filename = os.path.basename(job.file_path)
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            return False
+        
+        ext_settings = self.settings.get_extension_settings(extension)
+        policy = ext_settings.get("replay")
+        if policy not in ("exact", "refresh"):
+            return False
+        
+        prompt_file = job.prompt_file or ext_settings.get("prompt_file", self.settings.default_text_prompt_file)
+        prompt_hash = GenerationHistory.prompt_hash(prompt_file, ext_settings.get("model", DEFAULT_TEXT_MODEL))
+        entry = self.history.best(filename, prompt_hash)
+        self.metrics.record_cache(entry is not None)
+        if entry is None:
+            return False
+        
+        self.jobs.update(job, Job.RUNNING)
+        with job_log_context(job.id):
+            try:
+                with job_stage(job, "write"):
+                    self._write_owned(job, job.file_path, entry["content"])
+            except JobCancelledError as e:
+                self._cancel(job, str(e))
+                return True
+            except OSError as e:
+                default_logger.error(f"Error replaying content for {filename}: {str(e)}")
+                self.jobs.update(job, Job.FAILED, error=str(e))
+                self._untrack(job)
+                return True
+            
+            job.model_used = entry["model"]
+            job.replayed = True
+            self.jobs.update(job, Job.COMPLETED)
+            self._untrack(job)
+            self._record_metrics(job, "history", extension)
+            default_logger.info(f"Replayed previous generation for: {filename}")
+        
+        if policy == "refresh":
+            refresh = Job(job.file_path, prompt_file=job.prompt_file, source="refresh", interactive=False)
+            self._track(refresh)
+            self._enqueue(refresh)
+        
+        return True
+    
+    def _track(self, job: Job):
+        """Register a job and bind it to the current identity of its file"""
+        job.identity = file_identity(job.file_path)
+        with self._active_lock:
+            self._active.setdefault(job.file_path, set()).add(job)
+        self.jobs.add(job)
+    
+    def _untrack(self, job: Job):
+        """Stop watching the file of a finished job"""
+        with self._active_lock:
+            jobs = self._active.get(job.file_path)
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    del self._active[job.file_path]
+    
+    def file_changed(self, file_path: str):
+        """
+        Cancel the unfinished jobs of a file that was modified, moved away or deleted
+        
+        Writes made by a job rebind it to the new identity of its file, so only
+        outside changes cancel it.
+        
+        Args:
+            file_path: Path reported by a filesystem event
+        """
+        with self._active_lock:
+            jobs = list(self._active.get(file_path, ()))
+        
+        for job in jobs:
+            with job.identity_lock:
+                changed = not job.finished and file_identity(file_path) != job.identity
+            if changed:
+                default_logger.debug(f"Cancelling job {job.id}, its file changed: {file_path}")
+                job.token.cancel(f"File changed: {file_path}")
+    
+    def prefetch(self, file_path: str):
+        """
+        Prepare the context of a file's directory before the file is renamed
+        
+        Args:
+            file_path: Path of a newly created file
+        """
+        if self.prefetcher:
+            self.prefetcher.hint(file_path)
+    
+    def _group_key(self, job: Job) -> Optional[Tuple[str, str, str]]:
+        """
+        Get the key under which a job is generated together with its siblings
+        
+        Args:
+            job: A newly submitted job
+            
+        Returns:
+            Tuple of directory, backend and model, or None if the job is generated on its own
+        """
+        if not self.settings.grouping["enabled"] or job.source != "watcher" or job.prompt_file or job.model:
+            return None
+        
+        extension = os.path.splitext(job.file_path)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            return None
+        ext_settings = self.settings.get_extension_settings(extension)
+        if ext_settings.get("group") is False or ext_settings.get("sections", {}).get("enabled"):
+            return None
+        # The joint prompt replaces the default prompt only; custom and dynamic prompts are kept per file
+        prompt_file = ext_settings.get("prompt_file", self.settings.default_text_prompt_file)
+        if os.path.normpath(prompt_file) != os.path.normpath(self.settings.default_text_prompt_file):
+            return None
+        
+        return (
+            os.path.dirname(os.path.abspath(job.file_path)),
+            self._backend_name(job.file_path),
+            ext_settings.get("model", DEFAULT_TEXT_MODEL)
+        )
+    
+    def _hold(self, job: Job, key: Tuple[str, str, str]):
+        """
+        Hold a job for the grouping window, queueing its group once the window ends or the group is full
+        
+        Args:
+            job: The job to hold
+            key: Its group key
+        """
+        grouping = self.settings.grouping
+        with self._groups_lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = {"jobs": []}
+                group["timer"] = threading.Timer(grouping["window"], self._flush_group, (key, group))
+                group["timer"].daemon = True
+                group["timer"].start()
+                self._groups[key] = group
+            group["jobs"].append(job)
+            full = len(group["jobs"]) >= grouping["max_files"]
+        
+        if full:
+            self._flush_group(key, group)
+    
+    def _flush_group(self, key: Tuple[str, str, str], group: Dict[str, Any]):
+        """
+        Queue a held group, led by its first job if it has more than one
+        
+        Args:
+            key: The group key
+            group: The group, ignored if it was already queued
+        """
+        with self._groups_lock:
+            if self._groups.get(key) is not group:
+                return
+            del self._groups[key]
+        group["timer"].cancel()
+        
+        leader, siblings = group["jobs"][0], group["jobs"][1:]
+        if siblings:
+            leader.siblings = siblings
+            for job in group["jobs"]:
+                job.group = leader.id
+                job.job_class = self._job_class(job.file_path)
+                job.backend = self._backend_name(job.file_path)
+            default_logger.debug(f"Grouped {len(group['jobs'])} files in {key[0]}")
+        self._enqueue(leader)
+    
+    def _enqueue(self, job: Job):
+        """Queue a job on the worker pool of its class under its fairness key"""
+        job.job_class = self._job_class(job.file_path)
+        job.backend = self._backend_name(job.file_path)
+        self._pool(job.job_class).submit(job, job.priority, key=self._fairness_key(job.file_path))
+    
+    def _job_class(self, file_path: str) -> str:
+        """
+        Get the job class of a file, which selects its worker pool
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            The extension's "class" setting, or "image" / "text" by extension
+        """
+        extension = os.path.splitext(file_path)[1].lower()
+        job_class = self.settings.get_extension_settings(extension).get("class")
+        if job_class:
+            return job_class
+        return "image" if extension in IMAGE_EXTENSIONS else "text"
+    
+    def _backend_name(self, file_path: str) -> str:
+        """Get the backend a file is generated with"""
+        return self.backend_for(os.path.splitext(file_path)[1].lower())
+    
+    def backend_for(self, extension: str) -> str:
+        """Get the backend an extension is generated with"""
+        return self.settings.get_extension_settings(extension).get("backend") or self.settings.default_backend
+    
+    def generator_for(self, extension: str) -> ContentGenerator:
+        """
+        Get the generator an extension is generated with
+        
+        Args:
+            extension: File extension
+            
+        Returns:
+            The generator of the extension's backend
+            
+        Raises:
+            ValueError: If the extension names an unknown backend
+        """
+        return self._generator(self.backend_for(extension))
+    
+    def _generator(self, backend: str) -> ContentGenerator:
+        """
+        Get the generator of a backend, creating it on first use
+        
+        Args:
+            backend: Backend name
+            
+        Returns:
+            The backend's generator
+            
+        Raises:
+            ValueError: If no backend of that name is configured
+        """
+        if self._injected:
+            return self.generator
+        
+        with self._generators_lock:
+            generator = self.generators.get(backend)
+            if generator is None:
+                backends = self.settings.backends
+                if backend not in backends:
+                    raise ValueError(f"Unknown backend: {backend}")
+                generator = create_generator(backend, backends[backend], self.settings.circuit_breaker)
+                self.generators[backend] = generator
+                self._generator_configs[backend] = backends[backend]
+            return generator
+    
+    def _pool(self, job_class: str) -> WorkerPool:
+        """
+        Get the worker pool of a job class, creating it on first use
+        
+        Args:
+            job_class: Job class name
+            
+        Returns:
+            The class's worker pool
+        """
+        with self._pools_lock:
+            pool = self.pools.get(job_class)
+            if pool is None:
+                options = self._pool_options(job_class)
+                pool = WorkerPool(
+                    f"newfiles-{job_class}", options["workers"], self._run_job,
+                    max_in_flight_per_key=options["max_in_flight_per_key"]
+                )
+                self.pools[job_class] = pool
+                self._pool_configs[job_class] = options
+                if options.get("rate"):
+                    self._limiters[job_class] = RateLimiter(options["rate"], options.get("burst", 1))
+                else:
+                    self._limiters.pop(job_class, None)
+            return pool
+    
+    def _pool_options(self, job_class: str) -> Dict[str, Any]:
+        """Get the current pool settings of a job class, including the per-directory cap"""
+        options = dict(self.settings.pools.get(job_class, {"workers": 2, "rate": None, "burst": 1}))
+        options["max_in_flight_per_key"] = self.settings.fairness["max_in_flight_per_key"]
+        return options
+    
+    def reconfigure(self):
+        """
+        Apply reloaded settings to the running processor
+        
+        Worker pools whose size, rate budget or per-directory cap changed are
+        retired: they finish the jobs already queued on them while new jobs go
+        to a fresh pool. Everything read per job (extension settings, fairness
+        key, replay policy) takes effect immediately. Backends whose settings
+        changed get a new generator; the clients of the others, the caches,
+        history and metrics are kept.
+        """
+        if self.prefetcher:
+            self.prefetcher.options = self.settings.prefetch
+        
+        # Backends whose settings changed get a new generator (and client) on next use
+        if not self._injected:
+            backends = self.settings.backends
+            with self._generators_lock:
+                for name in [name for name, config in self._generator_configs.items() if backends.get(name) != config]:
+                    del self.generators[name]
+                    del self._generator_configs[name]
+            self.generator = self._generator(self.settings.default_backend)
+            self.breaker = self.generator.breaker
+        
+        retired = []
+        with self._pools_lock:
+            for job_class, pool in list(self.pools.items()):
+                if self._pool_configs.get(job_class) != self._pool_options(job_class):
+                    retired.append(self.pools.pop(job_class))
+            self._retired_pools.extend(retired)
+        for pool in retired:
+            pool.shutdown(wait=False)
+            default_logger.info(f"Retired worker pool {pool.name} after a settings change")
+    
+    def _fairness_key(self, file_path: str) -> str:
+        """
+        Get the key a file is scheduled under
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            Its directory, or with the "subtree" key its folder `depth` levels below the monitored directory
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fairness = self.settings.fairness
+        if fairness["key"] != "subtree":
+            return directory
+        
+        root = os.path.abspath(self.settings.monitored_directory)
+        relative = os.path.relpath(directory, root)
+        if relative == "." or relative.startswith(".."):
+            return directory
+        return os.path.join(root, *relative.split(os.sep)[:fairness["depth"]])
+    
+    @property
+    def parked_count(self) -> int:
+        """Get the number of jobs parked during an API outage"""
+        with self._parked_lock:
+            return len(self._parked)
+    
+    @property
+    def queue_depth(self) -> int:
+        """Get the number of jobs waiting for a worker in all pools"""
+        with self._pools_lock:
+            pools = list(self.pools.values())
+        return sum(pool.queue_depth for pool in pools)
+    
+    @property
+    def in_flight(self) -> int:
+        """Get the number of jobs being processed in all pools"""
+        with self._pools_lock:
+            pools = list(self.pools.values())
+        return sum(pool.in_flight for pool in pools)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get live processor statistics
+        
+        Returns:
+            Metrics snapshot with queue depth, in-flight and parked job counts, overall and per pool
+        """
+        stats = self.metrics.snapshot()
+        with self._pools_lock:
+            pools = dict(self.pools)
+        stats["pools"] = {
+            name: {
+                "workers": pool.workers,
+                "queue_depth": pool.queue_depth,
+                "in_flight": pool.in_flight,
+                "directories": pool.key_stats()
+            }
+            for name, pool in sorted(pools.items())
+        }
+        stats["queue_depth"] = sum(pool["queue_depth"] for pool in stats["pools"].values())
+        stats["in_flight"] = sum(pool["in_flight"] for pool in stats["pools"].values())
+        stats["parked"] = self.parked_count
+        stats["batched"] = self.batch.pending_count if self.batch else 0
+        return stats
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool"""
+        self._stopping.set()
+        with self._groups_lock:
+            groups = list(self._groups.items())
+        for key, group in groups:
+            self._flush_group(key, group)
+        if self.prefetcher:
+            self.prefetcher.stop()
+        if self.batch:
+            self.batch.stop()
+        with self._pools_lock:
+            pools = list(self.pools.values()) + self._retired_pools
+        for pool in pools:
+            pool.shutdown(wait=False)
+        if wait:
+            for pool in pools:
+                pool.shutdown(wait=True)
+        if wait and self.history:
+            self.history.close()
+    
+    def _run_job(self, job: Job):
+        """Worker pool entry point"""
+        # Respect the rate budget of the job's class (a cancellation ends the wait)
+        limiter = self._limiters.get(job.job_class)
+        if limiter is not None:
+            delay = limiter.reserve()
+            if delay > 0:
+                job.token.wait(delay)
+        if job.siblings:
+            self._process_group(job)
+        else:
+            self.process_new_file(job.file_path, job=job)
+    
+    def process_new_file(self, file_path: str, job: Job = None) -> Job:
         """
         Process a newly created file
         
         Args:
             file_path: Path to the newly created file
+            job: Job tracking this request (created if not given)
+            
+        Returns:
+            The job with its final status
         """
+        if job is None:
+            job = Job(file_path)
+            self._track(job)
+        
+        self.jobs.update(job, Job.RUNNING)
+        
+        if self.profiler:
+            self.profiler.job_started(job)
+        
+        with job_log_context(job.id):
+            self._process_job(file_path, job)
+        
+        return job
+    
+    def _process_job(self, file_path: str, job: Job):
+        """
+        Generate content for a job
+        
+        Args:
+            file_path: Path to the file
+            job: Job tracking this request
+        """
+        extension = os.path.splitext(file_path)[1].lower()
+        model = job.model or "unknown"
+        
         try:
+            # The file may have changed while the job was queued
+            job.token.check()
+            
             # Get file information
             filename = os.path.basename(file_path)
             directory = os.path.dirname(file_path)
-            extension = os.path.splitext(filename)[1].lower()
             
             default_logger.info(f"Processing new file: {filename}")
             
             # Get extension-specific settings
-            ext_settings = self.settings.get_extension_settings(extension)
+            ext_settings = dict(self.settings.get_extension_settings(extension))
+            
+            # Apply per-job overrides
+            if job.prompt_file:
+                ext_settings["prompt_file"] = job.prompt_file
+            if job.model:
+                ext_settings["model"] = job.model
+            model = ext_settings.get("model", DEFAULT_TEXT_MODEL)
             
             # Check if this is an image file
-            if extension in ['.png', '.jpg', '.jpeg']:
-                self._process_image_file(file_path, filename, ext_settings)
+            if extension in IMAGE_EXTENSIONS:
+                self._process_image_file(file_path, filename, ext_settings, job)
             else:
                 # Process as text file
-                self._process_text_file(file_path, filename, extension, directory, ext_settings)
-                
+                self._process_text_file(file_path, filename, extension, directory, ext_settings, job)
+            
+            self.jobs.update(job, Job.COMPLETED)
+            self._record_metrics(job, job.model_used or model, extension)
+            
+        except ServiceUnavailableError as e:
+            self._park(job, str(e))
+        except JobCancelledError as e:
+            self._cancel(job, str(e))
         except Exception as e:
             default_logger.error(f"Error processing file {file_path}: {str(e)}")
+            self.jobs.update(job, Job.FAILED, error=str(e))
+            self._record_metrics(job, model, extension)
+        finally:
+            if job.finished:
+                self._untrack(job)
+            if self.profiler:
+                self.profiler.job_finished(job)
+    
+    def _process_group(self, leader: Job):
+        """
+        Generate a group of sibling files with one request
+        
+        Members whose file changed while they were held are cancelled. If the
+        joint response is unusable, the members it has no content for are queued
+        again and generated on their own.
+        
+        Args:
+            leader: First job of the group, carrying the others as siblings
+        """
+        jobs, leader.siblings = [leader] + leader.siblings, []
+        live = []
+        for job in jobs:
+            if job.token.cancelled:
+                self._cancel(job, job.token.reason)
+            else:
+                live.append(job)
+        if len(live) < 2:
+            for job in live:
+                self.process_new_file(job.file_path, job=job)
+            return
+        
+        leader = live[0]
+        for job in live:
+            self.jobs.update(job, Job.RUNNING)
+        if self.profiler:
+            self.profiler.job_started(leader)
+        
+        grouping = self.settings.grouping
+        directory = os.path.dirname(leader.file_path)
+        filenames = [os.path.basename(job.file_path) for job in live]
+        extensions = [os.path.splitext(filename)[1].lower() for filename in filenames]
+        model = self.settings.get_extension_settings(extensions[0]).get("model", DEFAULT_TEXT_MODEL)
+        retry = []
+        
+        with job_log_context(leader.id):
+            try:
+                default_logger.info(f"Processing new files together: {', '.join(filenames)}")
+                generator = self._generator(leader.backend or self.settings.default_backend)
+                
+                # Reference files for "dynamic" filenames, as for single files
+                reference_files = []
+                with job_stage(leader, "references"):
+                    for extension in sorted(set(extensions)):
+                        names = [name for name, ext in zip(filenames, extensions) if ext == extension]
+                        if any("dynamic" in name.lower() for name in names):
+                            reference_files.extend(
+                                reference for reference in self.references.get(directory, extension)
+                                if reference["filename"] not in filenames
+                            )
+                
+                max_tokens = min(
+                    grouping["max_tokens"],
+                    sum(self.token_budget.choose(extension) for extension in extensions)
+                )
+                contents = generator.generate_group_content(
+                    filenames=filenames,
+                    prompt_file=grouping["prompt_file"],
+                    reference_files=reference_files or None,
+                    model=model,
+                    job=leader,
+                    max_tokens=max_tokens
+                )
+                leader.model_used = model
+                
+                for job, filename, extension in zip(live, filenames, extensions):
+                    content = contents.get(filename)
+                    if not content:
+                        retry.append(job)
+                        continue
+                    self._finish_group_member(job, leader, content, model, extension, grouping["prompt_file"])
+                if retry:
+                    default_logger.warning(f"Joint response has no content for {len(retry)} files, generating them on their own")
+            
+            except ServiceUnavailableError as e:
+                for job in live:
+                    self._park(job, str(e))
+            except JobCancelledError as e:
+                # Only the leader's file changed; the others are still wanted
+                self._cancel(leader, str(e))
+                retry = [job for job in live[1:] if not job.finished]
+            except Exception as e:
+                default_logger.warning(f"Joint generation failed, generating the files on their own: {str(e)}")
+                retry = [job for job in live if not job.finished]
+            finally:
+                if self.profiler:
+                    self.profiler.job_finished(leader)
+        
+        for job in retry:
+            job.group = None
+            self.jobs.update(job, Job.QUEUED)
+            self._enqueue(job)
+    
+    def _finish_group_member(self, job: Job, leader: Job, content: str, model: str, extension: str, prompt_file: str):
+        """
+        Write the content a joint request generated for one member of a group
+        
+        Args:
+            job: The member's job
+            leader: Job that made the request and received its token usage
+            content: Generated content of the member's file
+            model: Model of the request
+            extension: Extension of the member's file
+            prompt_file: Group prompt file
+        """
+        try:
+            job.token.check()
+            with job_stage(job, "write"):
+                self._write_owned(job, job.file_path, content)
+        except JobCancelledError as e:
+            self._cancel(job, str(e))
+            return
+        except OSError as e:
+            default_logger.error(f"Error processing file {job.file_path}: {str(e)}")
+            self.jobs.update(job, Job.FAILED, error=str(e))
+            self._record_metrics(job, model, extension)
+            self._untrack(job)
+            return
+        
+        job.model_used = model
+        self.token_budget.record(extension, estimate_tokens(content))
+        if self.history:
+            self.history.record(
+                job.file_path, content,
+                model=model,
+                prompt_hash=GenerationHistory.prompt_hash(prompt_file, model),
+                duration=time.time() - leader.started_at if leader.started_at else None,
+                prompt_tokens=job.prompt_tokens,
+                completion_tokens=job.completion_tokens
+            )
+        self.jobs.update(job, Job.COMPLETED)
+        self._record_metrics(job, model, extension)
+        self._untrack(job)
+        default_logger.info(f"Generated text content for: {os.path.basename(job.file_path)}")
+    
+    def _record_metrics(self, job: Job, model: str, extension: str):
+        """Add a finished job to the metrics"""
+        self.metrics.record_job(
+            model,
+            extension or "(none)",
+            job.finished_at - job.started_at,
+            job.status == Job.COMPLETED,
+            prompt_tokens=job.prompt_tokens,
+            completion_tokens=job.completion_tokens,
+            cached_tokens=job.cached_tokens
+        )
+    
+    def _cancel(self, job: Job, reason: str):
+        """
+        Finish a job whose file changed, dropping its result
+        
+        Args:
+            job: The cancelled job
+            reason: Why it was cancelled
+        """
+        default_logger.info(f"Cancelled generation for {job.file_path}: {reason}")
+        self.jobs.update(job, Job.CANCELLED, error=reason)
+        self._untrack(job)
+        self.metrics.record_cancelled(job.prompt_tokens, job.completion_tokens)
+    
+    def _park(self, job: Job, reason: str):
+        """
+        Park a job until the API is reachable again, leaving its file empty
+        
+        Args:
+            job: The job to park
+            reason: Why the API call failed
+        """
+        default_logger.warning(f"API unavailable, parking {job.file_path}: {reason}")
+        with self._parked_lock:
+            self._parked.append(job)
+        self.jobs.update(job, Job.PARKED)
     
-    def _process_image_file(self, file_path: str, filename: str, settings: Dict[str, str]):
+    def _drain_parked(self):
+        """Resubmit parked jobs at a controlled rate once the API recovers"""
+        interval = 1.0 / max(self.settings.circuit_breaker["drain_rate"], 0.01)
+        
+        while not self._stopping.wait(interval):
+            with self._parked_lock:
+                job, breaker = self._next_parked()
+                if job is None:
+                    continue
+                self._parked.remove(job)
+            
+            if job.token.cancelled:
+                self._cancel(job, job.token.reason)
+                continue
+            
+            # Skip files the user wrote to, renamed or deleted in the meantime (a path
+            # submitted before its file existed is unchanged while it still does not exist)
+            with job.identity_lock:
+                changed = file_identity(job.file_path) != job.identity
+            if changed:
+                default_logger.info(f"Dropping parked job, file changed: {job.file_path}")
+                self.jobs.update(job, Job.FAILED, error="File changed while parked")
+                self._untrack(job)
+                continue
+            
+            # While a breaker is not closed only one probe job may be in flight for it
+            self._probes[breaker] = job if breaker.state != CircuitBreaker.CLOSED else None
+            self.jobs.update(job, Job.QUEUED)
+            self._enqueue(job)
+    
+    def _next_parked(self) -> Tuple[Optional[Job], Optional[CircuitBreaker]]:
+        """
+        Find the oldest parked job whose backend is reachable again (must hold the parked lock)
+        
+        Returns:
+            Tuple of the job and its backend's breaker, or (None, None)
+        """
+        for job in self._parked:
+            try:
+                breaker = getattr(self._generator(job.backend or self.settings.default_backend), "breaker", None)
+            except ValueError:
+                breaker = self.breaker
+            if breaker is None or not breaker.ready():
+                continue
+            probe = self._probes.get(breaker)
+            if breaker.state != CircuitBreaker.CLOSED and probe is not None and probe.status in (Job.QUEUED, Job.RUNNING):
+                continue
+            return job, breaker
+        return None, None
+    
+    def _process_image_file(self, file_path: str, filename: str, settings: Dict[str, Any],
+                            job: Job = None):
         """
         Process an image file by generating content
         
+        With progressive mode enabled, a fast low-quality preview is written first
+        and a full-quality generation is queued at background priority; it
+        atomically replaces the preview unless the file changes in the meantime.
+        
         Args:
             file_path: Path to the file
             filename: Name of the file
             settings: Extension settings
+            job: Job tracking this request
         """
         try:
+            generator = self._generator(self._backend_name(file_path))
+            prompt_file = settings.get("prompt_file", self.settings.default_image_prompt_file)
+            model = settings.get("model", "")
+            # The hosted API only has DALL-E and GPT image models; other backends name their own
+            hosted = generator.backend["type"] == "openai" and not generator.backend["base_url"]
+            if not model or (hosted and not model.startswith(("dall-e", "gpt-image"))):
+                model = DEFAULT_IMAGE_MODEL
+            size = image_size(model, filename, settings.get("size", "1024x1024"))
+            quality = settings.get("quality")
+            
+            progressive = settings.get("progressive", {})
+            upgrade = job is not None and job.source == "upgrade"
+            if progressive.get("enabled") and job is not None and not upgrade:
+                if self._write_image_preview(generator, file_path, filename, prompt_file, progressive, model, size, job):
+                    return
+            
             # Generate image content
-            image_bytes = self.generator.generate_image_content(
+            image_bytes = generator.generate_image_content(
                 filename=filename,
-                prompt_file=settings.get("prompt_file", self.settings.default_image_prompt_file)
+                prompt_file=prompt_file,
+                job=job,
+                model=model,
+                size=size,
+                quality=quality
             )
+            if job:
+                job.model_used = model
             
             # Write the generated image to the file
-            with open(file_path, "wb") as f:
-                f.write(image_bytes)
+            with job_stage(job, "write"):
+                self._write_owned(job, file_path, image_bytes)
             
             default_logger.info(f"Generated image content for: {filename}")
             
+        except JobCancelledError:
+            # Logged once, at INFO, when the job is cancelled
+            raise
         except Exception as e:
             default_logger.error(f"Error processing image file {filename}: {str(e)}")
+            raise
+    
+    def _write_image_preview(self, generator: ContentGenerator, file_path: str, filename: str, prompt_file: str,
+                             progressive: Dict[str, Any], model: str, size: str, job: Job) -> bool:
+        """
+        Write a low-quality preview image and queue the full-quality generation
+        
+        Args:
+            generator: Generator of the file's backend
+            file_path: Path to the file
+            filename: Name of the file
+            prompt_file: Image prompt file
+            progressive: Progressive mode settings
+            model: Model of the full-quality pass
+            size: Size of the full-quality pass
+            job: Job tracking this request
+            
+        Returns:
+            True if the preview was written, False to generate at full quality right away
+        """
+        preview_model = progressive.get("model") or model
+        try:
+            preview = generator.generate_image_content(
+                filename=filename,
+                prompt_file=prompt_file,
+                job=job,
+                model=preview_model,
+                size=progressive.get("size") or image_size(preview_model, filename, size),
+                quality=progressive.get("quality", "low" if preview_model.startswith("gpt-image") else None)
+            )
+        except (ServiceUnavailableError, JobCancelledError):
+            raise
+        except Exception as e:
+            default_logger.warning(f"Preview for {filename} failed, generating full quality: {str(e)}")
+            return False
+        
+        with job_stage(job, "write"):
+            self._write_owned(job, file_path, preview)
+        job.model_used = preview_model
+        default_logger.info(f"Generated image preview for: {filename}")
+        
+        upgrade = Job(file_path, prompt_file=job.prompt_file, model=job.model, source="upgrade",
+                      interactive=False)
+        self._track(upgrade)
+        self._enqueue(upgrade)
+        return True
     
     def _process_text_file(self, file_path: str, filename: str, extension: str, 
-                          directory: str, settings: Dict[str, str]):
+                          directory: str, settings: Dict[str, str], job: Job = None):
         """
         Process a text file by generating content
         
@@ -78,7 +1051,17 @@ class FileProcessor:
             extension: File extension
             directory: Directory containing the file
             settings: Extension settings
+            job: Job tracking this request
         """
+        # Whether finished sections were written to the file before the document was complete
+        partial = False
+        
+        def write_prefix(prefix: str):
+            """Write the finished sections so far"""
+            nonlocal partial
+            self._write_owned(job, file_path, prefix)
+            partial = True
+        
         try:
             # For dynamic prompts, get reference files
             reference_files = None
@@ -86,25 +1069,157 @@ class FileProcessor:
             
             # Check if we should use dynamic prompting (based on filename convention)
             if "dynamic" in prompt_file.lower() or "dynamic" in filename.lower():
-                reference_files = get_reference_files(directory, extension, filename)
+                with job_stage(job, "references"):
+                    reference_files = self.references.get(directory, extension, filename)
             
-            # Get model from settings
-            model = settings.get("model", "gpt-4.1-nano")
+            generator = self._generator(self._backend_name(file_path))
             
-            # Generate text content
-            content = self.generator.generate_text_content(
-                filename=filename,
-                extension=extension,
-                prompt_file=prompt_file,
-                reference_files=reference_files,
-                model=model
+            # Candidate models: a per-job model override wins over the routed list
+            model = settings.get("model", DEFAULT_TEXT_MODEL)
+            candidates = [model] if job and job.model else settings.get("models") or [model]
+            
+            # Output budget: fixed per extension, or sized from previous outputs
+            max_tokens = settings.get("max_tokens") or self.token_budget.choose(extension, reference_files)
+            
+            # Generate text content, outline-then-sections for large files if enabled
+            sections = settings.get("sections", {})
+            refresh = job is not None and job.source == "refresh"
+            
+            def generate(candidate: str, cancel: Optional[CancellationToken]) -> str:
+                """Generate the file content with one candidate model (cancel aborts a losing hedged request)"""
+                if sections.get("enabled"):
+                    return generator.generate_sectioned_content(
+                        filename=filename,
+                        extension=extension,
+                        prompt_file=prompt_file,
+                        reference_files=reference_files,
+                        model=candidate,
+                        job=job,
+                        options=sections,
+                        on_prefix=None if refresh else write_prefix
+                    )
+                return generator.generate_text_content(
+                    filename=filename,
+                    extension=extension,
+                    prompt_file=prompt_file,
+                    reference_files=reference_files,
+                    model=candidate,
+                    job=job,
+                    max_tokens=max_tokens,
+                    max_continuations=settings.get("max_continuations", 2),
+                    cancel=cancel
+                )
+            
+            # Hedge only interactive single-request jobs (sections stream into the file)
+            hedge_after = settings.get("hedge_after")
+            if sections.get("enabled") or (job and not job.interactive):
+                hedge_after = None
+            
+            model, content = self.router.run(
+                candidates, generate,
+                slo=settings.get("latency_slo"),
+                hedge_after=hedge_after
             )
+            if job:
+                job.model_used = model
+            self.token_budget.record(extension, estimate_tokens(content))
+            duration = time.time() - job.started_at if job and job.started_at else None
             
             # Write the generated content to the file
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(content)
+            with job_stage(job, "write"):
+                self._write_owned(job, file_path, content)
+            
+            # Only content that reached the file is offered for replay
+            if self.history:
+                self.history.record(
+                    file_path, content,
+                    model=model,
+                    prompt_hash=GenerationHistory.prompt_hash(prompt_file, model),
+                    duration=duration,
+                    prompt_tokens=job.prompt_tokens if job else 0,
+                    completion_tokens=job.completion_tokens if job else 0
+                )
             
             default_logger.info(f"Generated text content for: {filename}")
             
+        except JobCancelledError:
+            # Logged once, at INFO, when the job is cancelled
+            raise
         except Exception as e:
             default_logger.error(f"Error processing text file {filename}: {str(e)}")
+            # Failed and parked files are left empty, not with part of a document
+            if partial:
+                self._clear_owned(job, file_path)
+            raise
+    
+    def _write_owned(self, job: Optional[Job], file_path: str, content: Union[str, bytes]):
+        """
+        Write a job's result unless its file changed since the job last saw it
+        
+        Args:
+            job: Job writing the content (None writes unconditionally)
+            file_path: Path to the file
+            content: Text, or bytes replaced atomically
+            
+        Raises:
+            JobCancelledError: If the job was cancelled or the file changed
+        """
+        write = self._write_bytes if isinstance(content, bytes) else self._write_text
+        if job is None:
+            write(file_path, content)
+            return
+        
+        with job.identity_lock:
+            if file_identity(file_path) != job.identity:
+                job.token.cancel(f"File changed: {file_path}")
+            job.token.check()
+            write(file_path, content)
+            # Our own write must not cancel the job
+            job.identity = file_identity(file_path)
+    
+    def _clear_owned(self, job: Job, file_path: str):
+        """
+        Empty a file a job partially wrote, unless it changed since the job's last write
+        
+        Args:
+            job: Job that wrote to the file
+            file_path: Path to the file
+        """
+        with job.identity_lock:
+            if file_identity(file_path) != job.identity:
+                return
+            try:
+                self._write_text(file_path, "")
+            except OSError as e:
+                default_logger.error(f"Error emptying {file_path}: {str(e)}")
+                return
+            job.identity = file_identity(file_path)
+    
+    def _write_text(self, file_path: str, content: str):
+        """
+        Write text content to a file
+        
+        Args:
+            file_path: Path to the file
+            content: Content to write
+        """
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(content)
+    
+    def _write_bytes(self, file_path: str, data: bytes):
+        """
+        Atomically replace a file with binary content
+        
+        Args:
+            file_path: Path to the file
+            data: Content to write
+        """
+        directory, name = os.path.split(file_path)
+        temp_path = os.path.join(directory, f".{name}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, List, Optional, Tuple
+
+from utils.logger import default_logger
+from core.breaker import ServiceUnavailableError
+from core.jobs import CancellationToken, JobCancelledError
+from core.metrics import percentile
+
+class ModelRouter:
+    """
+    Routes requests to the fastest healthy model among an ordered list of candidates
+
+    Rolling latency and error rate are tracked per model. A candidate is healthy
+    while its p95 latency is within the SLO and its error rate is below the limit.
+    Samples expire after max_age seconds, so a model demoted after a bad patch
+    is trusted again once its old samples are gone. Interactive requests can be
+    hedged: if the first model has not answered after a delay, the next
+    candidate is called too, the first answer wins and the other requests are
+    cancelled.
+    """
+
+    def __init__(self, window: int = 100, max_error_rate: float = 0.5, min_samples: int = 3,
+                 max_workers: int = 16, max_age: float = 600.0):
+        """
+        Initialize the router
+
+        Args:
+            window: Number of recent requests tracked per model
+            max_error_rate: Error rate above which a model is unhealthy
+            min_samples: Samples needed before a model's statistics are trusted
+            max_workers: Maximum number of concurrent hedged requests
+            max_age: Seconds after which a sample no longer counts
+        """
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.max_age = max_age
+        self._history = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="newfiles-hedge")
+
+    def record(self, model: str, latency: float, ok: bool):
+        """Record the outcome of a request"""
+        with self._lock:
+            self._history[model].append((time.monotonic(), latency, ok))
+
+    def health(self, model: str) -> Tuple[Optional[float], float, int]:
+        """
+        Get the rolling statistics of a model from its samples of the last max_age seconds
+
+        Returns:
+            Tuple of p95 latency of successful requests (None if unknown), error rate and sample count
+        """
+        oldest = time.monotonic() - self.max_age
+        with self._lock:
+            samples = [(latency, ok) for at, latency, ok in self._history.get(model, ()) if at >= oldest]
+        if not samples:
+            return None, 0.0, 0
+        latencies = [latency for latency, ok in samples if ok]
+        error_rate = 1.0 - len(latencies) / len(samples)
+        return percentile(latencies, 0.95), error_rate, len(samples)
+
+    def order(self, candidates: List[str], slo: float = None) -> List[str]:
+        """
+        Order candidates from most to least preferred
+
+        Args:
+            candidates: Models in configured order
+            slo: Target p95 latency in seconds
+
+        Returns:
+            Healthy models by p95 latency (unknown ones by configured order), then unhealthy ones
+        """
+        healthy = []
+        unhealthy = []
+        for position, model in enumerate(candidates):
+            p95, error_rate, samples = self.health(model)
+            if samples >= self.min_samples and (
+                    error_rate > self.max_error_rate or (slo and p95 is not None and p95 > slo)):
+                # A model whose requests all failed has no latency yet
+                unhealthy.append(((error_rate, p95 if p95 is not None else float("inf")), model))
+            elif samples < self.min_samples or p95 is None:
+                key = (slo if slo else 0.0, position)
+                healthy.append((key, model))
+            else:
+                healthy.append(((p95, position), model))
+
+        return [model for _, model in sorted(healthy)] + [model for _, model in sorted(unhealthy)]
+
+    def run(self, candidates: List[str], request: Callable[[str, Optional[CancellationToken]], Any],
+            slo: float = None, hedge_after: float = None) -> Tuple[str, Any]:
+        """
+        Run a request on the best candidate, hedging and falling back as needed
+
+        Args:
+            candidates: Models in configured order
+            request: Function called with a model name and a token that is cancelled when another
+                     hedged request answered first (None if not hedged), returning the result
+            slo: Target p95 latency in seconds
+            hedge_after: Delay in seconds before a hedged request is sent (None disables hedging)
+
+        Returns:
+            Tuple of the model that answered and its result
+        """
+        order = self.order(candidates, slo)
+        if len(order) > 1:
+            default_logger.debug(f"Model routing order: {', '.join(order)}")
+
+        if hedge_after is None or len(order) < 2:
+            return self._run_sequential(order, request)
+
+        # Future -> (model, token cancelling the request)
+        pending = {}
+
+        def send(model: str):
+            """Start a request on a candidate"""
+            token = CancellationToken()
+            pending[self._executor.submit(self._timed, model, request, token)] = (model, token)
+
+        send(order[0])
+        remaining = order[1:]
+        done, _ = wait(pending, timeout=hedge_after)
+
+        last_error = None
+        try:
+            while pending:
+                if not done:
+                    # No answer yet: hedge with the next candidate
+                    if remaining:
+                        model = remaining.pop(0)
+                        default_logger.info(f"Hedging request with {model} after {hedge_after}s")
+                        send(model)
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    continue
+
+                for future in done:
+                    model, _ = pending.pop(future)
+                    try:
+                        return model, future.result()
+                    except (ServiceUnavailableError, JobCancelledError):
+                        raise
+                    except Exception as e:
+                        last_error = e
+                        # Fall back to the next candidate immediately
+                        if remaining:
+                            send(remaining.pop(0))
+                done = set()
+                if pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        finally:
+            # The requests that lost are aborted instead of running to completion
+            for model, token in pending.values():
+                token.cancel(f"Request to {model} lost the hedge")
+
+        raise last_error
+
+    def _run_sequential(self, order: List[str],
+                        request: Callable[[str, Optional[CancellationToken]], Any]) -> Tuple[str, Any]:
+        """Try candidates one after another until one succeeds"""
+        last_error = None
+        for model in order:
+            try:
+                return model, self._timed(model, request, None)
+            except (ServiceUnavailableError, JobCancelledError):
+                raise
+            except Exception as e:
+                default_logger.warning(f"Model {model} failed, trying next candidate: {str(e)}")
+                last_error = e
+        raise last_error
+
+    def _timed(self, model: str, request: Callable[[str, Optional[CancellationToken]], Any],
+               token: Optional[CancellationToken]) -> Any:
+        """Call the request and record its latency and outcome"""
+        started = time.monotonic()
+        try:
+            result = request(model, token)
+        except (ServiceUnavailableError, JobCancelledError):
+            # Outages are handled by the circuit breaker and cancellations are not the model's fault
+            raise
+        except Exception:
+            self.record(model, time.monotonic() - started, False)
+            raise
+        self.record(model, time.monotonic() - started, True)
+        return result
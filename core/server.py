@@ -0,0 +1,421 @@
+import json
+import math
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from utils.logger import default_logger
+from config.settings import Settings, DEFAULT_TEXT_MODEL
+from core.processor import FileProcessor
+
+# Upper bound for long-poll and event stream waits
+MAX_WAIT_SECONDS = 60.0
+
+# Directory that API-submitted prompt files must resolve into
+PROMPTS_DIRECTORY = "prompts"
+
+# Hosts a browser Origin may name (anything else is a cross-site request)
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+class _QueryError(ValueError):
+    """Raised for an invalid query string value"""
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler exposing the file processor
+
+    Endpoints:
+        POST /jobs            Submit a job ({"path": ...}) or a batch ({"jobs": [...]})
+        GET  /jobs            List recent jobs (?status=...&limit=...)
+        GET  /jobs/<id>       Get a job, optionally long-polling with ?wait=<seconds>
+        GET  /events          Server-sent events stream of job updates (?since=<sequence>)
+        GET  /stats           Live processor statistics
+    """
+
+    server_version = "Newfiles"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """Handle GET requests"""
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+
+        try:
+            self._dispatch_get(url.path, parts, query)
+        except _QueryError as e:
+            self._send_json(400, {"error": str(e)})
+
+    def _dispatch_get(self, path: str, parts: list, query: Dict[str, list]):
+        """
+        Answer a GET request
+
+        Args:
+            path: Request path
+            parts: Non-empty segments of the path
+            query: Parsed query string
+
+        Raises:
+            _QueryError: If a query string value is invalid (before anything is sent)
+        """
+        if parts == ["jobs"]:
+            status = self._query_value(query, "status")
+            limit = self._query_number(query, "limit", 100, int)
+            jobs = self.server.processor.jobs.list(status=status, limit=limit)
+            self._send_json(200, {"jobs": [job.to_dict() for job in jobs]})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            wait = min(self._query_number(query, "wait", 0.0, float), MAX_WAIT_SECONDS)
+            if wait > 0:
+                job = self.server.processor.jobs.wait(parts[1], wait)
+            else:
+                job = self.server.processor.jobs.get(parts[1])
+            if job is None:
+                self._send_json(404, {"error": f"Unknown job: {parts[1]}"})
+            else:
+                self._send_json(200, job.to_dict())
+        elif parts == ["stats"]:
+            self._send_json(200, self.server.processor.stats())
+        elif parts == ["events"]:
+            self._stream_events(self._query_number(query, "since", -1, int, minimum=-1))
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {path}"})
+
+    def do_POST(self):
+        """Handle POST requests"""
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": f"Unknown endpoint: {url.path}"})
+            return
+
+        error = self.server.validate_headers(self.headers)
+        if error:
+            status, message = error
+            self._send_json(status, {"error": message})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON body: {str(e)}"})
+            return
+
+        if isinstance(body, dict) and "jobs" in body:
+            requests = body["jobs"]
+            batch = True
+        else:
+            requests = [body]
+            batch = False
+
+        if not isinstance(requests, list) or not all(isinstance(r, dict) for r in requests):
+            self._send_json(400, {"error": "Expected a job object or {\"jobs\": [...]}"})
+            return
+
+        # Validate the whole batch before queueing anything
+        for request in requests:
+            error = self.server.validate_path(request.get("path")) or self.server.validate_overrides(request)
+            if error:
+                status, message = error
+                self._send_json(status, {"error": message, "path": request.get("path")})
+                return
+
+        jobs = [
+            self.server.processor.submit(
+                os.path.abspath(request["path"]),
+                prompt_file=request.get("prompt_file"),
+                model=request.get("model"),
+                source="api"
+            )
+            for request in requests
+        ]
+
+        if batch:
+            self._send_json(202, {"jobs": [job.to_dict() for job in jobs]})
+        else:
+            self._send_json(202, jobs[0].to_dict())
+
+    def _stream_events(self, since: int):
+        """Send job updates as server-sent events until the client disconnects"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        registry = self.server.processor.jobs
+        sequence = since if since >= 0 else registry.sequence
+        try:
+            while not self.server.stopping.is_set():
+                sequence, events = registry.events_since(sequence, timeout=15.0)
+                if not events:
+                    # Keep-alive comment so dead clients are detected
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    payload = json.dumps(event)
+                    self.wfile.write(f"id: {event['sequence']}\nevent: job\ndata: {payload}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        """Send a JSON response"""
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _query_value(self, query: Dict[str, list], name: str, default: str = None) -> Optional[str]:
+        """Get a single query string value"""
+        values = query.get(name)
+        return values[0] if values else default
+
+    def _query_number(self, query: Dict[str, list], name: str, default, number_type: type, minimum: int = 0):
+        """
+        Get a numeric query string value
+
+        Args:
+            query: Parsed query string
+            name: Parameter name
+            default: Value if the parameter is missing
+            number_type: int or float
+            minimum: Smallest accepted value
+
+        Returns:
+            The value
+
+        Raises:
+            _QueryError: If the value is not a finite number of that type, or below the minimum
+        """
+        value = self._query_value(query, name)
+        if value is None:
+            return default
+        try:
+            number = number_type(value)
+        except ValueError:
+            raise _QueryError(f"Invalid '{name}': {value}") from None
+        if not math.isfinite(number) or number < minimum:
+            raise _QueryError(f"Invalid '{name}': {value}")
+        return number
+
+    def address_string(self) -> str:
+        """Get the client address (Unix sockets have no host)"""
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return "unix"
+
+    def log_message(self, format, *args):
+        """Route access logs to the application logger"""
+        default_logger.debug(f"API {self.address_string()} - {format % args}")
+
+class _ApiServerMixin:
+    """Shared state for the TCP and Unix socket servers"""
+
+    daemon_threads = True
+
+    def setup_api(self, processor: FileProcessor, settings: Settings):
+        """Attach the processor and settings to the server"""
+        self.processor = processor
+        self.settings = settings
+        self.stopping = threading.Event()
+
+    def validate_headers(self, headers) -> Optional[Tuple[int, str]]:
+        """
+        Check that a POST request comes from a local client and not a web page
+
+        Browsers can send cross-site form posts to localhost without a preflight, but only with
+        a form content type and always with their Origin, so both are checked. When a token is
+        configured it must be sent as a bearer token.
+
+        Args:
+            headers: Request headers
+
+        Returns:
+            Tuple of HTTP status and error message, or None if the request is accepted
+        """
+        token = self.settings.api_server.get("token")
+        if token and headers.get("Authorization", "") != f"Bearer {token}":
+            return 401, "Missing or invalid token"
+
+        content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            return 415, "Content-Type must be application/json"
+
+        origin = headers.get("Origin")
+        if origin is not None:
+            url = urlparse(origin)
+            hosts = LOCAL_HOSTS + (self.settings.api_server["host"],)
+            try:
+                port = url.port
+            except ValueError:
+                port = None
+            # Browsers cannot reach a Unix socket, so an Origin there is always foreign
+            same_port = isinstance(self.server_address, tuple) and port == self.server_address[1]
+            if url.hostname not in hosts or not same_port:
+                return 403, f"Cross-origin requests are not allowed: {origin}"
+
+        return None
+
+    def validate_overrides(self, request: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+        """
+        Check the optional prompt file and model of a submitted job
+
+        A prompt file must be one of the configured prompts or lie inside the prompts directory,
+        so a request cannot send arbitrary local files to the provider. A model must be one the
+        configuration already uses, or one listed in api_server.models.
+
+        Args:
+            request: Job object from the request body
+
+        Returns:
+            Tuple of HTTP status and error message, or None if the overrides are valid
+        """
+        prompt_file = request.get("prompt_file")
+        if prompt_file is not None:
+            if not isinstance(prompt_file, str) or not prompt_file:
+                return 400, "Invalid 'prompt_file'"
+            if os.path.normpath(prompt_file) not in self._configured_prompts():
+                root = os.path.realpath(PROMPTS_DIRECTORY)
+                real_path = os.path.realpath(prompt_file)
+                try:
+                    inside = os.path.commonpath([root, real_path]) == root
+                except ValueError:
+                    inside = False
+                if not inside:
+                    return 400, f"Prompt file is not a configured prompt: {prompt_file}"
+            if not os.path.isfile(prompt_file):
+                return 400, f"Prompt file does not exist: {prompt_file}"
+
+        model = request.get("model")
+        if model is not None:
+            if not isinstance(model, str) or model not in self._configured_models():
+                return 400, f"Model is not configured: {model}"
+
+        return None
+
+    def _configured_prompts(self) -> set:
+        """Get the normalized paths of all prompt files named in the configuration"""
+        prompts = {
+            self.settings.default_text_prompt_file,
+            self.settings.default_image_prompt_file,
+            self.settings.grouping["prompt_file"]
+        }
+        for ext_settings in self.settings.extension_settings.values():
+            if ext_settings.get("prompt_file"):
+                prompts.add(ext_settings["prompt_file"])
+        return {os.path.normpath(prompt) for prompt in prompts}
+
+    def _configured_models(self) -> set:
+        """Get all models named in the configuration"""
+        models = {DEFAULT_TEXT_MODEL}
+        models.update(self.settings.api_server.get("models") or [])
+        for ext_settings in self.settings.extension_settings.values():
+            if ext_settings.get("model"):
+                models.add(ext_settings["model"])
+            models.update(ext_settings.get("models") or [])
+            progressive = ext_settings.get("progressive") or {}
+            if progressive.get("model"):
+                models.add(progressive["model"])
+        return models
+
+    def validate_path(self, path: Any) -> Optional[Tuple[int, str]]:
+        """
+        Check that a submitted path can be processed
+
+        Only new or empty files are accepted, so a job never overwrites content.
+
+        Args:
+            path: Path from the request body
+
+        Returns:
+            Tuple of HTTP status and error message, or None if the path is valid
+        """
+        if not isinstance(path, str) or not path:
+            return 400, "Missing 'path'"
+
+        path = os.path.abspath(path)
+        if not os.path.isdir(os.path.dirname(path)):
+            return 400, "Parent directory does not exist"
+        if os.path.isdir(path):
+            return 400, "Path is a directory"
+
+        if self.settings.api_server["restrict_to_monitored_directory"]:
+            # Resolve symlinks, so a link inside the root cannot point outside it
+            root = os.path.realpath(self.settings.monitored_directory)
+            real_path = os.path.realpath(path)
+            try:
+                inside = os.path.commonpath([root, real_path]) == root
+            except ValueError:
+                # Different drives on Windows
+                inside = False
+            if not inside:
+                return 400, "Path is outside the monitored directory"
+
+        try:
+            if os.path.getsize(path) > 0:
+                return 409, "File is not empty"
+        except OSError:
+            # A new file
+            pass
+
+        return None
+
+class _TcpApiServer(_ApiServerMixin, ThreadingHTTPServer):
+    """API server listening on a TCP port"""
+
+class _UnixApiServer(_ApiServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """API server listening on a Unix domain socket"""
+
+class ApiServer:
+    """Local HTTP/Unix-socket API for submitting and tracking generation jobs"""
+
+    def __init__(self, settings: Settings, processor: FileProcessor):
+        """Initialize with settings and processor"""
+        self.settings = settings
+        self.processor = processor
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Start serving requests in a background thread"""
+        config = self.settings.api_server
+        unix_socket = config.get("unix_socket")
+
+        if unix_socket:
+            if not hasattr(socket, "AF_UNIX"):
+                raise RuntimeError("Unix sockets are not supported on this platform")
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self._server = _UnixApiServer(unix_socket, ApiRequestHandler)
+            address = unix_socket
+        else:
+            self._server = _TcpApiServer((config["host"], config["port"]), ApiRequestHandler)
+            address = f"http://{config['host']}:{self._server.server_address[1]}"
+
+        self._server.setup_api(self.processor, self.settings)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="newfiles-api", daemon=True)
+        self._thread.start()
+        default_logger.info(f"API server listening on {address}")
+
+    def stop(self):
+        """Stop the server"""
+        if self._server is None:
+            return
+
+        self._server.stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+        unix_socket = self.settings.api_server.get("unix_socket")
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+        self._server = None
+        default_logger.info("API server stopped")
@@ -0,0 +1,421 @@
+"""
+Filesystem event trace recorder and replay harness
+
+Record the raw watchdog event stream of a directory:
+    python -m core.trace record <directory> <trace_file> [--no-recursive]
+
+Replay a trace in a scratch directory against a mock generator:
+    python -m core.trace replay <trace_file> [--speed 10] [--scratch DIR] [--latency 0.2]
+
+Traces are JSON lines: a header object followed by one compact array per event
+    [seconds_since_start, event_type, src_path, dest_path, is_directory, size]
+with paths relative to the recorded directory. Files ending in .gz are gzip compressed.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from utils.logger import default_logger
+from config.settings import Settings, DEFAULT_TEXT_MODEL, DEFAULT_IMAGE_MODEL
+from core.jobs import job_stage
+from core.prefetch import TemplateCache
+
+TRACE_VERSION = 1
+
+# Event types that change the filesystem and can be replayed
+REPLAYED_EVENTS = ("created", "modified", "moved", "deleted")
+
+def _open_trace(path: str, mode: str):
+    """Open a trace file, using gzip for .gz files"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def read_trace(path: str) -> Iterator[List[Any]]:
+    """
+    Read the events of a trace file
+
+    Args:
+        path: Path to the trace file
+
+    Returns:
+        Iterator over event arrays (the header is skipped)
+    """
+    with _open_trace(path, "r") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version: {header.get('version')}")
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+class TraceRecorder(FileSystemEventHandler):
+    """Writes every watchdog event below a root directory to a trace file"""
+
+    def __init__(self, root: str, trace_file: str):
+        """
+        Initialize the recorder
+
+        Args:
+            root: Directory being recorded
+            trace_file: Path of the trace file to write
+        """
+        self.root = os.path.abspath(root)
+        self.trace_file = trace_file
+        self.events = 0
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._file = _open_trace(trace_file, "w")
+        self._file.write(json.dumps({
+            "version": TRACE_VERSION,
+            "root": self.root,
+            "started_at": time.time()
+        }) + "\n")
+
+    def on_any_event(self, event):
+        """Record a single event"""
+        dest_path = getattr(event, "dest_path", "") or ""
+        record = [
+            round(time.monotonic() - self._start, 4),
+            event.event_type,
+            self._relative(event.src_path),
+            self._relative(dest_path) if dest_path else None,
+            1 if event.is_directory else 0,
+            self._size(dest_path or event.src_path)
+        ]
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self.events += 1
+
+    def close(self):
+        """Flush and close the trace file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _relative(self, path) -> str:
+        """Get a path relative to the recorded root"""
+        if isinstance(path, bytes):
+            path = os.fsdecode(path)
+        return os.path.relpath(path, self.root)
+
+    def _size(self, path) -> int:
+        """Get the size of a file, or -1 if it cannot be read"""
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return -1
+
+class MockGenerator:
+    """Stand-in for ContentGenerator that sleeps instead of calling the API"""
+
+    def __init__(self, latency: float = 0.2):
+        """
+        Initialize the mock generator
+
+        Args:
+            latency: Simulated generation time in seconds
+        """
+        self.latency = latency
+        self.calls = 0
+        self.name = "mock"
+        # Advertise every capability, so all code paths of the processor are exercised
+        self.backend = {"type": "mock", "base_url": None, "api_key_env": None,
+                        "streaming": True, "images": True, "batch": True}
+        self.templates = TemplateCache()
+        self._lock = threading.Lock()
+
+    def supports(self, capability: str) -> bool:
+        """Check a capability of the mock backend"""
+        return bool(self.backend.get(capability))
+
+    def generate_text_content(self, filename: str, extension: str, prompt_file: str,
+                              reference_files: list = None, model: str = DEFAULT_TEXT_MODEL,
+                              job=None, max_tokens: int = 1000, max_continuations: int = 0,
+                              cancel=None) -> str:
+        """Return placeholder text after the simulated latency"""
+        self._count()
+        with job_stage(job, "api"):
+            self._wait(job)
+        return f"Mock content for {filename}"
+
+    def generate_sectioned_content(self, filename: str, extension: str, prompt_file: str,
+                                   reference_files: list = None, model: str = DEFAULT_TEXT_MODEL,
+                                   job=None, options: Dict[str, Any] = None,
+                                   on_prefix: Callable[[str], None] = None) -> str:
+        """Return two placeholder sections, reporting the first as a completed prefix"""
+        self._count()
+        first = f"Mock section 1 for {filename}"
+        with job_stage(job, "api"):
+            self._wait(job)
+            if on_prefix:
+                on_prefix(first)
+        return f"{first}\n\nMock section 2 for {filename}"
+
+    def generate_group_content(self, filenames: List[str], prompt_file: str, reference_files: list = None,
+                               model: str = DEFAULT_TEXT_MODEL, job=None, max_tokens: int = 4000) -> Dict[str, str]:
+        """Return placeholder text for every file after the simulated latency"""
+        self._count()
+        with job_stage(job, "api"):
+            self._wait(job)
+        return {filename: f"Mock content for {filename}" for filename in filenames}
+
+    def build_text_request(self, filename: str, prompt_file: str, reference_files: list = None,
+                           model: str = DEFAULT_TEXT_MODEL, max_tokens: int = 1000) -> Dict[str, Any]:
+        """Return a placeholder request body for the batch engine"""
+        return {
+            "model": model,
+            "messages": [{"role": "user", "content": f"Mock prompt for {filename}"}],
+            "max_tokens": max_tokens
+        }
+
+    def generate_image_content(self, filename: str, prompt_file: str, job=None,
+                               model: str = DEFAULT_IMAGE_MODEL, size: str = "1024x1024",
+                               quality: str = None) -> bytes:
+        """Return placeholder image bytes after the simulated latency"""
+        self._count()
+        with job_stage(job, "api"):
+            self._wait(job)
+        return b"\x89PNG\r\n\x1a\n"
+
+    def warm_connection(self, interval: float = 60.0):
+        """Nothing to connect to"""
+
+    def _wait(self, job=None):
+        """Sleep for the simulated latency, stopping early if the job is cancelled"""
+        if job is None:
+            time.sleep(self.latency)
+            return
+        job.token.wait(self.latency)
+        job.token.check()
+
+    def _count(self):
+        """Increment the call counter"""
+        with self._lock:
+            self.calls += 1
+
+class TraceReplayer:
+    """Recreates the filesystem operations of a trace inside a scratch directory"""
+
+    def __init__(self, trace_file: str, scratch_dir: str, speed: float = 1.0):
+        """
+        Initialize the replayer
+
+        Args:
+            trace_file: Path to the trace file
+            scratch_dir: Directory where the operations are recreated
+            speed: Time scale factor (1 = real time, 10 = ten times faster, 0 = as fast as possible)
+        """
+        self.trace_file = trace_file
+        self.scratch_dir = os.path.abspath(scratch_dir)
+        self.speed = speed
+        self.replayed = 0
+        self.skipped = 0
+
+    def replay(self):
+        """Replay all events of the trace"""
+        start = time.monotonic()
+        for timestamp, event_type, src, dest, is_directory, size in read_trace(self.trace_file):
+            if event_type not in REPLAYED_EVENTS:
+                continue
+
+            if self.speed > 0:
+                delay = timestamp / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            try:
+                self._apply(event_type, src, dest, bool(is_directory), size)
+                self.replayed += 1
+            except OSError as e:
+                self.skipped += 1
+                default_logger.debug(f"Skipped trace event {event_type} {src}: {str(e)}")
+
+    def _apply(self, event_type: str, src: str, dest: Optional[str], is_directory: bool, size: int):
+        """Apply a single event to the scratch directory"""
+        src_path = self._path(src)
+
+        if event_type == "created":
+            if is_directory:
+                os.makedirs(src_path, exist_ok=True)
+            else:
+                self._write(src_path, max(size, 0))
+        elif event_type == "modified":
+            if not is_directory and size >= 0:
+                self._write(src_path, size)
+        elif event_type == "moved":
+            dest_path = self._path(dest)
+            if not os.path.exists(src_path):
+                if is_directory:
+                    os.makedirs(src_path, exist_ok=True)
+                else:
+                    # The recorded size is the moved file's, so a non-empty file is not replayed as an empty one
+                    self._write(src_path, max(size, 0))
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            os.replace(src_path, dest_path)
+        elif event_type == "deleted":
+            if os.path.isdir(src_path):
+                shutil.rmtree(src_path)
+            elif os.path.exists(src_path):
+                os.remove(src_path)
+
+    def _path(self, relative: str) -> str:
+        """Map a trace path into the scratch directory"""
+        path = os.path.normpath(os.path.join(self.scratch_dir, relative))
+        if os.path.commonpath([self.scratch_dir, path]) != self.scratch_dir:
+            raise OSError(f"Trace path escapes the scratch directory: {relative}")
+        return path
+
+    def _write(self, path: str, size: int):
+        """Create or resize a file to the recorded size"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.truncate(size)
+
+def record(directory: str, trace_file: str, recursive: bool = True):
+    """
+    Record events in a directory until interrupted
+
+    Args:
+        directory: Directory to record
+        trace_file: Path of the trace file to write
+        recursive: Whether to record subdirectories
+    """
+    recorder = TraceRecorder(directory, trace_file)
+    observer = Observer()
+    observer.schedule(recorder, directory, recursive=recursive)
+    observer.start()
+    print(f"Recording events in {directory} to {trace_file}, press Ctrl+C to stop")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        recorder.close()
+        print(f"Recorded {recorder.events} events")
+
+def run_replay(trace_file: str, config_path: str, speed: float, scratch_dir: str = None,
+               latency: float = 0.2, delay: float = None) -> Dict[str, Any]:
+    """
+    Replay a trace against a real FileMonitor and a mock generator
+
+    Args:
+        trace_file: Path to the trace file
+        config_path: Configuration file providing extension settings
+        speed: Time scale factor (0 = as fast as possible)
+        scratch_dir: Directory to replay into (a temporary directory if not given)
+        latency: Simulated generation time in seconds
+        delay: Processing delay override in seconds
+
+    Returns:
+        Summary of the replay
+    """
+    from core.monitor import FileMonitor
+    from core.processor import FileProcessor
+
+    cleanup = scratch_dir is None
+    scratch_dir = scratch_dir or tempfile.mkdtemp(prefix="newfiles-replay-")
+    os.makedirs(scratch_dir, exist_ok=True)
+
+    settings = Settings(config_path)
+    settings._settings["monitored_directory"] = scratch_dir
+    settings._settings["monitor_subdirectories"] = True
+    # Mock content must not reach the real history, where replay policies would write it into files
+    settings._settings["history"] = dict(settings.history, enabled=False)
+    if delay is not None:
+        settings._settings["delay"] = delay
+
+    generator = MockGenerator(latency)
+    processor = FileProcessor(settings, generator=generator)
+    monitor = FileMonitor(settings, processor)
+    monitor.start(blocking=False)
+
+    try:
+        replayer = TraceReplayer(trace_file, scratch_dir, speed)
+        started = time.monotonic()
+        replayer.replay()
+        replay_time = time.monotonic() - started
+        _wait_idle(processor, quiet=settings.delay + 1.0)
+        total_time = time.monotonic() - started
+    finally:
+        monitor.stop()
+        processor.shutdown()
+        if cleanup:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    jobs = processor.jobs.list(limit=processor.jobs.max_jobs)
+    latencies = sorted(job.finished_at - job.created_at for job in jobs if job.finished_at)
+    return {
+        "events_replayed": replayer.replayed,
+        "events_skipped": replayer.skipped,
+        "replay_seconds": round(replay_time, 3),
+        "total_seconds": round(total_time, 3),
+        "jobs": len(jobs),
+        "generator_calls": generator.calls,
+        "latency_p50": round(latencies[len(latencies) // 2], 4) if latencies else None,
+        "latency_max": round(latencies[-1], 4) if latencies else None
+    }
+
+def _wait_idle(processor, quiet: float, timeout: float = 600.0):
+    """Wait until the processor has been idle with no new jobs for a quiet period"""
+    deadline = time.monotonic() + timeout
+    last_sequence = processor.jobs.sequence
+    last_change = time.monotonic()
+
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        sequence = processor.jobs.sequence
+        if sequence != last_sequence:
+            last_sequence = sequence
+            last_change = time.monotonic()
+        busy = processor.queue_depth or processor.in_flight
+        if not busy and time.monotonic() - last_change >= quiet:
+            return
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Record and replay filesystem event traces")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Record events of a directory")
+    record_parser.add_argument("directory", help="Directory to record")
+    record_parser.add_argument("trace_file", help="Trace file to write (.gz for compression)")
+    record_parser.add_argument("--no-recursive", action="store_true", help="Do not record subdirectories")
+
+    replay_parser = subparsers.add_parser("replay", help="Replay a trace against a mock generator")
+    replay_parser.add_argument("trace_file", help="Trace file to replay")
+    replay_parser.add_argument("--config", default="config/config.json", help="Path to configuration file")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="Time scale factor (1 = real time, 0 = as fast as possible)")
+    replay_parser.add_argument("--scratch", help="Scratch directory (temporary if not given)")
+    replay_parser.add_argument("--latency", type=float, default=0.2, help="Simulated generation time in seconds")
+    replay_parser.add_argument("--delay", type=float, help="Processing delay override in seconds")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.directory, args.trace_file, recursive=not args.no_recursive)
+    else:
+        summary = run_replay(args.trace_file, args.config, args.speed, args.scratch,
+                             latency=args.latency, delay=args.delay)
+        print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -4,53 +4,73 @@ Newfiles - Automatic content generation for new files
 Monitors a directory and generates content for newly created files using OpenAI
 """
 
-import os
 import sys
+import time
 import argparse
-from dotenv import load_dotenv
+
+# Used to report how long it takes until the watcher is live
+_STARTED = time.perf_counter()
 
 from config.settings import Settings
-from core.monitor import FileMonitor
-from core.processor import FileProcessor
-from utils.logger import default_logger
+from utils.logger import default_logger, configure_logging
 
 def main():
     """Main entry point for the application"""
-    # Load environment variables
-    load_dotenv()
-    
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Newfiles - Automatic content generation for new files")
     parser.add_argument("--config", default="config/config.json", help="Path to configuration file")
     parser.add_argument("--directory", help="Directory to monitor (overrides config)")
+    parser.add_argument("--api", action="store_true", help="Start the local job API server (overrides config)")
+    parser.add_argument("--profile", nargs="?", const="profiles", metavar="DIR",
+                        help="Profile job processing and write reports to DIR (default: profiles)")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Take tracemalloc snapshots around each job (requires --profile)")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="Report per-module import times of the entry points and exit")
     args = parser.parse_args()
     
+    if args.import_profile:
+        from utils.importprof import run, DEFERRED_MODULES
+        run(["main", "windows_service", "newfiles_gui"] + DEFERRED_MODULES)
+        return
+    
+    engine = None
+    
     try:
         # Load settings
         settings = Settings(args.config)
+        configure_logging(settings)
         
-        # Override directory if specified in command line
+        # Override directory if specified in command line (kept across reloads)
+        overrides = {}
         if args.directory:
-            # Update the settings object with the command line directory
-            settings._settings["monitored_directory"] = args.directory
+            overrides["monitored_directory"] = args.directory
         
-        # Validate monitored directory exists
-        if not os.path.exists(settings.monitored_directory):
-            default_logger.error(f"Monitored directory does not exist: {settings.monitored_directory}")
-            sys.exit(1)
+        # Imported here so --help and --import-profile stay fast
+        from core.engine import Engine
+        
+        # Attach the profiler if requested
+        profiler = None
+        if args.profile:
+            from utils.profiler import JobProfiler
+            profiler = JobProfiler(args.profile, memory=args.profile_memory)
         
-        # Create file processor
-        processor = FileProcessor(settings)
+        # Create the engine (loads .env, the OpenAI client is created on first use)
+        engine = Engine(settings, profiler, api=args.api or None, overrides=overrides)
         
-        # Create and start file monitor
-        monitor = FileMonitor(settings, processor)
+        # Start watching; the engine validates that the monitored directory exists
+        try:
+            engine.start()
+        except FileNotFoundError as e:
+            default_logger.error(str(e))
+            sys.exit(1)
+        default_logger.info(f"Watcher live {(time.perf_counter() - _STARTED) * 1000:.0f} ms after launch")
         
         default_logger.info("Newfiles application started")
         print(f"Monitoring directory: {settings.monitored_directory}")
         print("Press Ctrl+C to stop")
         
-        # Start monitoring
-        monitor.start()
+        engine.wait()
         
     except KeyboardInterrupt:
         default_logger.info("Application interrupted by user")
@@ -59,6 +79,10 @@ def main():
         default_logger.error(f"Application error: {str(e)}")
         print(f"Error: {str(e)}")
         sys.exit(1)
+    finally:
+        if engine:
+            for report in engine.stop():
+                print(f"Profile report: {report}")
 
 if __name__ == "__main__":
     main()
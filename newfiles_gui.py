@@ -1,17 +1,21 @@
 import os
 import sys
 import json
-import threading
-import time
+from collections import deque
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import tkinter as tk
 from pathlib import Path
 
-from config.settings import Settings
-from core.processor import FileProcessor
-from core.monitor import FileMonitor
-from utils.logger import default_logger
+from config.settings import Settings, DEFAULT_TEXT_MODEL
+from utils.events import default_bus
+
+# Maximum number of lines kept in the logs text widget
+MAX_LOG_LINES = 2000
+# Interval between batched log widget updates in milliseconds
+LOG_TICK_MS = 200
+# Interval between live statistics refreshes in milliseconds
+STATS_TICK_MS = 1000
 
 class NewfilesGUI:
     def __init__(self):
@@ -31,9 +35,8 @@ class NewfilesGUI:
         except:
             pass
         
-        # Initialize variables
-        self.monitor = None
-        self.monitor_thread = None
+        # Initialize variables (the engine is created on the first Start and kept until exit)
+        self.engine = None
         self.is_monitoring = False
         self.config_path = "config/config.json"
         
@@ -286,6 +289,23 @@ class NewfilesGUI:
         self.sub_info_var = tk.StringVar()
         sub_info_value = ctk.CTkLabel(dir_info_frame, textvariable=self.sub_info_var, font=ctk.CTkFont(size=12))
         sub_info_value.pack(anchor="w", padx=10, pady=(0, 10))
+        
+        # Live statistics
+        stats_frame = ctk.CTkFrame(monitoring_frame)
+        stats_frame.pack(fill="both", expand=True, padx=20, pady=20)
+        
+        stats_label = ctk.CTkLabel(stats_frame, text="Live Statistics:", font=ctk.CTkFont(size=14, weight="bold"))
+        stats_label.pack(anchor="w", padx=10, pady=10)
+        
+        self.stats_var = tk.StringVar(value="No data")
+        stats_value = ctk.CTkLabel(stats_frame, textvariable=self.stats_var, font=("Consolas", 12), justify="left")
+        stats_value.pack(anchor="w", padx=10, pady=(0, 5))
+        
+        self.latency_var = tk.StringVar()
+        latency_value = ctk.CTkLabel(stats_frame, textvariable=self.latency_var, font=("Consolas", 11), justify="left")
+        latency_value.pack(anchor="w", padx=10, pady=(0, 10))
+        
+        self.root.after(STATS_TICK_MS, self._refresh_stats)
     
     def create_logs_widgets(self):
         # Main frame for logs
@@ -347,7 +367,7 @@ class NewfilesGUI:
         # Load extension settings
         extension_settings = self.config_data.get("extension_settings", {})
         for extension, settings in extension_settings.items():
-            model = settings.get("model", "gpt-4.1-nano")
+            model = settings.get("model", DEFAULT_TEXT_MODEL)
             prompt_file = settings.get("prompt_file", "prompts/default_text.md")
             self.models_tree.insert("", tk.END, values=(extension, model, prompt_file))
     
@@ -434,16 +454,15 @@ class NewfilesGUI:
             if not self.save_config():
                 return
             
-            # Create new settings object
-            settings = Settings(self.config_path)
-            
-            # Create processor and monitor
-            processor = FileProcessor(settings)
-            self.monitor = FileMonitor(settings, processor)
-            
-            # Start monitoring in a separate thread
-            self.monitor_thread = threading.Thread(target=self._run_monitor, daemon=True)
-            self.monitor_thread.start()
+            # Reuse the engine so the client, caches and pools survive Stop/Start
+            if self.engine is None:
+                # Deferred so the window opens without loading watchdog and openai
+                from core.engine import Engine
+                self.engine = Engine(Settings(self.config_path))
+            else:
+                self.engine.reconfigure()
+            self.engine.start()
+            settings = self.engine.settings
             
             # Update UI
             self.is_monitoring = True
@@ -462,38 +481,11 @@ class NewfilesGUI:
             self.log_text.insert(tk.END, f"Error starting monitoring: {str(e)}\n")
             self.log_text.see(tk.END)
     
-    def _run_monitor(self):
-        """Run the monitor in a separate thread"""
-        try:
-            # Create event handler
-            from core.monitor import NewFileHandler
-            event_handler = NewFileHandler(self.monitor.settings, self.monitor.processor)
-            
-            # Schedule the observer
-            self.monitor.observer.schedule(
-                event_handler, 
-                self.monitor.settings.monitored_directory, 
-                recursive=self.monitor.settings.monitor_subdirectories
-            )
-            
-            # Start the observer
-            self.monitor.observer.start()
-            default_logger.info(f"Started monitoring directory: {self.monitor.settings.monitored_directory}")
-            
-            try:
-                while self.is_monitoring:
-                    time.sleep(1)
-            except KeyboardInterrupt:
-                self.monitor.stop()
-        except Exception as e:
-            default_logger.error(f"Error in monitor thread: {str(e)}")
-            self.log_text.insert(tk.END, f"Error in monitor thread: {str(e)}\n")
-            self.log_text.see(tk.END)
-    
     def stop_monitoring(self):
         try:
-            if self.monitor:
-                self.monitor.stop()
+            # Pausing only drops the watch; queued jobs still finish
+            if self.engine:
+                self.engine.pause()
             
             self.is_monitoring = False
             self.start_button.configure(state="normal")
@@ -509,38 +501,76 @@ class NewfilesGUI:
             self.log_text.insert(tk.END, f"Error stopping monitoring: {str(e)}\n")
             self.log_text.see(tk.END)
     
+    def _refresh_stats(self):
+        """Update the live statistics panel from the processor counters"""
+        if self.is_monitoring and self.engine:
+            stats = self.engine.stats()
+            hit_rate = stats["cache_hit_rate"]
+            pool_lines = "".join(
+                f"\nPool {name:<7} Workers: {pool['workers']:<4} Queue: {pool['queue_depth']:<6} "
+                f"In flight: {pool['in_flight']}"
+                for name, pool in stats["pools"].items()
+            )
+            self.stats_var.set(
+                f"Queue depth: {stats['queue_depth']:<6} In flight: {stats['in_flight']:<6} Parked: {stats['parked']}\n"
+                f"Jobs/min:    {stats['jobs_per_minute']:<6.1f} Completed: {stats['completed']:<6} Failed: {stats['failed']:<6} "
+                f"Cancelled: {stats['cancelled']}\n"
+                f"Cache hits:  {'n/a' if hit_rate is None else f'{hit_rate:.0%}':<6} Tokens: {stats['total_tokens']} "
+                f"(cached prompt tokens: {stats['cached_tokens']})" + pool_lines
+            )
+            
+            latency_lines = [f"{'Model / extension':<32} {'n':>6} {'p50':>8} {'p95':>8}"]
+            for key, values in stats["latency"].items():
+                latency_lines.append(f"{key:<32} {values['count']:>6} {values['p50']:>7.2f}s {values['p95']:>7.2f}s")
+            self.latency_var.set("\n".join(latency_lines) if len(latency_lines) > 1 else "")
+        
+        self.root.after(STATS_TICK_MS, self._refresh_stats)
+    
     def start_log_monitoring(self):
-        """Start monitoring log file for updates"""
-        self.log_monitor_thread = threading.Thread(target=self._monitor_logs, daemon=True)
-        self.log_monitor_thread.start()
-    
-    def _monitor_logs(self):
-        """Monitor log file for new entries"""
-        log_file = "logs/newfiles.log"
-        if not os.path.exists(log_file):
-            return
+        """Subscribe to log events and start the batched UI update tick"""
+        self._pending_logs = deque(maxlen=MAX_LOG_LINES)
+        self._dropped_logs = 0
+        self._log_subscription = default_bus.subscribe(self._on_log_event, topic="log")
+        self.root.after(LOG_TICK_MS, self._flush_logs)
+    
+    def _on_log_event(self, topic, payload):
+        """Buffer a log event (called from worker threads)"""
+        if len(self._pending_logs) == self._pending_logs.maxlen:
+            self._dropped_logs += 1
+        self._pending_logs.append(payload["line"])
+    
+    def _flush_logs(self):
+        """Insert buffered log lines in one batch and trim the widget"""
+        lines = []
+        while self._pending_logs:
+            lines.append(self._pending_logs.popleft())
+        
+        if self._dropped_logs:
+            lines.insert(0, f"... {self._dropped_logs} log lines skipped ...")
+            self._dropped_logs = 0
+        
+        if lines:
+            self.add_log_lines(lines)
+        
+        self.root.after(LOG_TICK_MS, self._flush_logs)
+    
+    def add_log_lines(self, lines):
+        """Add log lines to the text widget, keeping at most MAX_LOG_LINES"""
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        
+        line_count = int(self.log_text.index("end-1c").split(".")[0])
+        if line_count > MAX_LOG_LINES:
+            self.log_text.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
         
-        with open(log_file, 'r') as f:
-            f.seek(0, 2)  # Go to end of file
-            while True:
-                line = f.readline()
-                if line:
-                    self.root.after(0, self.add_log_line, line.strip())
-                else:
-                    time.sleep(0.5)
-    
-    def add_log_line(self, line):
-        """Add a log line to the text widget"""
-        self.log_text.insert(tk.END, line + "\n")
         self.log_text.see(tk.END)
     
     def refresh_logs(self):
         """Refresh logs from file"""
         self.log_text.delete(1.0, tk.END)
         try:
-            with open("logs/newfiles.log", 'r') as f:
-                content = f.read()
-                self.log_text.insert(tk.END, content)
+            with open("logs/newfiles.log", 'r', encoding='utf-8', errors='replace') as f:
+                lines = deque(f, maxlen=MAX_LOG_LINES)
+            self.log_text.insert(tk.END, "".join(lines))
             self.log_text.see(tk.END)
         except:
             self.log_text.insert(tk.END, "No logs found\n")
@@ -559,9 +589,17 @@ class NewfilesGUI:
         if self.is_monitoring:
             if messagebox.askyesno("Confirm", "Monitoring is active. Do you want to stop monitoring and exit?"):
                 self.stop_monitoring()
-                self.root.destroy()
+                self._close()
         else:
-            self.root.destroy()
+            self._close()
+    
+    def _close(self):
+        """Release the engine and close the window"""
+        default_bus.unsubscribe(self._log_subscription)
+        if self.engine:
+            # Queued jobs are not waited for, so the window closes immediately
+            self.engine.stop(wait=False)
+        self.root.destroy()
     
     def run(self):
         """Run the application"""
@@ -668,14 +706,14 @@ def main():
     os.makedirs("prompts", exist_ok=True)
     
     # Create default prompt files if they don't exist
-    default_text_prompt = """# Default Text Prompt
-
-Generate helpful content for this file based on its name and extension.
+    # Instructions and references come first and the filename last, so requests
+    # for the same folder share a long common prefix the provider can cache
+    default_text_prompt = """Generate ONLY the content that should be written in a new file, based on its name. Do not include any explanations, comments, or extra text. Only output the actual content that should go in the file.
 
-File: {filename}
-Extension: {extension}
+This is the content of other files of the same extension in the same folder:
+{reference_files}
 
-Please provide relevant content that would be useful for this type of file."""
+The new file is called {filename}."""
     
     default_image_prompt = """# Default Image Prompt
 
@@ -0,0 +1,66 @@
+import itertools
+import threading
+from typing import Any, Callable, Dict
+
+class EventBus:
+    """
+    In-process publish/subscribe bus for job and log events
+
+    Subscribers are called synchronously in the publishing thread, so they must
+    be cheap (typically appending to a queue or ring buffer).
+    """
+
+    def __init__(self):
+        """Initialize an empty bus"""
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[str, Dict[str, Any]], None], topic: str = None) -> int:
+        """
+        Subscribe to events
+
+        Args:
+            callback: Function called with (topic, payload) for each event
+            topic: Only receive events of this topic (all topics if None)
+
+        Returns:
+            Subscription id for unsubscribe
+        """
+        with self._lock:
+            subscription = next(self._ids)
+            subscribers = dict(self._subscribers)
+            subscribers[subscription] = (topic, callback)
+            self._subscribers = subscribers
+        return subscription
+
+    def unsubscribe(self, subscription: int):
+        """Remove a subscription"""
+        with self._lock:
+            subscribers = dict(self._subscribers)
+            subscribers.pop(subscription, None)
+            self._subscribers = subscribers
+
+    def has_subscribers(self, topic: str) -> bool:
+        """Check if anyone listens to a topic"""
+        return any(t is None or t == topic for t, _ in self._subscribers.values())
+
+    def publish(self, topic: str, payload: Dict[str, Any]):
+        """
+        Deliver an event to the subscribers of its topic
+
+        Args:
+            topic: Event topic ("job", "log", ...)
+            payload: Event data
+        """
+        # The subscriber dict is replaced on change, so it can be read without the lock
+        for subscribed_topic, callback in self._subscribers.values():
+            if subscribed_topic is None or subscribed_topic == topic:
+                try:
+                    callback(topic, payload)
+                except Exception:
+                    # A broken subscriber must not break the publisher
+                    pass
+
+# Bus shared by the core and the front ends
+default_bus = EventBus()
@@ -12,7 +12,8 @@ def get_reference_files(directory: str, extension: str, exclude_file: str) -> Li
         exclude_file: Filename to exclude from results
         
     Returns:
-        List of dictionaries containing filename and content of reference files
+        List of dictionaries containing filename and content of reference files,
+        sorted by filename so prompts for the same folder share a common prefix
     """
     reference_files = []
     
@@ -21,7 +22,7 @@ def get_reference_files(directory: str, extension: str, exclude_file: str) -> Li
         extension = '.' + extension
     
     # Search for files with the same extension
-    for filename in os.listdir(directory):
+    for filename in sorted(os.listdir(directory)):
         if filename.endswith(extension) and filename != exclude_file:
             file_path = os.path.join(directory, filename)
             try:
@@ -0,0 +1,95 @@
+"""
+Import time benchmark for the Newfiles entry points
+
+    python -m utils.importprof [module ...]
+
+Each module is imported in a fresh interpreter with ``-X importtime`` and the
+slowest imports are reported, so deferred dependencies can be verified.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, Any, List
+
+# Heavy dependencies that should only be imported on first use
+DEFERRED_MODULES = ["openai", "watchdog.observers", "customtkinter", "dotenv"]
+
+def profile_import(module: str) -> Dict[str, Any]:
+    """
+    Import a module in a fresh interpreter and collect per-module import times
+
+    Args:
+        module: Name of the module to import
+
+    Returns:
+        Dictionary with the total time and the imported modules (times in milliseconds)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # Also list which deferred modules ended up loaded; -X importtime reports failed imports too
+    probe = (f"import sys, json\ntry:\n    import {module}\nfinally:\n"
+             f"    print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules]))")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=root, capture_output=True, text=True
+    )
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append({
+            "module": name.strip(),
+            # Nested imports are indented by two spaces per level
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000.0,
+            "cumulative_ms": int(cumulative_us) / 1000.0
+        })
+
+    top_level = [m for m in modules if m["depth"] == 0]
+    try:
+        loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        loaded = []
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+        "total_ms": sum(m["cumulative_ms"] for m in top_level),
+        "modules": modules,
+        "deferred_loaded": loaded
+    }
+
+def format_report(profiles: List[Dict[str, Any]], top: int = 15) -> str:
+    """
+    Format import profiles as a text report
+
+    Args:
+        profiles: Results of profile_import
+        top: Number of slowest modules listed per profile
+
+    Returns:
+        The report
+    """
+    lines = []
+    for profile in profiles:
+        lines.append(f"import {profile['module']}: {profile['total_ms']:.1f} ms")
+        if not profile["ok"]:
+            lines.append(f"  failed: {profile['error']}")
+        if profile["deferred_loaded"]:
+            lines.append(f"  eagerly loaded: {', '.join(profile['deferred_loaded'])}")
+        slowest = sorted(profile["modules"], key=lambda m: m["cumulative_ms"], reverse=True)[:top]
+        for entry in slowest:
+            lines.append(f"  {entry['cumulative_ms']:9.1f} ms cumulative {entry['self_ms']:8.1f} ms self  "
+                         f"{entry['module']}")
+        lines.append("")
+    return "\n".join(lines)
+
+def run(modules: List[str]):
+    """Profile the given modules and print the report"""
+    print(format_report([profile_import(module) for module in modules]))
+
+if __name__ == "__main__":
+    run(sys.argv[1:] or ["main", "windows_service", "newfiles_gui"] + DEFERRED_MODULES)
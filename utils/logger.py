@@ -1,25 +1,234 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
-def setup_logger(name, log_file, level=logging.INFO):
-    """Function to setup as many loggers as you want"""
-    
+from utils.events import default_bus
+
+# Thread-local context holding the id of the job being processed
+_context = threading.local()
+
+@contextmanager
+def job_log_context(job_id: str):
+    """Attach a job id to every log record emitted by the current thread"""
+    previous = getattr(_context, "job_id", None)
+    _context.job_id = job_id
+    try:
+        yield
+    finally:
+        _context.job_id = previous
+
+class _JobContextFilter(logging.Filter):
+    """Adds the current job id to log records"""
+
+    def filter(self, record):
+        """Set the job_id attribute of a record"""
+        record.job_id = getattr(_context, "job_id", None)
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as JSON lines"""
+
+    def format(self, record):
+        """Format a record as a single JSON object"""
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            entry["job_id"] = job_id
+        return json.dumps(entry)
+
+class _BusHandler(logging.Handler):
+    """Publishes log records on the in-process event bus"""
+
+    def emit(self, record):
+        """Publish a record if anyone is listening"""
+        if not default_bus.has_subscribers("log"):
+            return
+        try:
+            default_bus.publish("log", {
+                "time": record.created,
+                "level": record.levelname,
+                "message": record.getMessage(),
+                "job_id": getattr(record, "job_id", None),
+                "line": self.format(record)
+            })
+        except Exception:
+            self.handleError(record)
+
+class _BatchFlushMixin:
+    """Defers stream flushes so the writer thread can flush once per batch"""
+
+    def flush(self):
+        """Ignore per-record flushes"""
+        pass
+
+    def flush_batch(self):
+        """Flush the stream after a batch of records"""
+        super().flush()
+
+class _BatchRotatingFileHandler(_BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    """Size-rotated log file flushed once per batch"""
+
+class _BatchTimedRotatingFileHandler(_BatchFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    """Time-rotated log file flushed once per batch"""
+
+class _BatchWriter:
+    """Background thread writing queued log records in batches"""
+
+    _STOP = object()
+
+    def __init__(self, record_queue: queue.Queue, handler: logging.Handler,
+                 batch_size: int = 256, flush_interval: float = 0.5):
+        """
+        Initialize the writer
+
+        Args:
+            record_queue: Queue filled by the QueueHandler
+            handler: File handler writing the records
+            batch_size: Maximum number of records written per flush
+            flush_interval: Maximum time to wait for new records in seconds
+        """
+        self.queue = record_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = threading.Thread(target=self._run, name="newfiles-log-writer", daemon=True)
+
+    def start(self):
+        """Start the writer thread"""
+        self._thread.start()
+
+    def stop(self):
+        """Write the remaining records and stop the thread"""
+        if self._thread.is_alive():
+            self.queue.put(self._STOP)
+            self._thread.join()
+        self.handler.close()
+
+    def _run(self):
+        """Writer thread loop"""
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            # Drain whatever else is already queued
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for record in batch:
+                if record is self._STOP:
+                    running = False
+                    continue
+                try:
+                    self.handler.handle(record)
+                except Exception:
+                    self.handler.handleError(record)
+            self.handler.flush_batch()
+
+def _create_file_handler(log_file, max_bytes, backup_count, rotate_when, json_format):
+    """Create the rotating file handler used by the writer thread"""
+    if rotate_when:
+        handler = _BatchTimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count,
+                                                 encoding="utf-8")
+    else:
+        handler = _BatchRotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                            encoding="utf-8")
+
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    return handler
+
+def setup_logger(name, log_file, level=logging.INFO, max_bytes=5 * 1024 * 1024, backup_count=5,
+                 rotate_when=None, json_format=False):
+    """
+    Function to setup as many loggers as you want
+
+    Records are handed to a queue and written by a single background thread that
+    flushes once per batch, so logging calls never wait on disk writes.
+
+    Args:
+        name: Logger name
+        log_file: Path to the log file
+        level: Logging level
+        max_bytes: Rotate the file once it reaches this size
+        backup_count: Number of rotated files to keep
+        rotate_when: Rotate by time instead of size (e.g. "midnight", "H")
+        json_format: Write JSON lines including job ids instead of plain text
+    """
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+
+    # Replace handlers installed by a previous call (e.g. on re-import)
+    for existing in list(logger.handlers):
+        if hasattr(existing, "_newfiles_writer"):
+            logger.removeHandler(existing)
+            if existing._newfiles_writer is not None:
+                existing._newfiles_writer.stop()
+
     # Create logs directory if it doesn't exist
     log_dir = os.path.dirname(log_file)
     if log_dir and not os.path.exists(log_dir):
         os.makedirs(log_dir)
-    
-    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-    
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
-    
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
+
+    file_handler = _create_file_handler(log_file, max_bytes, backup_count, rotate_when, json_format)
+
+    record_queue = queue.Queue()
+    writer = _BatchWriter(record_queue, file_handler)
+    writer.start()
+    atexit.register(writer.stop)
+
+    handler = logging.handlers.QueueHandler(record_queue)
+    handler.addFilter(_JobContextFilter())
+    handler._newfiles_writer = writer
     logger.addHandler(handler)
-    
+
+    # Live feed for in-process subscribers such as the GUI
+    bus_handler = _BusHandler()
+    bus_handler.addFilter(_JobContextFilter())
+    bus_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    bus_handler._newfiles_writer = None
+    logger.addHandler(bus_handler)
+
     return logger
 
+def configure_logging(settings):
+    """
+    Reconfigure the default logger from the logging settings
+
+    Args:
+        settings: Application settings
+    """
+    config = settings.logging
+    setup_logger(
+        'newfiles',
+        config["file"],
+        level=getattr(logging, str(config["level"]).upper(), logging.INFO),
+        max_bytes=config["max_bytes"],
+        backup_count=config["backup_count"],
+        rotate_when=config["rotate_when"],
+        json_format=config["json"]
+    )
+
 # Create a default logger for the application
-default_logger = setup_logger('newfiles', 'logs/newfiles.log')
+default_logger = logging.getLogger('newfiles')
+if not any(hasattr(h, "_newfiles_writer") for h in default_logger.handlers):
+    default_logger = setup_logger('newfiles', 'logs/newfiles.log')
@@ -0,0 +1,196 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, List
+
+from utils.logger import default_logger
+
+class JobProfiler:
+    """
+    Sampling profiler for threads that are processing jobs
+
+    While a job runs, the thread processing it is sampled at a fixed interval and
+    its stack is recorded together with the job's current stage. Optionally, a
+    tracemalloc snapshot is taken around every job to report the largest allocations.
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval: float = 0.005,
+                 memory: bool = False, top_jobs: int = 10):
+        """
+        Initialize the profiler
+
+        Args:
+            output_dir: Directory where the reports are written
+            interval: Sampling interval in seconds
+            memory: Whether to take tracemalloc snapshots around each job
+            top_jobs: Number of slowest jobs to include in the report
+        """
+        self.output_dir = output_dir
+        self.interval = interval
+        self.memory = memory
+        self.top_jobs = top_jobs
+        self.samples = 0
+        self._stacks = Counter()
+        self._self_counts = Counter()
+        self._active = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the sampling thread"""
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="newfiles-profiler", daemon=True)
+        self._thread.start()
+        default_logger.info(f"Profiler started (interval {self.interval * 1000:.1f} ms, memory {self.memory})")
+
+    def stop(self) -> List[str]:
+        """
+        Stop sampling and write the reports
+
+        Returns:
+            Paths of the written report files
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.write_reports()
+
+    def job_started(self, job: Any):
+        """Register the current thread as processing a job"""
+        snapshot = self._snapshot() if self.memory and tracemalloc.is_tracing() else None
+        with self._lock:
+            self._active[threading.get_ident()] = {
+                "job": job,
+                "started": time.perf_counter(),
+                "snapshot": snapshot,
+                "samples": 0
+            }
+
+    def job_finished(self, job: Any):
+        """Unregister the current thread and keep the job's profile"""
+        with self._lock:
+            record = self._active.pop(threading.get_ident(), None)
+        if record is None:
+            return
+
+        allocations = []
+        if record["snapshot"] is not None and tracemalloc.is_tracing():
+            diff = self._snapshot().compare_to(record["snapshot"], "lineno")
+            allocations = [str(stat) for stat in diff[:5] if stat.size_diff > 0]
+
+        with self._lock:
+            self._finished.append({
+                "path": job.file_path,
+                "status": job.status,
+                "duration": time.perf_counter() - record["started"],
+                "stages": dict(job.stages),
+                "samples": record["samples"],
+                "allocations": allocations
+            })
+
+    def _snapshot(self):
+        """Take a tracemalloc snapshot without the profiler's own allocations"""
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)
+        ])
+
+    def _sample_loop(self):
+        """Sample the stacks of the threads processing jobs"""
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, record in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = self._stack(frame)
+                    stage = record["job"].current_stage or "other"
+                    self._stacks[";".join([stage] + stack)] += 1
+                    self._self_counts[stack[-1]] += 1
+                    record["samples"] += 1
+                    self.samples += 1
+
+    def _stack(self, frame) -> List[str]:
+        """Get a stack as a list of frame labels, outermost first"""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def write_reports(self) -> List[str]:
+        """
+        Write the collapsed-stack file and the text report
+
+        Returns:
+            Paths of the written report files
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"newfiles-{time.strftime('%Y%m%d-%H%M%S')}")
+
+        with self._lock:
+            stacks = dict(self._stacks)
+            self_counts = self._self_counts.most_common(25)
+            finished = list(self._finished)
+
+        # Collapsed stacks for flamegraph.pl / speedscope
+        collapsed_path = prefix + ".collapsed"
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        report_path = prefix + ".txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(self._format_report(self_counts, finished))
+
+        default_logger.info(f"Profile written to {report_path} and {collapsed_path}")
+        return [report_path, collapsed_path]
+
+    def _format_report(self, self_counts: List[Any], finished: List[Dict[str, Any]]) -> str:
+        """Format the aggregated text report"""
+        lines = [
+            "Newfiles profile",
+            f"Jobs profiled: {len(finished)}",
+            f"Samples: {self.samples} (interval {self.interval * 1000:.1f} ms)",
+            ""
+        ]
+
+        # Wall time per stage across all jobs
+        stage_totals = Counter()
+        for job in finished:
+            for stage, duration in job["stages"].items():
+                stage_totals[stage] += duration
+        lines.append("Time per stage:")
+        for stage, duration in stage_totals.most_common():
+            lines.append(f"  {stage:<12} {duration:10.3f} s")
+        lines.append("")
+
+        lines.append("Top functions by self samples:")
+        for label, count in self_counts:
+            share = 100.0 * count / self.samples if self.samples else 0.0
+            lines.append(f"  {count:8d} {share:5.1f}%  {label}")
+        lines.append("")
+
+        lines.append(f"Slowest {self.top_jobs} jobs:")
+        for job in sorted(finished, key=lambda j: j["duration"], reverse=True)[:self.top_jobs]:
+            stages = ", ".join(f"{name} {duration:.3f}s" for name, duration in job["stages"].items())
+            lines.append(f"  {job['duration']:8.3f} s  {job['status']:<9} {job['path']}")
+            lines.append(f"             stages: {stages or 'n/a'}")
+            for allocation in job["allocations"]:
+                lines.append(f"             alloc: {allocation}")
+        lines.append("")
+
+        return "\n".join(lines)
@@ -1,86 +1,60 @@
 import os
 import sys
-import time
-import logging
-import json
-from pathlib import Path
-import threading
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import argparse
 
 # Add the current directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config.settings import Settings
-from core.processor import FileProcessor
-from utils.logger import default_logger
-
-class NewfilesHandler(FileSystemEventHandler):
-    """Handles file creation events"""
-    
-    def __init__(self, settings: Settings, processor: FileProcessor):
-        """Initialize with settings and processor"""
-        self.settings = settings
-        self.processor = processor
-    
-    def on_created(self, event):
-        """Handle file creation events"""
-        if not event.is_directory:
-            try:
-                # Apply delay before processing
-                time.sleep(self.settings.delay)
-                
-                # Process the new file
-                self.processor.process_new_file(event.src_path)
-            except Exception as e:
-                default_logger.error(f"Error processing file {event.src_path}: {str(e)}")
+from utils.logger import default_logger, configure_logging
 
 class NewfilesService:
     """Windows service for Newfiles application"""
     
-    def __init__(self):
-        self.observer = Observer()
+    def __init__(self, profiler=None):
         self.settings = Settings("config/config.json")
-        self.processor = FileProcessor(self.settings)
-        self.is_running = False
-        self.thread = None
+        configure_logging(self.settings)
+        # Imported here so --help and --import-profile stay fast
+        from core.engine import Engine
+        # Same engine (and so the same filtering and fast path) as the CLI and GUI
+        self.engine = Engine(self.settings, profiler)
+        self.processor = self.engine.processor
+        self.profiler = profiler
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether the service is watching the monitored directory"""
+        return self.engine.state == self.engine.RUNNING
     
     def start(self):
         """Start the file monitoring service"""
         try:
-            # Create event handler
-            event_handler = NewfilesHandler(self.settings, self.processor)
-            
-            # Schedule the observer
-            self.observer.schedule(
-                event_handler, 
-                self.settings.monitored_directory, 
-                recursive=self.settings.monitor_subdirectories
-            )
-            
-            # Start the observer
-            self.observer.start()
-            self.is_running = True
-            
+            self.engine.start()
             default_logger.info(f"Newfiles service started, monitoring: {self.settings.monitored_directory}")
             
             # Keep the service running
-            while self.is_running:
-                time.sleep(1)
+            self.engine.wait()
                 
         except Exception as e:
             default_logger.error(f"Error starting service: {str(e)}")
             raise
     
+    def pause(self):
+        """Stop picking up new files until resumed"""
+        self.engine.pause()
+    
+    def resume(self):
+        """Pick up new files again"""
+        self.engine.resume()
+    
+    def reload(self):
+        """Apply changes made to the configuration file"""
+        self.engine.reconfigure()
+    
     def stop(self):
         """Stop the file monitoring service"""
         try:
-            self.is_running = False
-            
-            # Stop the observer
-            self.observer.stop()
-            self.observer.join()
-            
+            self.engine.stop()
             default_logger.info("Newfiles service stopped")
         except Exception as e:
             default_logger.error(f"Error stopping service: {str(e)}")
@@ -88,11 +62,33 @@ class NewfilesService:
 
 def main():
     """Main entry point for the service"""
+    parser = argparse.ArgumentParser(description="Newfiles background service")
+    parser.add_argument("--profile", nargs="?", const="profiles", metavar="DIR",
+                        help="Profile job processing and write reports to DIR (default: profiles)")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Take tracemalloc snapshots around each job (requires --profile)")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="Report per-module import times of the service and exit")
+    args = parser.parse_args()
+    
+    if args.import_profile:
+        from utils.importprof import run, DEFERRED_MODULES
+        run(["windows_service"] + DEFERRED_MODULES)
+        return
+    
+    profiler = None
+    if args.profile:
+        from utils.profiler import JobProfiler
+        profiler = JobProfiler(args.profile, memory=args.profile_memory)
+    service = None
+    
     try:
-        service = NewfilesService()
+        service = NewfilesService(profiler)
         service.start()
     except KeyboardInterrupt:
         print("Service interrupted by user")
+        if service:
+            service.stop()
     except Exception as e:
         print(f"Service error: {str(e)}")
         default_logger.error(f"Service error: {str(e)}")